@@ -0,0 +1,191 @@
+# Rushy Panchal
+# wire/advisor.py
+# The IndexAdvisor class recommends indexes for the filters used by a Database
+
+import sys
+import math
+import re
+import threading
+
+from sqlstring import SQLString, ALL, SET_TYPES
+from instrument import Instrumentation
+
+WHERE_COLUMN = re.compile(r"`?(\w+)`?\s*(=|==|<=|>=|<>|!=|<|>|\bIN\b|\bBETWEEN\b|\bIS\b|\bLIKE\b)", re.IGNORECASE)
+EQUALITY_OPERATORS = ("=", "==", "IN", "IS")
+
+class IndexAdvisor(object):
+	'''Observes the filters of Database.select, update and delete, and recommends indexes for those that scan a whole table (see Database.enableIndexAdvisor)'''
+	def __init__(self, db):
+		'''Creates the IndexAdvisor object
+
+		Arguments:
+			db - Database object
+
+		Usage:
+			advisor = IndexAdvisor(db)
+
+		returns the IndexAdvisor object'''
+		self.db = db
+		self.shapes, self.normalized = {}, {}
+		self.lock = threading.Lock() # the connections of a pool share one advisor
+
+	def observe(self, table, options):
+		'''Internal function --- records a filtered statement
+
+		Arguments:
+			table - table name
+			options - columns, equal, like, where, parameters and order_by of the statement (see Database.select)
+
+		Usage:
+			advisor.observe("users", {"equal": {"id": 1}})
+
+		Statements are grouped by their normalized query (see SQLString.normalize), and their values are not kept:
+		each value is replaced by None, which is enough for EXPLAIN QUERY PLAN
+
+		returns None'''
+		equal, like = options.get("equal") or {}, options.get("like") or {}
+		options = {"columns": options.get("columns"), "where": options.get("where", "1 = 1"), "order_by": options.get("order_by"),
+			"equal": dict((name, [None, None] if isinstance(value, SET_TYPES) else None) for name, value in equal.items()),
+			"like": dict.fromkeys(like), "parameters": (None,) * len(options.get("parameters") or ())}
+		query = self.statement(table, options)[0]
+		with self.lock:
+			normalized = self.normalized.get(query)
+			if normalized is None:
+				if len(self.normalized) >= 10000:
+					self.normalized.clear()
+				normalized = self.normalized[query] = SQLString.normalize(query)
+			shape = self.shapes.get((table, normalized))
+			if shape is None:
+				shape = self.shapes[(table, normalized)] = {"table": table, "calls": 0}
+			shape["calls"] += 1
+			shape["options"] = options
+
+	@staticmethod
+	def statement(table, options):
+		'''Internal function --- generates the SELECT query of an observed statement
+
+		Arguments:
+			table - table name
+			options - see IndexAdvisor.observe
+
+		Usage:
+			query, values = IndexAdvisor.statement("users", {"equal": {"id": None}})
+
+		returns the query and its values'''
+		return SQLString.select(table, columns = options.get("columns"), equal = options.get("equal"), like = options.get("like"),
+			where = options.get("where", "1 = 1"), parameters = options.get("parameters"), order_by = options.get("order_by"))
+
+	def indexColumns(self, table, options):
+		'''Internal function --- chooses the columns of an index for a statement
+
+		The equality filters come first, then at most one range filter (or the ORDER BY columns), then the selected columns so the
+		index covers the query
+
+		Arguments:
+			table - table name
+			options - see IndexAdvisor.observe
+
+		Usage:
+			columns = advisor.indexColumns("users", {"equal": {"tier": 2}, "where": "`age` > 30"})
+
+		returns a list of column names'''
+		table_columns = set(self.db.table(table, False).columns())
+		equality, ranges = sorted(options.get("equal") or ()), sorted(options.get("like") or ())
+		for name, operator in WHERE_COLUMN.findall(options.get("where") or ""):
+			if name in table_columns:
+				(equality if operator.upper() in EQUALITY_OPERATORS else ranges).append(name)
+		order_by = [column.lstrip("-") for column in SQLString.names(options.get("order_by"))]
+		columns = []
+		for name in equality + (ranges[:1] or order_by):
+			if name not in columns:
+				columns.append(name)
+		selected = options.get("columns")
+		if columns and selected and selected != ALL:
+			columns.extend(name for name in selected if name not in columns and name in table_columns)
+		return columns
+
+	def tableRows(self, table):
+		'''Internal function --- estimates the number of rows in a table
+
+		Arguments:
+			table - table name
+
+		Usage:
+			rows = advisor.tableRows("users")
+
+		returns the number of rows (from sqlite_stat1 when the table was analyzed)'''
+		try:
+			row = self.db.cursor().execute("SELECT stat FROM sqlite_stat1 WHERE tbl = ? AND idx IS NULL", (table,)).fetchone()
+			if row:
+				return int(row[0].split()[0])
+		except Exception:
+			pass
+		return self.db.cursor().execute("SELECT COUNT(*) FROM {table}".format(table = table)).fetchone()[0]
+
+	def recommend(self, create = False, min_calls = 1):
+		'''Recommends indexes for the observed statements that scan a whole table
+
+		Each statement is run through EXPLAIN QUERY PLAN. The estimated benefit is the number of rows the observed calls
+		would not have scanned with the index (calls * (rows - log2(rows))). Python 2 commits the open transaction before an
+		EXPLAIN, so there are no recommendations while the commit policy is deferring statements
+
+		Arguments:
+			create - whether or not to create the recommended indexes (defaults to False)
+			min_calls - minimum number of observed calls for a statement to be considered (defaults to 1)
+
+		Usage:
+			for index in db.index_advisor.recommend():
+				print(index["sql"], index["estimated_rows_saved"])
+
+		returns a list of dictionaries of the table, columns, name, sql, calls, table_rows, estimated_rows_saved and the plans
+		of the statements, sorted by estimated benefit'''
+		recommendations, rows = {}, {}
+		if sys.version_info[0] < 3 and (self.db.pending or self.db.batch_depth):
+			return []
+		with self.lock:
+			shapes = [dict(shape) for shape in self.shapes.values()]
+		for shape in shapes:
+			if shape["calls"] < min_calls:
+				continue
+			table, options = shape["table"], shape["options"]
+			query, values = self.statement(table, options)
+			try:
+				plan = [row[-1] for row in self.db.cursor().execute("EXPLAIN QUERY PLAN " + query, values).fetchall()]
+			except Exception:
+				continue
+			if not any(Instrumentation.isFullScan(detail) for detail in plan):
+				continue
+			index_columns = self.indexColumns(table, options)
+			if not index_columns:
+				continue
+			if table not in rows:
+				rows[table] = self.tableRows(table)
+			key = (table, tuple(index_columns))
+			recommendation = recommendations.get(key)
+			if recommendation is None:
+				name = SQLString.indexName(table, index_columns)
+				recommendation = recommendations[key] = {"table": table, "columns": index_columns, "name": name,
+					"sql": SQLString.createIndex(table, name, index_columns), "calls": 0, "table_rows": rows[table],
+					"estimated_rows_saved": 0, "plans": []}
+			recommendation["calls"] += shape["calls"]
+			recommendation["estimated_rows_saved"] += int(shape["calls"] * max(rows[table] - math.log(max(rows[table], 1), 2), 0))
+			recommendation["plans"].append({"query": query, "plan": plan, "calls": shape["calls"]})
+		results = sorted(recommendations.values(), key = lambda recommendation: -recommendation["estimated_rows_saved"])
+		if create:
+			for recommendation in results:
+				self.db.table(recommendation["table"], False).createIndex(*recommendation["columns"], name = recommendation["name"])
+		return results
+
+	def reset(self):
+		'''Removes every observed statement
+
+		Arguments:
+			None
+
+		Usage:
+			db.index_advisor.reset()
+
+		returns None'''
+		with self.lock:
+			self.shapes.clear()
+			self.normalized.clear()
@@ -0,0 +1,441 @@
+# Rushy Panchal
+# wire/asyncdb.py
+# Provides the AsyncDatabase, AsyncTable and AsyncCursor classes
+
+import threading
+import time
+
+try:
+	import Queue as queue
+except ImportError:
+	import queue
+
+try:
+	import asyncio
+except ImportError:
+	asyncio = None
+
+from database import Database
+from cursor import ExecutionCursor, BufferedCursor
+from futures import Future
+
+def runningLoop():
+	'''Internal function --- finds the running asyncio event loop, if any
+
+	Arguments:
+		None
+
+	Usage:
+		loop = runningLoop()
+
+	returns the running event loop or None'''
+	if asyncio is None:
+		return None
+	try:
+		return asyncio.get_running_loop() if hasattr(asyncio, "get_running_loop") else asyncio._get_running_loop()
+	except (RuntimeError, AttributeError):
+		return None
+
+class AsyncDatabase(object):
+	'''Non-blocking Database interface --- every call is queued and run on a dedicated executor thread'''
+	def __init__(self, path, loop = None, max_queue = 0, **kwargs):
+		'''Opens an SQLite database (or creates it if it does not exist) on a new executor thread
+
+		Arguments:
+			path - path to database
+			loop - asyncio event loop to return awaitables for (defaults to the running loop when a call is made)
+			max_queue - maximum number of queued calls, blocking further calls when full (defaults to unbounded). On the
+				thread of a running event loop, which must not block, calls raise Queue.Full instead
+			**kwargs - additional arguments for the Database
+
+		Usage:
+			db = AsyncDatabase("test.db")
+			users = await db.select("users") # inside a coroutine
+			users = db.select("users").result() # without an event loop
+
+		Each call returns an asyncio future when an event loop is running (or given), or a
+		concurrent.futures.Future otherwise. Cancelling a queued call removes it from the queue;
+		cancelling a running asyncio call interrupts the query.
+
+		returns an AsyncDatabase object'''
+		self.path, self.loop = path, loop
+		self.requests = queue.Queue(max_queue)
+		self.stats_lock = threading.Lock()
+		self.latency = {}
+		self.db = None
+		opened = Future()
+		self.thread = threading.Thread(target = self.run, args = (opened, path, kwargs))
+		self.thread.daemon = True
+		self.thread.start()
+		opened.result()
+
+	def run(self, opened, path, kwargs):
+		'''Internal function --- executes the queued calls on the executor thread
+
+		Arguments:
+			opened - Future to set once the database is open
+			path - path to database
+			kwargs - additional arguments for the Database
+
+		Usage:
+			threading.Thread(target = db.run, args = (Future(), "test.db", {})).start()
+
+		returns None'''
+		kwargs.setdefault("check_same_thread", False)
+		try:
+			self.db = Database(path, **kwargs)
+		except Exception as error:
+			opened.set_exception(error)
+			return
+		opened.set_result(True)
+		while True:
+			request = self.requests.get()
+			if request is None:
+				break
+			future, function, args, kwargs, name, queued = request
+			if not future.set_running_or_notify_cancel():
+				continue
+			start = time.time()
+			try:
+				result = function(*args, **kwargs)
+				if isinstance(result, ExecutionCursor):
+					result = ExecutionCursor(BufferedCursor(result.cursor), result.chunk_size)
+				future.set_result(result)
+			except BaseException as error:
+				future.set_exception(error)
+			self.record(name, start - queued, time.time() - start)
+		self.db.close()
+
+	def record(self, name, wait, elapsed):
+		'''Internal function --- records the queue wait and execution time of a call
+
+		Arguments:
+			name - name of the called method
+			wait - seconds spent in the queue
+			elapsed - seconds spent executing
+
+		Usage:
+			db.record("select", 0.001, 0.02)
+
+		returns None'''
+		with self.stats_lock:
+			stats = self.latency.setdefault(name, {"calls": 0, "total_wait": 0.0, "total_time": 0.0, "max_time": 0.0})
+			stats["calls"] += 1
+			stats["total_wait"] += wait
+			stats["total_time"] += elapsed
+			stats["max_time"] = max(stats["max_time"], elapsed)
+
+	def enqueue(self, function, args = (), kwargs = None, name = None):
+		'''Internal function --- queues a function to run on the executor thread
+
+		Arguments:
+			function - function to call
+			args, kwargs - arguments to the function
+			name - name to record the latency under (defaults to the function name)
+
+		Usage:
+			future = db.enqueue(function, (1, 2))
+
+		raises Queue.Full if the queue is full and the calling thread runs an event loop, which must not block
+
+		returns a concurrent.futures.Future'''
+		future = Future()
+		request = (future, function, args, kwargs or {}, name or getattr(function, "__name__", "call"), time.time())
+		if runningLoop() is None:
+			self.requests.put(request)
+		else:
+			self.requests.put_nowait(request)
+		return future
+
+	def call(self, function, *args, **kwargs):
+		'''Queues a function to run on the executor thread
+
+		Arguments:
+			function - function to call (it may use AsyncDatabase.db, which is only safe on the executor thread)
+			*args, **kwargs - arguments to the function
+
+		Usage:
+			future = db.call(lambda: db.db.table("users").columns())
+
+		returns an awaitable asyncio future or a concurrent.futures.Future (see AsyncDatabase.__init__)'''
+		return self.wrap(self.enqueue(function, args, kwargs))
+
+	def wrap(self, future):
+		'''Internal function --- wraps a future for the asyncio event loop, if there is one
+
+		Arguments:
+			future - concurrent.futures.Future object
+
+		Usage:
+			awaitable = db.wrap(future)
+
+		returns an asyncio future or the future itself'''
+		loop = self.loop or runningLoop()
+		if loop is None:
+			return future
+		wrapped = asyncio.wrap_future(future, loop = loop)
+		def interrupt(wrapped):
+			if wrapped.cancelled() and future.running():
+				self.db.interrupt()
+		wrapped.add_done_callback(interrupt)
+		return wrapped
+
+	def submit(self, name, *args, **kwargs):
+		'''Internal function --- queues a Database method
+
+		Arguments:
+			name - name of the Database method
+			*args, **kwargs - arguments to the method
+
+		Usage:
+			future = db.submit("select", "users")
+
+		returns an awaitable asyncio future or a concurrent.futures.Future'''
+		return self.wrap(self.enqueue(lambda *args, **kwargs: getattr(self.db, name)(*args, **kwargs), args, kwargs, name))
+
+	def transaction(self, function, *args, **kwargs):
+		'''Runs a function inside a transaction on the executor thread, committing if it returns and rolling back if it raises
+
+		Arguments:
+			function - function called with the Transaction object (and *args, **kwargs)
+
+		Usage:
+			await db.transaction(lambda trans: [trans.insert("users", id = index) for index in range(10)])
+
+		returns an awaitable asyncio future or a concurrent.futures.Future of the function's return value'''
+		def transaction(*args, **kwargs):
+			with self.db.transaction() as trans:
+				return function(trans, *args, **kwargs)
+		return self.call(transaction, *args, **kwargs)
+
+	def iterate(self, table = None, type = dict, chunk_size = None, **options):
+		'''Selects rows from the table, streaming them in chunks without blocking
+
+		Arguments:
+			table - table name to select from
+			type - type of each row (dict, "row", list)
+			chunk_size - number of rows to fetch per call (defaults to ExecutionCursor.chunk_size)
+			**options - see Database.select
+
+		Usage:
+			async for user in db.iterate("users", equal = {"tier": 2}):
+				print(user["username"])
+			for user in db.iterate("users"): # without an event loop
+				print(user["username"])
+
+		returns an AsyncCursor object'''
+		return AsyncCursor(self, table, type, chunk_size, options)
+
+	def table(self, name):
+		'''Creates an AsyncTable object --- unlike Database.table, the table is not verified, since that would block
+
+		Arguments:
+			name - name of the table
+
+		Usage:
+			table = db.table("users")
+
+		returns an AsyncTable object'''
+		return AsyncTable(self, name)
+
+	def queueDepth(self):
+		'''Finds the number of calls waiting to run
+
+		Arguments:
+			None
+
+		Usage:
+			depth = db.queueDepth()
+
+		returns the number of queued calls'''
+		return self.requests.qsize()
+
+	def stats(self):
+		'''Reports the queue depth and the latency of each method
+
+		Arguments:
+			None
+
+		Usage:
+			stats = db.stats()
+
+		returns a dictionary of the queue depth and, per method, the calls, total and average queue wait, and total, average and maximum execution time'''
+		with self.stats_lock:
+			methods = {}
+			for name, stats in self.latency.items():
+				methods[name] = dict(stats, average_wait = stats["total_wait"] / stats["calls"], average_time = stats["total_time"] / stats["calls"])
+		return {"queue_depth": self.queueDepth(), "methods": methods}
+
+	def close(self):
+		'''Runs every queued call, then closes the database and stops the executor thread
+
+		Arguments:
+			None
+
+		Usage:
+			db.close()
+
+		returns None'''
+		if self.thread.is_alive():
+			self.requests.put(None)
+			self.thread.join()
+
+def delegate(name):
+	'''Internal function --- creates an AsyncDatabase method that queues a Database method'''
+	def method(self, *args, **kwargs):
+		return self.submit(name, *args, **kwargs)
+	method.__name__ = name
+	method.__doc__ = '''Queues Database.{name} on the executor thread
+
+		see Database.{name} for further reference'''.format(name = name)
+	return method
+
+for name in ["execute", "query", "pragma", "script", "executeFile", "insert", "insertMany", "update", "select", "aggregate", "delete",
+	"tables", "tableExists", "dropTable", "count", "checkIntegrity", "commit", "rollback"]:
+	setattr(AsyncDatabase, name, delegate(name))
+
+class AsyncTable(object):
+	'''Non-blocking interface to a Database table'''
+	def __init__(self, db, name):
+		'''Creates the AsyncTable object
+
+		Arguments:
+			db - AsyncDatabase object
+			name - table name
+
+		Usage:
+			table = db.table("users")
+
+		returns the AsyncTable object'''
+		self.db, self.name = db, name
+
+	def columns(self):
+		'''Retrieves the columns in the table
+
+		see Table.columns for further reference'''
+		return self.db.call(lambda: self.db.db.table(self.name, False).columns())
+
+	def insert(self, **columns):
+		'''Inserts rows into the table
+
+		see Database.insert for further reference'''
+		return self.db.insert(self.name, **columns)
+
+	def insertMany(self, rows, columns = None, chunk_size = 1000):
+		'''Inserts many rows into the table in a single transaction
+
+		see Database.insertMany for further reference'''
+		return self.db.insertMany(self.name, rows, columns, chunk_size)
+
+	def update(self, equal = None, like = None, where = "1 = 1", **columns):
+		'''Updates rows in the table
+
+		see Database.update for further reference'''
+		return self.db.update(self.name, equal, like, where, **columns)
+
+	def select(self, **options):
+		'''Selects rows from the table
+
+		see Database.select for further reference'''
+		return self.db.select(self.name, **options)
+
+	def count(self, **options):
+		'''Counts the rows of the table
+
+		see Table.count for further reference'''
+		return self.db.call(lambda: self.db.db.table(self.name, False).count(**options))
+
+	def aggregate(self, **options):
+		'''Aggregates the rows of the table
+
+		see Table.aggregate for further reference (grouped results are fetched on the executor thread)'''
+		def aggregate():
+			results = self.db.db.table(self.name, False).aggregate(**options)
+			return results.fetch() if options.get("group_by") else results
+		return self.db.call(aggregate)
+
+	def iterate(self, type = dict, chunk_size = None, **options):
+		'''Selects rows from the table, streaming them in chunks
+
+		see AsyncDatabase.iterate for further reference'''
+		return self.db.iterate(self.name, type, chunk_size, **options)
+
+	def delete(self, **options):
+		'''Deletes rows from the table
+
+		see Database.delete for further reference'''
+		return self.db.delete(self.name, **options)
+
+	def drop(self):
+		'''Drops the table from the database
+
+		see Table.drop for further reference'''
+		return self.db.dropTable(self.name)
+
+class AsyncCursor(object):
+	'''Streams the rows of a query from the executor thread, one chunk per call'''
+	def __init__(self, db, table, type, chunk_size, options):
+		'''Creates the AsyncCursor object
+
+		see AsyncDatabase.iterate for further reference'''
+		self.db, self.table, self.type, self.chunk_size, self.options = db, table, type, chunk_size, options
+		self.rows, self.position, self.generator, self.finished = [], 0, None, False
+
+	def fetchChunk(self):
+		'''Fetches the next chunk of rows
+
+		Arguments:
+			None
+
+		Usage:
+			rows = cursor.fetchChunk().result()
+
+		returns a future of a list of rows (empty once every row has been fetched)'''
+		def fetchChunk():
+			if self.generator is None:
+				results = self.db.db.select(self.table, **self.options)
+				self.generator = results.chunks(self.chunk_size)
+				if self.type == "row":
+					results.useRows()
+				self.columns = results.columnNames()
+			rows = next(self.generator, [])
+			if self.type == dict:
+				rows = [dict(zip(self.columns, row)) for row in rows]
+			return rows
+		return self.db.enqueue(fetchChunk, name = "iterate")
+
+	def __iter__(self):
+		'''Iterates over the rows, blocking for each chunk'''
+		while True:
+			rows = self.fetchChunk().result()
+			if not rows:
+				break
+			for row in rows:
+				yield row
+
+	def __aiter__(self):
+		'''Iterates over the rows asynchronously'''
+		return self
+
+	def __anext__(self):
+		'''Retrieves the next row asynchronously'''
+		future = Future()
+		if self.position < len(self.rows):
+			self.position += 1
+			future.set_result(self.rows[self.position - 1])
+		elif self.finished:
+			future.set_exception(StopAsyncIteration())
+		else:
+			def fill(chunk):
+				try:
+					self.rows, self.position = chunk.result(), 1
+				except BaseException as error:
+					future.set_exception(error)
+					return
+				if self.rows:
+					future.set_result(self.rows[0])
+				else:
+					self.finished = True
+					future.set_exception(StopAsyncIteration())
+			self.fetchChunk().add_done_callback(fill)
+		return self.db.wrap(future)
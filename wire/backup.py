@@ -0,0 +1,212 @@
+# Rushy Panchal
+# wire/backup.py
+# The Backup class copies a database file on a background thread, a few pages at a time
+
+import os
+import gzip
+import shutil
+import sqlite3
+import threading
+import time
+
+from database import Database
+from futures import Future
+
+class RestartLimit(Exception):
+	'''Internal class --- stops a backup that restarted too often'''
+	pass
+
+class Backup(object):
+	'''Online backup of a database file --- the pages are copied in small steps, so writers are only blocked during a step
+
+	The steps need sqlite3.Connection.backup (Python 3.7). Without it, the database is copied in one VACUUM INTO step, which only
+	leaves writers alone in WAL mode (see Backup.__init__)'''
+	incremental = hasattr(sqlite3.Connection, "backup") # copy with the backup API, rather than VACUUM INTO
+
+	def __init__(self, path, target_path, pages_per_step = 1024, sleep = 0.005, progress = None, compress = False, max_restarts = 3):
+		'''Creates the Backup object and starts its thread, which reads through its own connection
+
+		Arguments:
+			path - path to database
+			target_path - path to the backup, replaced once the copy is complete so that it is never left half-written
+			pages_per_step - number of pages copied while the database is locked, or -1 for every page at once (defaults to 1024)
+			sleep - seconds to wait between steps, to let writers in (defaults to 0.005)
+			progress - function called after each step with the number of pages copied and the total (optional)
+			compress - whether or not to gzip the backup, or the compression level (defaults to False). The copy is compressed
+				once it is complete, since SQLite writes its pages out of order, so it needs its own disk space until then
+			max_restarts - number of times the copy may start over (because another connection wrote to the database) before
+				the rest is copied in a single step (defaults to 3)
+
+		Usage:
+			backup = Backup("test.db", "backups/test.db.gz", compress = True)
+			stats = backup.wait()
+
+		Without sqlite3.Connection.backup (before Python 3.7), the database is copied with VACUUM INTO in a single step. Its read
+		transaction lasts for the whole copy, which would block every writer in rollback journal mode, so the backup fails with a
+		ValueError unless the database is in WAL mode
+
+		returns the Backup object'''
+		if path == ":memory:":
+			raise ValueError('Backup needs a database file, since it reads through its own connection')
+		if not self.incremental and sqlite3.sqlite_version_info < (3, 27, 0):
+			raise ValueError('Backups need Python 3.7 or SQLite 3.27')
+		self.path, self.target_path = path, target_path
+		self.pages_per_step, self.sleep, self.progress = pages_per_step, sleep, progress
+		self.compress, self.max_restarts = 9 if compress is True else compress, max_restarts
+		self.pages, self.total, self.steps, self.restarts, self.max_step = 0, 0, 0, 0, 0.0
+		self.started, self.finished = time.time(), None
+		self.future = Future()
+		self.thread = threading.Thread(target = self.run)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def run(self):
+		'''Internal function --- copies the database to a temporary file, compresses it and moves it into place
+
+		Arguments:
+			None
+
+		Usage:
+			threading.Thread(target = backup.run).start()
+
+		returns None'''
+		temporary = "{path}.{pid}.tmp".format(path = self.target_path, pid = os.getpid())
+		try:
+			self.copy(temporary)
+			if self.compress:
+				self.compressFile(temporary, temporary + ".gz")
+				os.remove(temporary)
+				temporary += ".gz"
+			getattr(os, "replace", os.rename)(temporary, self.target_path)
+			self.finished = time.time()
+			self.future.set_result(self.stats())
+		except Exception as error:
+			for leftover in (temporary, temporary + ".gz"):
+				if os.path.exists(leftover):
+					os.remove(leftover)
+			self.future.set_exception(error)
+
+	def copy(self, target_path):
+		'''Internal function --- copies the database, with the backup API when it is available
+
+		Arguments:
+			target_path - path to the copy
+
+		Usage:
+			backup.copy("test.db.tmp")
+
+		returns None'''
+		if os.path.exists(target_path):
+			os.remove(target_path)
+		source = Database(self.path, check_same_thread = False)
+		try:
+			if self.incremental:
+				target = sqlite3.connect(target_path)
+				try:
+					self.last_step = time.time()
+					try:
+						sqlite3.Connection.backup(source, target, pages = self.pages_per_step, progress = self.step)
+					except RestartLimit:
+						self.pages_per_step, self.last_step = -1, time.time()
+						sqlite3.Connection.backup(source, target, pages = -1, progress = self.step)
+				finally:
+					target.close()
+			else:
+				if source.cursor().execute("PRAGMA journal_mode").fetchone()[0].lower() != "wal":
+					raise ValueError('Backups without sqlite3.Connection.backup (before Python 3.7) need a database in WAL mode, '
+						'since VACUUM INTO blocks writers for the whole copy otherwise')
+				self.last_step = time.time()
+				source.cursor().execute("VACUUM INTO ?", (target_path,))
+				total = source.schema.query("SELECT page_count FROM pragma_page_count", "PRAGMA page_count")[0][0]
+				self.step(101, 0, total) # SQLITE_DONE
+		finally:
+			source.close()
+
+	def step(self, status, remaining, total):
+		'''Internal function --- records a step of the backup, then waits before the next one
+
+		Arguments:
+			status - status code of the step
+			remaining - number of pages left to copy
+			total - number of pages in the database
+
+		Usage:
+			sqlite3.Connection.backup(source, target, progress = backup.step)
+
+		returns None'''
+		now = time.time()
+		self.max_step = max(self.max_step, now - self.last_step)
+		restarted = total - remaining < self.pages and self.pages_per_step > 0
+		self.pages, self.total = total - remaining, total
+		self.steps += 1
+		if restarted:
+			self.restarts += 1 # another connection wrote to the database, so the copy started over
+			if self.restarts > self.max_restarts:
+				raise RestartLimit()
+		if self.progress:
+			self.progress(self.pages, self.total)
+		if remaining and self.sleep:
+			time.sleep(self.sleep)
+		self.last_step = time.time()
+
+	def compressFile(self, source_path, target_path):
+		'''Internal function --- compresses a file, reading it in chunks
+
+		The copy cannot be compressed as it is written, since SQLite writes database pages in any order (and reads them back)
+
+		Arguments:
+			source_path - path to the file
+			target_path - path to the compressed file
+
+		Usage:
+			backup.compressFile("test.db.tmp", "test.db.tmp.gz")
+
+		returns None'''
+		with open(source_path, 'rb') as source:
+			compressed = gzip.open(target_path, 'wb', self.compress)
+			try:
+				shutil.copyfileobj(source, compressed, 1 << 20)
+			finally:
+				compressed.close()
+
+	def done(self):
+		'''Checks whether the backup is finished
+
+		Arguments:
+			None
+
+		Usage:
+			if backup.done():
+				print(backup.stats())
+
+		returns True if the backup is finished (or failed) or False'''
+		return self.future.done()
+
+	def wait(self, timeout = None):
+		'''Waits for the backup to finish, raising its error if it failed
+
+		Arguments:
+			timeout - maximum number of seconds to wait (defaults to no limit)
+
+		Usage:
+			stats = db.backup("backups/test.db").wait()
+
+		returns the statistics of the backup (see Backup.stats)'''
+		return self.future.result(timeout)
+
+	def stats(self):
+		'''Reports the progress of the backup
+
+		Arguments:
+			None
+
+		Usage:
+			stats = backup.stats()
+
+		returns a dictionary of the pages copied, the total pages, the steps, the restarts (caused by writes from other
+		connections), the longest step (max_step_seconds, the longest writers could have been blocked), the seconds
+		elapsed and, once finished, the size of the backup in bytes'''
+		finished = self.finished is not None
+		return {"pages": self.pages, "total": self.total, "steps": self.steps, "restarts": self.restarts,
+			"max_step_seconds": self.max_step, "seconds": (self.finished if finished else time.time()) - self.started,
+			"bytes": os.path.getsize(self.target_path) if finished else None}
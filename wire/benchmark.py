@@ -0,0 +1,358 @@
+# Rushy Panchal
+# wire/benchmark.py
+# The Benchmark class measures the throughput of the wire data path and compares it against a saved baseline
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import platform
+import tempfile
+import argparse
+import threading
+
+from database import Database, PROFILES
+from sqlstring import SQLString, ALL
+from pool import ConnectionPool
+
+SIZES = (1000, 10000, 100000)
+BENCHMARKS = ("sqlstring", "insert", "insertMany", "fetchDict", "fetchTuple", "export", "dropColumns", "readers")
+WRITE_BENCHMARKS = ("insert", "insertMany", "dropColumns")
+
+class Benchmark(object):
+	'''Reproducible benchmark suite --- each benchmark runs against synthetic datasets of several sizes'''
+	def __init__(self, sizes = SIZES, repeat = 3, benchmarks = BENCHMARKS, directory = None, readers = 4, seed = 0, profile = None):
+		'''Creates the Benchmark object
+
+		Arguments:
+			sizes - numbers of rows in the synthetic datasets (defaults to 1000, 10000 and 100000)
+			repeat - number of times each benchmark is run, the median time is reported (defaults to 3)
+			benchmarks - names of the benchmarks to run (defaults to every benchmark in BENCHMARKS)
+			directory - directory for the database files (defaults to a new temporary directory, removed afterwards)
+			readers - number of concurrent reader threads for the readers benchmark (defaults to 4)
+			seed - seed of the synthetic data (defaults to 0)
+			profile - tuning profile of the datasets (see Database.setProfile), the write benchmarks are skipped for
+				read-only profiles and the readers benchmark keeps the settings of the ConnectionPool (defaults to none)
+
+		Usage:
+			benchmark = Benchmark(sizes = (1000, 10000), benchmarks = ["insert", "insertMany"])
+			benchmark = Benchmark(profile = "bulk_load")
+
+		returns the Benchmark object'''
+		for name in benchmarks:
+			if name not in BENCHMARKS:
+				raise ValueError('Benchmark must be one of {names}'.format(names = ', '.join(BENCHMARKS)))
+		if profile is not None and PROFILES.get(profile, {}).get("query_only"):
+			benchmarks = [name for name in benchmarks if name not in WRITE_BENCHMARKS]
+		self.sizes, self.repeat, self.benchmarks = sizes, repeat, benchmarks
+		self.directory, self.reader_threads, self.seed = directory, readers, seed
+		self.profile, self.results, self.sources = profile, None, {}
+
+	def rows(self, size):
+		'''Internal function --- generates the rows of a synthetic users table
+
+		Arguments:
+			size - number of rows
+
+		Usage:
+			rows = benchmark.rows(1000)
+
+		returns a generator of (id, username, tier, score, joined) tuples, the same for every run'''
+		generator = random.Random(self.seed)
+		for index in range(size):
+			yield (index + 1, "user_{index}".format(index = index), generator.randint(0, 9), generator.random() * 100,
+				1500000000 + generator.randint(0, 10 ** 8))
+
+	def dataset(self, path, size):
+		'''Internal function --- creates a database file with a synthetic users table
+
+		Arguments:
+			path - path to the database file (removed first if it exists)
+			size - number of rows
+
+		Usage:
+			db = benchmark.dataset("users.db", 10000)
+
+		returns the Database object'''
+		if os.path.exists(path):
+			os.remove(path)
+		db = Database(path)
+		if self.profile:
+			db.setProfile(self.profile, query_only = 0)
+		db.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, username TEXT, tier INT, score REAL, joined INT)")
+		db.insertMany("users", self.rows(size), ["id", "username", "tier", "score", "joined"])
+		if self.profile and PROFILES[self.profile].get("query_only"):
+			db.pragma("query_only = 1")
+		return db
+
+	def measure(self, function, setup = None):
+		'''Internal function --- times a function, running it once per repetition
+
+		Arguments:
+			function - function to time, called with the return value of setup
+			setup - function called before each repetition, untimed (optional)
+
+		Usage:
+			stats = benchmark.measure(lambda db: db.select("users").fetch(), lambda: db)
+
+		returns a dictionary of the median, minimum and maximum seconds, and the operations reported by the function'''
+		timings, operations = [], None
+		for repetition in range(self.repeat):
+			argument = setup() if setup else None
+			start = time.time()
+			operations = function(argument)
+			timings.append(time.time() - start)
+		timings.sort()
+		median = timings[len(timings) // 2]
+		stats = {"seconds": median, "min": timings[0], "max": timings[-1]}
+		if operations:
+			stats["operations"] = operations
+			stats["operations_per_second"] = operations / median if median else 0.0
+		return stats
+
+	def sqlstring(self, directory, size):
+		'''Benchmarks building INSERT, UPDATE, SELECT and DELETE queries with SQLString
+
+		returns the benchmark statistics (see Benchmark.measure)'''
+		def build(argument):
+			for index in range(size):
+				SQLString.insert("users", id = index, username = "user")
+				SQLString.update("users", equal = {"id": index}, username = "other")
+				SQLString.select("users", columns = ALL, equal = {"tier": index % 10}, order_by = "-id", limit = 10)
+				SQLString.delete("users", equal = {"id": [index, index + 1]})
+			return size * 4
+		return self.measure(build)
+
+	def insert(self, directory, size):
+		'''Benchmarks inserting rows one Database.insert call at a time (in one batch, so commits do not dominate)
+
+		returns the benchmark statistics (see Benchmark.measure)'''
+		def insert(db):
+			with db.batch():
+				for row in self.rows(size):
+					db.insert("users", id = row[0], username = row[1], tier = row[2], score = row[3], joined = row[4])
+			db.close()
+			return size
+		return self.measure(insert, lambda: self.dataset(os.path.join(directory, "insert.db"), 0))
+
+	def insertMany(self, directory, size):
+		'''Benchmarks inserting rows with Database.insertMany
+
+		returns the benchmark statistics (see Benchmark.measure)'''
+		def insertMany(db):
+			db.insertMany("users", self.rows(size), ["id", "username", "tier", "score", "joined"])
+			db.close()
+			return size
+		return self.measure(insertMany, lambda: self.dataset(os.path.join(directory, "insertMany.db"), 0))
+
+	def fetchDict(self, directory, size):
+		'''Benchmarks fetching every row as a dictionary
+
+		returns the benchmark statistics (see Benchmark.measure)'''
+		db = self.source(directory, size)
+		return self.measure(lambda argument: len(db.select("users").fetch()))
+
+	def fetchTuple(self, directory, size):
+		'''Benchmarks fetching every row as a tuple
+
+		returns the benchmark statistics (see Benchmark.measure)'''
+		db = self.source(directory, size)
+		return self.measure(lambda argument: len(db.select("users").fetch(type = list)))
+
+	def export(self, directory, size):
+		'''Benchmarks exporting every row to a CSV file with ExecutionCursor.export
+
+		returns the benchmark statistics (see Benchmark.measure)'''
+		db = self.source(directory, size)
+		path = os.path.join(directory, "export.csv")
+		return self.measure(lambda argument: db.select("users").export(path)["rows"])
+
+	def dropColumns(self, directory, size):
+		'''Benchmarks dropping an indexed column with Table.dropColumns, which rebuilds the table
+
+		returns the benchmark statistics (see Benchmark.measure)'''
+		def setup():
+			db = self.dataset(os.path.join(directory, "dropColumns.db"), size)
+			db.table("users").createIndex("tier")
+			return db
+		def drop(db):
+			db.table("users").dropColumns("tier", drop_indexes = True)
+			db.close()
+			return size
+		return self.measure(drop, setup)
+
+	def readers(self, directory, size):
+		'''Benchmarks point queries from concurrent reader threads sharing a ConnectionPool
+
+		returns the benchmark statistics (see Benchmark.measure), where each operation is one query'''
+		self.source(directory, size)
+		pool = ConnectionPool(os.path.join(directory, "source.db"), readers = self.reader_threads)
+		queries = max(size // 10, 100)
+		def read(offset):
+			generator = random.Random(self.seed + offset)
+			for index in range(queries):
+				with pool.reader() as db:
+					db.select("users", equal = {"id": generator.randint(1, max(size, 1))}).fetch()
+		def run(argument):
+			threads = [threading.Thread(target = read, args = (offset,)) for offset in range(self.reader_threads)]
+			for thread in threads:
+				thread.start()
+			for thread in threads:
+				thread.join()
+			return queries * self.reader_threads
+		try:
+			return self.measure(run)
+		finally:
+			pool.close()
+
+	def source(self, directory, size):
+		'''Internal function --- retrieves the shared read-only dataset of a size, creating it on first use
+
+		Arguments:
+			directory - directory of the database file
+			size - number of rows
+
+		Usage:
+			db = benchmark.source(directory, 10000)
+
+		returns the Database object'''
+		if self.sources.get("size") != size:
+			if self.sources.get("db") is not None:
+				self.sources["db"].close()
+			self.sources["db"], self.sources["size"] = self.dataset(os.path.join(directory, "source.db"), size), size
+		return self.sources["db"]
+
+	def run(self, progress = None):
+		'''Runs the benchmarks
+
+		Arguments:
+			progress - function called with the benchmark name, the size and its statistics after each run (optional)
+
+		Usage:
+			results = Benchmark(sizes = (1000,)).run()
+
+		returns a dictionary of the environment, the profile and, for each benchmark and size, its statistics'''
+		directory = self.directory or tempfile.mkdtemp()
+		self.sources = {}
+		results = {}
+		try:
+			for size in self.sizes:
+				for name in self.benchmarks:
+					stats = getattr(self, name)(directory, size)
+					results.setdefault(name, {})[str(size)] = stats
+					if progress:
+						progress(name, size, stats)
+		finally:
+			if self.sources.get("db") is not None:
+				self.sources["db"].close()
+			if not self.directory:
+				shutil.rmtree(directory, ignore_errors = True)
+		self.results = {"environment": self.environment(), "repeat": self.repeat, "profile": self.profile, "results": results}
+		return self.results
+
+	@staticmethod
+	def environment():
+		'''Internal function --- describes the environment of a run
+
+		Arguments:
+			None
+
+		Usage:
+			environment = Benchmark.environment()
+
+		returns a dictionary of the Python, SQLite and platform versions and the time'''
+		return {"python": platform.python_version(), "sqlite": sqlite3.sqlite_version, "platform": platform.platform(), "time": time.time()}
+
+	def save(self, filepath):
+		'''Saves the results of the last run to a JSON file
+
+		Arguments:
+			filepath - path to the JSON file
+
+		Usage:
+			benchmark.save("baseline.json")
+
+		returns None'''
+		with open(filepath, 'w') as results_file:
+			json.dump(self.results, results_file, indent = 1, sort_keys = True)
+
+	@staticmethod
+	def load(filepath):
+		'''Loads the results of a run from a JSON file
+
+		Arguments:
+			filepath - path to the JSON file
+
+		Usage:
+			baseline = Benchmark.load("baseline.json")
+
+		returns the results dictionary'''
+		with open(filepath, 'r') as results_file:
+			return json.load(results_file)
+
+	@staticmethod
+	def compare(results, baseline, threshold = 0.2):
+		'''Compares results against a baseline
+
+		Arguments:
+			results - results dictionary (see Benchmark.run)
+			baseline - results dictionary of the baseline
+			threshold - fraction by which the median time may grow before it is a regression (defaults to 0.2)
+
+		Usage:
+			regressions = [change for change in Benchmark.compare(results, baseline) if change["regression"]]
+
+		returns a list of dictionaries of the benchmark, size, baseline and current seconds, the relative change and whether
+		it is a regression, for every benchmark and size in both'''
+		changes = []
+		for name, sizes in sorted(results["results"].items()):
+			for size, stats in sorted(sizes.items(), key = lambda item: int(item[0])):
+				previous = baseline["results"].get(name, {}).get(size)
+				if previous is None or not previous["seconds"]:
+					continue
+				change = stats["seconds"] / previous["seconds"] - 1
+				changes.append({"benchmark": name, "size": int(size), "baseline": previous["seconds"], "current": stats["seconds"],
+					"change": change, "regression": change > threshold})
+		return changes
+
+def main(arguments = None):
+	'''Runs the benchmarks from the command line
+
+	Arguments:
+		arguments - list of command line arguments (defaults to sys.argv)
+
+	Usage:
+		python benchmark.py --sizes 1000,10000 --output results.json --baseline baseline.json
+
+	returns the exit status: 1 if a benchmark regressed against the baseline, or 0'''
+	parser = argparse.ArgumentParser(description = "Benchmarks the wire data path")
+	parser.add_argument("--sizes", default = ','.join(map(str, SIZES)), help = "comma-separated dataset sizes")
+	parser.add_argument("--benchmarks", default = ','.join(BENCHMARKS), help = "comma-separated benchmark names")
+	parser.add_argument("--repeat", type = int, default = 3, help = "runs per benchmark")
+	parser.add_argument("--readers", type = int, default = 4, help = "concurrent reader threads")
+	parser.add_argument("--profile", choices = sorted(PROFILES), help = "tuning profile of the datasets")
+	parser.add_argument("--output", help = "path to save the JSON results to")
+	parser.add_argument("--baseline", help = "path to the JSON results to compare against")
+	parser.add_argument("--threshold", type = float, default = 0.2, help = "allowed slowdown before a regression, as a fraction")
+	options = parser.parse_args(arguments)
+	benchmark = Benchmark([int(size) for size in options.sizes.split(',')], options.repeat, options.benchmarks.split(','),
+		readers = options.readers, profile = options.profile)
+	def report(name, size, stats):
+		print("{name:<12} {size:>8} {seconds:>10.4f}s {rate:>14.0f}/s".format(name = name, size = size, seconds = stats["seconds"],
+			rate = stats.get("operations_per_second", 0)))
+	results = benchmark.run(report)
+	if options.output:
+		benchmark.save(options.output)
+	if not options.baseline:
+		return 0
+	changes = Benchmark.compare(results, Benchmark.load(options.baseline), options.threshold)
+	for change in changes:
+		print("{flag} {benchmark:<12} {size:>8} {baseline:>10.4f}s -> {current:.4f}s ({percent:+.1f}%)".format(flag = "!" if change["regression"] else " ",
+			percent = change["change"] * 100, **change))
+	return 1 if any(change["regression"] for change in changes) else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
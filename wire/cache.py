@@ -0,0 +1,162 @@
+# Rushy Panchal
+# wire/cache.py
+# The ResultCache class caches the results of SELECT queries
+
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+
+from cursor import ExecutionCursor, BufferedCursor, ChainedCursor
+
+SUBQUERY = re.compile(r"\bSELECT\b", re.IGNORECASE)
+
+class ResultCache(object):
+	'''Bounded LRU cache of query results, invalidated by writes to their tables (see Database.enableCache)'''
+	def __init__(self, db, size = 256, ttl = None, max_rows = 10000):
+		'''Creates the ResultCache object
+
+		Arguments:
+			db - Database object
+			size - maximum number of results to keep (defaults to 256)
+			ttl - seconds a result stays valid (defaults to no limit)
+			max_rows - largest result to cache, in rows (defaults to 10000)
+
+		Usage:
+			cache = ResultCache(db, 1024, ttl = 30)
+
+		returns the ResultCache object'''
+		self.db, self.size, self.ttl, self.max_rows = db, size, ttl, max_rows
+		self.results = OrderedDict()
+		self.tables = {}
+		self.version, self.changes = None, db.total_changes
+		self.hits, self.misses, self.evictions, self.invalidations = 0, 0, 0, 0
+
+	def check(self):
+		'''Clears the cache if the database was changed in a way that cannot be traced to a table
+
+		That is, if another connection committed a write (PRAGMA data_version), the schema changed, or this connection
+		changed rows through a raw query (total_changes)
+
+		Arguments:
+			None
+
+		Usage:
+			cache.check()
+
+		returns None'''
+		version = tuple(self.db.schema.query("SELECT (SELECT data_version FROM pragma_data_version), (SELECT schema_version FROM main.pragma_schema_version)",
+			"PRAGMA data_version")[0])
+		if version != self.version or self.db.total_changes != self.changes:
+			self.clear()
+			self.version, self.changes = version, self.db.total_changes
+
+	def select(self, table, query, values):
+		'''Retrieves the results of a query from the cache, executing it on a miss
+
+		Arguments:
+			table - table name the query reads from
+			query - SELECT query
+			values - tuple of parameter values
+
+		Usage:
+			results = cache.select("users", "SELECT * FROM users WHERE `id` = ?", (1,))
+
+		returns an ExecutionCursor object'''
+		self.check()
+		tables = self.dependencies(table, query)
+		key = (query, values)
+		try:
+			expires, cursor = self.results.pop(key)
+		except KeyError:
+			expires, cursor = None, None
+		except TypeError: # unhashable values, such as blobs
+			return self.db.execute(query, values)
+		if cursor is not None and (expires is None or expires > time.time()):
+			self.hits += 1
+			self.results[key] = (expires, cursor)
+			return ExecutionCursor(cursor.replay())
+		if cursor is not None:
+			for name in tables:
+				self.tables.get(name, set()).discard(key)
+		self.misses += 1
+		results = self.db.execute(query, values)
+		rows = results.cursor.fetchmany(self.max_rows + 1)
+		cursor = BufferedCursor(results.cursor, rows)
+		if len(rows) > self.max_rows:
+			return ExecutionCursor(ChainedCursor([cursor, results.cursor]), results.chunk_size)
+		if len(self.results) >= self.size:
+			old_key, old_value = self.results.popitem(last = False)
+			for keys in self.tables.values():
+				keys.discard(old_key)
+			self.evictions += 1
+		self.results[key] = (time.time() + self.ttl if self.ttl else None, cursor)
+		for name in tables:
+			self.tables.setdefault(name, set()).add(key)
+		return ExecutionCursor(cursor.replay())
+
+	def dependencies(self, table, query):
+		'''Internal function --- finds the tables whose writes invalidate the results of a query
+
+		A query that reads only its own table depends on that table, whereas one with a subquery (such as a raw
+		"`id` IN (SELECT ...)" filter) or that reads from a view could read any table, so any write invalidates it
+
+		Arguments:
+			table - table name the query reads from
+			query - SELECT query
+
+		Usage:
+			tables = cache.dependencies("users", "SELECT * FROM users WHERE `id` = ?")
+
+		returns a tuple of table names, where None stands for every table'''
+		if len(SUBQUERY.findall(query)) > 1 or not self.db.schema.exists(table, True):
+			return (None,)
+		return (table,)
+
+	def invalidate(self, table, changed = None):
+		'''Removes the cached results of a table after it was written to
+
+		Arguments:
+			table - table name
+			changed - number of rows changed by the write, any other change since the last check clears the whole cache
+				(such as rows changed by triggers, or an unknown count)
+
+		Usage:
+			cache.invalidate("users", 1)
+
+		returns None'''
+		if changed is None or changed < 0 or self.db.total_changes - changed != self.changes:
+			self.clear()
+		else:
+			for key in self.tables.pop(table, set()) | self.tables.pop(None, set()):
+				self.results.pop(key, None)
+				self.invalidations += 1
+		self.changes = self.db.total_changes
+
+	def clear(self):
+		'''Removes every result from the cache
+
+		Arguments:
+			None
+
+		Usage:
+			db.result_cache.clear()
+
+		returns None'''
+		self.invalidations += len(self.results)
+		self.results.clear()
+		self.tables.clear()
+
+	def stats(self):
+		'''Reports the cache statistics
+
+		Arguments:
+			None
+
+		Usage:
+			stats = db.cacheStats()
+
+		returns a dictionary of the size, capacity, hits, misses, hit ratio, evictions and invalidations'''
+		lookups = self.hits + self.misses
+		return {"size": len(self.results), "capacity": self.size, "hits": self.hits, "misses": self.misses,
+			"hit_ratio": float(self.hits) / lookups if lookups else 0.0, "evictions": self.evictions, "invalidations": self.invalidations}
@@ -3,46 +3,360 @@
 # Provides the ExecutionCursor and Transaction classes
 
 import csv
+import sqlite3
+import array
+import gzip
+import os
+import time
+from collections import OrderedDict
+
+from sqlstring import SQLString
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+try:
+	array.array("q")
+	INTEGER_TYPECODE = "q"
+except ValueError:
+	INTEGER_TYPECODE = "l"
+
+TYPECODES = {"INTEGER": INTEGER_TYPECODE, "REAL": "d", "NUMERIC": "d"}
+
+class BufferedCursor(object):
+	'''Cursor-like object over rows that were already fetched, used once the connection has been released'''
+	def __init__(self, cursor, rows = None):
+		'''Creates the BufferedCursor object, fetching every remaining row of the cursor
+
+		Arguments:
+			cursor - sqlite3.Cursor instance
+			rows - rows already fetched from the cursor (optional, the remaining rows are fetched otherwise)
+
+		Usage:
+			results = ExecutionCursor(BufferedCursor(cursor))
+
+		returns the BufferedCursor object'''
+		self.source = getattr(cursor, "source", cursor) # sqlite3.Row needs the underlying sqlite3.Cursor
+		if rows is None:
+			rows = cursor.fetchall() if cursor.description else []
+		self.rows = rows
+		self.description, self.rowcount, self.lastrowid = cursor.description, cursor.rowcount, cursor.lastrowid
+		self.position, self.arraysize, self.row_factory = 0, 1, None
+
+	def __iter__(self):
+		'''Iterates over the remaining rows'''
+		return iter(self.fetchall())
+
+	def replay(self):
+		'''Creates another BufferedCursor over the same rows, starting from the first row
+
+		Arguments:
+			None
+
+		Usage:
+			results = ExecutionCursor(cached.replay())
+
+		returns a BufferedCursor object'''
+		cursor = BufferedCursor(self.source, self.rows)
+		cursor.description, cursor.rowcount, cursor.lastrowid = self.description, self.rowcount, self.lastrowid
+		return cursor
+
+	def fetchmany(self, size = None):
+		'''Fetches the next rows (see sqlite3.Cursor.fetchmany)'''
+		end = self.position + (size or self.arraysize)
+		rows, self.position = self.rows[self.position:end], min(end, len(self.rows))
+		if self.row_factory:
+			rows = [self.row_factory(self.source, row) for row in rows]
+		return rows
+
+	def fetchone(self):
+		'''Fetches the next row (see sqlite3.Cursor.fetchone)'''
+		rows = self.fetchmany(1)
+		return rows[0] if rows else None
+
+	def fetchall(self):
+		'''Fetches the remaining rows (see sqlite3.Cursor.fetchall)'''
+		return self.fetchmany(len(self.rows) - self.position)
+
+class ChainedCursor(object):
+	'''Cursor-like object that reads the results of several statements one after the other, executing each one lazily'''
+	def __init__(self, cursors):
+		'''Creates the ChainedCursor object, executing the first statement
+
+		Arguments:
+			cursors - iterable of executed sqlite3.Cursor instances
+
+		Usage:
+			results = ExecutionCursor(ChainedCursor(db.execute(query, values).cursor for values in chunks))
+
+		returns the ChainedCursor object'''
+		self.cursors = iter(cursors)
+		self.current = next(self.cursors, None)
+		self.source = getattr(self.current, "source", self.current)
+		self.description = self.current.description if self.current else None
+		self.rowcount, self.lastrowid = (self.current.rowcount, self.current.lastrowid) if self.current else (-1, None)
+		self.arraysize, self.row_factory = 1, None
+
+	def __iter__(self):
+		'''Iterates over the remaining rows'''
+		while True:
+			rows = self.fetchmany()
+			if not rows:
+				break
+			for row in rows:
+				yield row
+
+	def advance(self):
+		'''Internal function --- moves on to the next statement
+
+		Arguments:
+			None
+
+		Usage:
+			cursor.advance()
+
+		returns whether or not there was another statement'''
+		self.current = next(self.cursors, None)
+		if self.current is None:
+			return False
+		if self.current.rowcount >= 0:
+			self.rowcount = max(self.rowcount, 0) + self.current.rowcount
+		self.lastrowid = self.current.lastrowid
+		return True
+
+	def fetchmany(self, size = None):
+		'''Fetches the next rows (see sqlite3.Cursor.fetchmany)'''
+		size = size or self.arraysize
+		rows = []
+		while self.current is not None and len(rows) < size:
+			self.current.row_factory = self.row_factory
+			fetched = self.current.fetchmany(size - len(rows))
+			if fetched:
+				rows.extend(fetched)
+			elif not self.advance():
+				break
+		return rows
+
+	def fetchone(self):
+		'''Fetches the next row (see sqlite3.Cursor.fetchone)'''
+		rows = self.fetchmany(1)
+		return rows[0] if rows else None
+
+	def fetchall(self):
+		'''Fetches the remaining rows (see sqlite3.Cursor.fetchall)'''
+		rows = []
+		while True:
+			fetched = self.fetchmany(1000)
+			if not fetched:
+				return rows
+			rows.extend(fetched)
 
 class ExecutionCursor(object):
 	'''Provides additional functionality to the ExecutionCursor object'''
-	def __init__(self, cursor):
+	chunk_size = 1000
+
+	def __init__(self, cursor, chunk_size = None):
 		self.cursor = cursor
 		self.fetchall, self.fetchone, self.description = self.cursor.fetchall, self.cursor.fetchone, self.cursor.description
 		self.fetched = None
+		if chunk_size:
+			self.chunk_size = chunk_size
+
+	def __iter__(self):
+		'''Iterates over the rows lazily, as dictionaries
+
+		see ExecutionCursor.iterate for further reference'''
+		return self.iterate()
+
+	def columnNames(self):
+		'''Retrieves the column names of the results
+
+		Arguments:
+			None
+
+		Usage:
+			columns = db.select("users").columnNames()
+
+		returns a list of column names'''
+		return [column[0] for column in self.cursor.description] if self.cursor.description else []
+
+	def chunks(self, chunk_size = None):
+		'''Fetches the rows from the cursor in chunks
+
+		Arguments:
+			chunk_size - number of rows to fetch at once (defaults to ExecutionCursor.chunk_size)
+
+		Usage:
+			for rows in db.select("users").chunks(5000):
+				process(rows)
+
+		returns a generator of lists of rows'''
+		self.cursor.arraysize = chunk_size or self.chunk_size
+		while True:
+			rows = self.cursor.fetchmany()
+			if not rows:
+				break
+			yield rows
+
+	def useRows(self):
+		'''Internal function --- makes the cursor return compact sqlite3.Row objects
+
+		Each row keeps its values in a tuple and shares the column names of the result set, so it is
+		much smaller than a dictionary while still supporting row["column"] and row[index] access
+
+		Arguments:
+			None
+
+		Usage:
+			cursor.useRows()
+
+		returns None'''
+		self.cursor.row_factory = sqlite3.Row
+
+	def iterate(self, type = dict, chunk_size = None):
+		'''Iterates over the rows lazily, so only one chunk is held in memory at a time
+
+		Arguments:
+			type - type of each row (dict, "row", list)
+			chunk_size - number of rows to fetch at once (defaults to ExecutionCursor.chunk_size)
+
+		Usage:
+			for user in db.select("users"):
+				print(user["username"])
+			for user in db.select("users").iterate(list, 5000):
+				print(user[1])
+
+		returns a generator of rows'''
+		columns = self.columnNames()
+		if type == "row":
+			self.useRows()
+		for rows in self.chunks(chunk_size):
+			if type == dict:
+				for row in rows:
+					yield dict(zip(columns, row))
+			else:
+				for row in rows:
+					yield row
+
+	def fetchColumns(self, types = None, chunk_size = None, use_numpy = True):
+		'''Fetches the results one column at a time, filling a typed array per column chunk by chunk
+
+		Arguments:
+			types - dictionary of column names and declared types, used to pick each array type
+				(optional, the types are guessed from the first values otherwise)
+			chunk_size - number of rows to fetch at once (defaults to ExecutionCursor.chunk_size)
+			use_numpy - whether or not to return NumPy arrays when NumPy is available (defaults to True)
+
+		INTEGER columns become arrays of 64-bit integers and REAL or NUMERIC columns become arrays of doubles
+		(NULL values are stored as NaN). Any other column is returned as a list, or as a NumPy object array.
+
+		Usage:
+			columns = db.select("readings").fetchColumns({"time": "INT", "value": "REAL"})
+			mean = sum(columns["value"]) / len(columns["value"])
+
+		returns an ordered dictionary of column names and arrays'''
+		names, types = self.columnNames(), types or {}
+		columns = [None] * len(names)
+		for rows in self.chunks(chunk_size):
+			for position, values in enumerate(zip(*rows)):
+				columns[position] = self.extendColumn(columns[position], values, types.get(names[position]))
+		columns = [column if column is not None else self.extendColumn(None, (), types.get(name)) for name, column in zip(names, columns)]
+		if use_numpy and numpy is not None:
+			columns = [numpy.frombuffer(column, dtype = column.typecode) if isinstance(column, array.array) and len(column)
+				else numpy.array(column, dtype = column.typecode if isinstance(column, array.array) else object) for column in columns]
+		return OrderedDict(zip(names, columns))
+
+	@staticmethod
+	def extendColumn(column, values, declared = None):
+		'''Internal function --- appends values to a column array, falling back to a wider type if they do not fit
+
+		Arguments:
+			column - array.array or list to extend (None to create a new one)
+			values - sequence of values to append
+			declared - declared type of the column (optional)
+
+		Usage:
+			column = ExecutionCursor.extendColumn(column, (1, 2, 3), "INT")
+
+		returns the extended column (which may be a new object)'''
+		if column is None:
+			if declared:
+				typecode = TYPECODES.get(SQLString.affinity(declared))
+			else:
+				first = next((value for value in values if value is not None), None)
+				typecode = "d" if isinstance(first, float) else INTEGER_TYPECODE if isinstance(first, (int, long)) else None
+			column = array.array(typecode) if typecode else []
+		if isinstance(column, list):
+			column.extend(values)
+			return column
+		length = len(column)
+		try:
+			column.extend(values)
+			return column
+		except (TypeError, OverflowError):
+			del column[length:]
+		if not all(value is None or isinstance(value, (int, long, float)) for value in values):
+			return ExecutionCursor.extendColumn(column.tolist(), values)
+		if column.typecode != "d":
+			column = array.array("d", column)
+		column.extend(float("nan") if value is None else value for value in values)
+		return column
 
 	def fetch(self, type_fetch = "all", type = dict):
 		'''Fetches columns from the cursor
 
 		Arguments:
 			type_fetch - how many to fetch (all, one)
-			type - type of fetch (dict, list)
+			type - type of fetch (dict, "row", list)
 
 		Usage:
 			users = db.select("users").fetch()
+			users = db.select("users").fetch(type = "row") # compact rows, accessed by name or position
 			
 		returns query results in specified format'''
 		if self.fetched:
 			return self.fetched
+		if type == "row":
+			self.useRows()
 		rows = self.cursor.fetchall() if type_fetch == "all" else [self.cursor.fetchone()]
 		if type == dict:
-			return_value =  [{column[0]: row[index] for index, column in enumerate(self.cursor.description)} for row in rows]
+			columns = self.columnNames()
+			return_value =  [dict(zip(columns, row)) for row in rows]
 		else:
 			return_value =  rows
 		self.fetched = return_value
 		return return_value
 
-	def export(self, filepath = "sqlite_export.csv"):
-		'''Exports the results to a CSV (Comma separated values) file
+	def export(self, filepath = "sqlite_export.csv", chunk_size = None, buffer_size = 1 << 20, compress = None):
+		'''Exports the results to a CSV (Comma separated values) file, streaming them one chunk at a time
 
 		Arguments:
 			filepath - path of the CSV file(defaults to "sqlite_export.csv")
+			chunk_size - number of rows to fetch and write at once (defaults to ExecutionCursor.chunk_size)
+			buffer_size - size of the file write buffer in bytes (defaults to 1 MB)
+			compress - whether or not to gzip the file as it is written (defaults to True if the path ends with .gz)
 
 		Usage:
 			db.select("users").export("mytable.csv")
+			db.select("users").export("mytable.csv.gz", chunk_size = 10000)
 
-		returns None'''
-		with open(filepath, 'wb') as csv_file:
+		returns a dictionary of the path, rows and bytes written, the elapsed seconds, and the rows per second'''
+		if compress is None:
+			compress = filepath.endswith(".gz")
+		start, rows = time.time(), 0
+		raw_file = open(filepath, 'wb', buffer_size)
+		csv_file = gzip.GzipFile(fileobj = raw_file, mode = 'wb', compresslevel = 6) if compress else raw_file
+		try:
 			csv_writer = csv.writer(csv_file)
 			csv_writer.writerow([header[0] for header in self.description])
-			csv_writer.writerows(self.cursor)
+			for chunk in self.chunks(chunk_size):
+				csv_writer.writerows(chunk)
+				rows += len(chunk)
+		finally:
+			csv_file.close()
+			raw_file.close()
+		elapsed = time.time() - start
+		return {"path": filepath, "rows": rows, "bytes": os.path.getsize(filepath), "seconds": elapsed,
+			"rows_per_second": rows / elapsed if elapsed else 0.0}
@@ -2,14 +2,51 @@
 # wire/database.py
 # The Database class is a wrapper for the sqlite3.Connection class
 
+import os
+import sys
 import sqlite3
 import atexit
-
-from sqlstring import SQLString
-from cursor import ExecutionCursor
+import time
+import itertools
+import json
+import random
+import re
+from contextlib import contextmanager
+
+try:
+	from urllib.request import pathname2url
+except ImportError:
+	from urllib import pathname2url
+
+from sqlstring import SQLString, SET_TYPES
+from cursor import ExecutionCursor, ChainedCursor
+from table import Table
+from schema import SchemaCache
+from cache import ResultCache
+from instrument import Instrumentation
+from advisor import IndexAdvisor
+
+COMMIT_MODES = ("statement", "count", "time", "manual")
+PROFILES = {
+	"oltp": {"journal_mode": "WAL", "synchronous": "NORMAL", "cache_size": -65536, "mmap_size": 268435456, "temp_store": "MEMORY",
+		"page_size": 4096, "busy_timeout": 5000, "query_only": 0},
+	"bulk_load": {"journal_mode": "MEMORY", "synchronous": "OFF", "cache_size": -262144, "mmap_size": 0, "temp_store": "MEMORY",
+		"page_size": 65536, "busy_timeout": 30000, "query_only": 0},
+	"read_only_analytics": {"journal_mode": "WAL", "synchronous": "NORMAL", "cache_size": -262144, "mmap_size": 1073741824,
+		"temp_store": "MEMORY", "page_size": 65536, "busy_timeout": 5000, "query_only": 1},
+	"durable": {"journal_mode": "DELETE", "synchronous": "FULL", "cache_size": -16384, "mmap_size": 0, "temp_store": "DEFAULT",
+		"page_size": 4096, "busy_timeout": 10000, "query_only": 0}
+}
+PRAGMA_ORDER = {"page_size": 0, "journal_mode": 1, "query_only": 3} # the page size must be set before WAL mode, and query_only last
+SETTINGS = ("journal_mode", "synchronous", "cache_size", "mmap_size", "temp_store", "page_size", "busy_timeout", "query_only")
+SETTING_NAMES = {"synchronous": ("OFF", "NORMAL", "FULL", "EXTRA"), "temp_store": ("DEFAULT", "FILE", "MEMORY")}
+VALUE_SETS = itertools.count(1)
+WRITABLE_PRAGMAS = re.compile(r"\s*PRAGMA\s+(?:\w+\.)?(?:query_only|journal_mode)\s*[=(]", re.IGNORECASE) # refused by ReadOnlyDatabase
 
 class Database(sqlite3.Connection):
 	'''Database interface for SQLite'''
+	close_at_exit = True
+
 	def __init__(self, path, *args, **kwargs):
 		'''Opens an SQLite database (or creates it if it does not exist)
 
@@ -19,14 +56,31 @@ class Database(sqlite3.Connection):
 		Usage:
 			db = Database("test.db")
 
+		A tuning profile (see Database.setProfile) can be applied with the profile keyword argument
+
 		returns a Database (wrapper to sqlite3.Connection) object'''
+		profile = kwargs.pop("profile", None)
 		sqlite3.Connection.__init__(self, path, *args, **kwargs)
 		self.path = path
 		self.cursors = {}
 		self.reset_counter = 0
 		self.defaultTable = None
 		self.debug = False
-		atexit.register(self.close)
+		self.commit_mode, self.commit_every, self.commit_interval = "statement", 1, 0
+		self.batch_depth = 0
+		self.transaction_open, self.savepoints = False, 0
+		self.statements, self.commits, self.pending = 0, 0, 0
+		self.last_commit = time.time()
+		self.insert_stats = None
+		self.schema = SchemaCache(self)
+		self.result_cache = None
+		self.instrumentation = None
+		self.index_advisor = None
+		self.write_behind = None
+		if self.close_at_exit:
+			atexit.register(self.close)
+		if profile:
+			self.setProfile(profile)
 
 	def toggle(self, option):
 		'''Toggles an option
@@ -42,6 +96,278 @@ class Database(sqlite3.Connection):
 		setattr(self, option, new_value)
 		return new_value
 
+	def setCommitPolicy(self, mode = "statement", every = 1, interval = 0):
+		'''Sets when Database.execute commits its changes
+
+		Arguments:
+			mode - one of "statement" (commit after every statement, the default), "count" (commit every N statements),
+				"time" (commit once T milliseconds have passed since the last commit), or "manual" (only commit explicitly).
+				In "time" mode, the check runs when a statement is executed, so the last statements stay uncommitted (and the
+				database stays locked for other writers) until another statement runs or Database.commit is called
+			every - number of statements per commit (for "count")
+			interval - milliseconds between commits (for "time")
+
+		Usage:
+			db.setCommitPolicy("count", every = 500)
+			db.setCommitPolicy("time", interval = 250)
+
+		returns None'''
+		if mode not in COMMIT_MODES:
+			raise ValueError('Commit mode must be one of {modes}'.format(modes = ', '.join(COMMIT_MODES)))
+		self.commit_mode, self.commit_every, self.commit_interval = mode, max(int(every), 1), interval
+
+	def autocommit(self):
+		'''Internal function --- records an executed statement and commits it if the commit policy requires it
+
+		Arguments:
+			None
+
+		Usage:
+			db.autocommit()
+
+		returns True if the changes were committed or False'''
+		self.statements += 1
+		self.pending += 1
+		if self.batch_depth or self.commit_mode == "manual":
+			return False
+		if self.commit_mode == "count" and self.pending < self.commit_every:
+			return False
+		if self.commit_mode == "time" and (time.time() - self.last_commit) * 1000 < self.commit_interval:
+			return False
+		self.commit()
+		return True
+
+	def commit(self):
+		'''Commits the current transaction
+
+		see sqlite3.Connection.commit for further reference'''
+		sqlite3.Connection.commit(self)
+		if self.pending:
+			self.commits += 1
+			self.pending = 0
+		self.last_commit = time.time()
+
+	def rollback(self):
+		'''Rolls back the current transaction, discarding any statements deferred by the commit policy
+
+		The result cache is cleared, since it may hold rows that were rolled back
+
+		see sqlite3.Connection.rollback for further reference'''
+		sqlite3.Connection.rollback(self)
+		self.pending = 0
+		if self.result_cache is not None:
+			self.result_cache.clear()
+		if self.transaction_open:
+			self.cursor().execute("BEGIN") # the rest of the batch still runs in a transaction
+
+	@contextmanager
+	def batch(self):
+		'''Defers all commits until the end of the block, regardless of the commit policy
+
+		The block runs in a transaction begun explicitly (unless one is already open), so that the statements grouped inside it
+		(such as Database.insertMany) can be undone on their own with a savepoint. Statements left uncommitted by the commit
+		policy are committed when the block begins. If the block raises an exception, its statements are rolled back instead
+		(a batch inside another batch is rolled back with the outer one, if the exception reaches it)
+
+		Arguments:
+			None
+
+		Usage:
+			with db.batch():
+				for user in users:
+					db.insert("users", **user)
+
+		returns a context manager'''
+		self.batch_depth += 1
+		previous_isolation = begun = failed = False
+		try:
+			if self.batch_depth == 1 and not self.transaction_open:
+				self.commit()
+				previous_isolation, self.isolation_level = self.isolation_level, None
+				begun = self.transaction_open = True
+				self.cursor().execute("BEGIN")
+			yield self
+		except Exception:
+			failed = True
+			raise
+		finally:
+			self.batch_depth -= 1
+			if not self.batch_depth:
+				try:
+					if failed:
+						self.transaction_open = self.transaction_open and not begun # no new transaction after the rollback
+						self.rollback()
+					else:
+						self.commit()
+				finally:
+					if begun:
+						self.isolation_level, self.transaction_open = previous_isolation, False
+
+	@contextmanager
+	def atomicBatch(self):
+		'''Internal function --- defers commits until the end of the block, undoing its statements if it raises an exception
+
+		On its own, the block is rolled back. Inside another batch or a transaction, only the statements of the block are rolled
+		back (with a savepoint), so that earlier writes are kept
+
+		Arguments:
+			None
+
+		Usage:
+			with db.atomicBatch():
+				db.executeChunks(cursor, query, rows, 500)
+
+		returns a context manager'''
+		with self.batch():
+			if self.batch_depth == 1:
+				yield self # rolled back by the batch
+			else:
+				cursor, name = self.cursor(), "wire_{number}".format(number = self.savepoints)
+				cursor.execute("SAVEPOINT {name}".format(name = name))
+				self.savepoints += 1
+				try:
+					yield self
+				except Exception:
+					cursor.execute("ROLLBACK TO {name}".format(name = name))
+					if self.result_cache is not None:
+						self.result_cache.clear()
+					raise
+				finally:
+					cursor.execute("RELEASE {name}".format(name = name))
+					self.savepoints -= 1
+
+	@contextmanager
+	def pragmas(self, **values):
+		'''Sets PRAGMA values for the duration of the block, restoring the previous values at the end
+
+		Arguments:
+			**values - dictionary of PRAGMA names and values {pragma_name: value, ...}
+
+		Usage:
+			with db.pragmas(synchronous = "OFF", journal_mode = "MEMORY"):
+				db.insertMany("users", rows)
+
+		returns a context manager'''
+		previous = []
+		try:
+			for name, value in sorted(values.items(), key = lambda item: PRAGMA_ORDER.get(item[0], 2)):
+				current = self.pragma(name).fetch(type = list)[0][0]
+				self.pragma("{name} = {value}".format(name = name, value = value))
+				previous.append((name, current))
+			yield self
+		finally:
+			for name, value in reversed(previous):
+				self.pragma("{name} = {value}".format(name = name, value = value))
+
+	def setProfile(self, name, **overrides):
+		'''Applies a named set of PRAGMA values, tuned for a kind of workload
+
+		The profiles (see PROFILES) are "oltp" (WAL, NORMAL sync, 64 MB cache and 256 MB mmap), "bulk_load" (in-memory journal,
+		no sync and a 256 MB cache), "read_only_analytics" (query_only, 256 MB cache and 1 GB mmap) and "durable" (rollback journal and
+		FULL sync). The page size only changes for a new database, or after a VACUUM outside of WAL mode
+
+		Arguments:
+			name - name of the profile
+			**overrides - PRAGMA values to use instead of the profile's
+
+		Usage:
+			db.setProfile("oltp", cache_size = -131072)
+
+		returns a dictionary of the effective settings (see Database.settings)'''
+		values = self.profileValues(name, overrides)
+		self.commit()
+		for pragma, value in sorted(values.items(), key = lambda item: PRAGMA_ORDER.get(item[0], 2)):
+			self.pragma("{name} = {value}".format(name = pragma, value = value))
+		return self.settings()
+
+	@contextmanager
+	def profile(self, name, **overrides):
+		'''Applies a profile for the duration of the block, restoring the previous PRAGMA values at the end
+
+		Arguments:
+			name - name of the profile (see Database.setProfile)
+			**overrides - PRAGMA values to use instead of the profile's
+
+		Usage:
+			with db.profile("bulk_load"):
+				db.insertMany("events", rows)
+
+		returns a context manager'''
+		values = self.profileValues(name, overrides)
+		self.commit()
+		with self.pragmas(**values):
+			yield self
+
+	@staticmethod
+	def profileValues(name, overrides):
+		'''Internal function --- retrieves the PRAGMA values of a profile
+
+		Arguments:
+			name - name of the profile
+			overrides - dictionary of PRAGMA values to use instead of the profile's
+
+		Usage:
+			values = Database.profileValues("oltp", {"cache_size": -131072})
+
+		returns a dictionary of PRAGMA names and values'''
+		if name not in PROFILES:
+			raise ValueError('Profile must be one of {profiles}'.format(profiles = ', '.join(sorted(PROFILES))))
+		values = dict(PROFILES[name])
+		values.update(overrides)
+		return values
+
+	def settings(self):
+		'''Reports the effective values of the tuning PRAGMAs
+
+		Arguments:
+			None
+
+		Usage:
+			settings = db.settings() # {"journal_mode": "wal", "synchronous": "NORMAL", "cache_size": -65536, ...}
+
+		returns a dictionary of the journal_mode, synchronous, cache_size, mmap_size, temp_store, page_size, busy_timeout and query_only'''
+		settings = {}
+		for name in SETTINGS:
+			rows = self.schema.query("SELECT * FROM pragma_{name}".format(name = name), "PRAGMA {name}".format(name = name))
+			value = rows[0][0] if rows else None
+			if name in SETTING_NAMES and isinstance(value, int):
+				value = SETTING_NAMES[name][value]
+			settings[name] = value
+		return settings
+
+	def commitStats(self):
+		'''Reports how many statements have been executed and committed
+
+		Arguments:
+			None
+
+		Usage:
+			stats = db.commitStats()
+
+		returns a dictionary of statements, commits, pending (uncommitted) statements and statements per commit'''
+		committed = self.statements - self.pending
+		return {"statements": self.statements, "commits": self.commits, "pending": self.pending,
+			"statements_per_commit": float(committed) / self.commits if self.commits else 0.0}
+
+	def close(self):
+		'''Closes the database, committing any statements deferred by the commit policy or queued in the background writer
+
+		see sqlite3.Connection.close for further reference'''
+		if self.write_behind is not None:
+			self.write_behind.close()
+		if self.pending and self.commit_mode != "manual":
+			self.commit()
+		sqlite3.Connection.close(self)
+
+	@staticmethod
+	def openReadOnly(path, mmap = True, immutable = False, **kwargs):
+		'''Opens an existing SQLite database for reading only
+
+		see ReadOnlyDatabase for further reference
+
+		returns a ReadOnlyDatabase object'''
+		return ReadOnlyDatabase(path, mmap, immutable, **kwargs)
+
 	@staticmethod
 	def create(name, file_path):
 		'''Creates an SQLite database from an SQL file
@@ -70,6 +396,18 @@ class Database(sqlite3.Connection):
 		returns an sqlite3.Cursor'''
 		return self.cursor()
 
+	def statementCursor(self):
+		'''Internal function --- creates a cursor on the connection, for the statements of internal functions
+
+		Arguments:
+			None
+
+		Usage:
+			cursor = db.statementCursor()
+
+		returns an sqlite3.Cursor'''
+		return self.cursor()
+
 	def purgeCursors(self):
 		'''Deletes all of the stored cursors --- deprecated but maintained for backwards compatability
 
@@ -82,17 +420,23 @@ class Database(sqlite3.Connection):
 		returns None'''
 		return None
 
-	def transaction(self):
+	def transaction(self, retries = 10, backoff = 0.005, max_backoff = 0.5):
 		'''Starts a new database transaction
 
 		Arguments:
-			None
+			see Transaction for further reference
 
 		Usage:
+			with db.transaction() as trans:
+				trans.insert("users", id = 1, username = "panchr")
+				trans.insertMany("users", ((index, "user") for index in range(2, 100)))
+
 			trans = db.transaction()
+			trans.execute("DELETE FROM users")
+			trans.commit()
 
 		returns a Transaction object'''
-		return Transaction(self)
+		return Transaction(self, retries, backoff, max_backoff)
 
 	def execute(self, cmd, *args, **kwargs):
 		'''Executes an SQL command
@@ -107,8 +451,11 @@ class Database(sqlite3.Connection):
 		if self.debug:
 			print(cmd, args, kwargs)
 		exec_cursor = self.cursor()
-		exec_cursor.execute(cmd, *args, **kwargs)
-		self.commit()
+		if self.instrumentation is None:
+			exec_cursor.execute(cmd, *args, **kwargs)
+		else:
+			exec_cursor = self.instrumentation.execute(exec_cursor, cmd, *args, **kwargs)
+		self.autocommit()
 		return ExecutionCursor(exec_cursor)
 
 	def query(self, cmd, *args, **kwargs):
@@ -158,6 +505,7 @@ class Database(sqlite3.Connection):
 		exec_cursor = self.cursor()
 		exec_cursor.executescript(sql_script)
 		self.commit()
+		self.schema.invalidate()
 		return ExecutionCursor(exec_cursor)
 
 	def count(self):
@@ -184,6 +532,147 @@ class Database(sqlite3.Connection):
 		returns None'''
 		self.reset_counter = self.count()
 
+	def statementCacheStats(self):
+		'''Reports the statistics of the compiled statement cache used by insert, update, select and delete
+
+		The cache is shared by every Database (and thread) of the process, so the statistics are process-wide
+
+		Arguments:
+			None
+
+		Usage:
+			stats = db.statementCacheStats()
+
+		returns a dictionary of the size, capacity, hits, misses and evictions'''
+		return SQLString.cache.stats()
+
+	def enableCache(self, size = 256, ttl = None, max_rows = 10000):
+		'''Caches the results of Database.select, keyed by the query and its values
+
+		Cached results are invalidated when insert, insertMany, update or delete change their table. Any other change
+		(a raw query, a trigger, a schema change or a commit by another connection) clears the whole cache
+
+		Arguments:
+			size - maximum number of results to keep (defaults to 256)
+			ttl - seconds a result stays valid (defaults to no limit)
+			max_rows - largest result to cache, in rows (defaults to 10000)
+
+		Usage:
+			db.enableCache(1024, ttl = 60)
+			countries = db.select("countries").fetch() # executed
+			countries = db.select("countries").fetch() # served from the cache
+
+		returns the ResultCache object'''
+		self.result_cache = ResultCache(self, size, ttl, max_rows)
+		return self.result_cache
+
+	def disableCache(self):
+		'''Stops caching the results of Database.select
+
+		Arguments:
+			None
+
+		Usage:
+			db.disableCache()
+
+		returns None'''
+		self.result_cache = None
+
+	def cacheStats(self):
+		'''Reports the statistics of the result cache
+
+		Arguments:
+			None
+
+		Usage:
+			stats = db.cacheStats()
+
+		returns a dictionary of the size, capacity, hits, misses, hit ratio, evictions and invalidations (or None if the cache is disabled)'''
+		return self.result_cache.stats() if self.result_cache is not None else None
+
+	def instrument(self, slow_threshold = 0.1, explain = True, samples = 1000, slow_log_size = 100):
+		'''Starts recording the time and rows of every statement, and logging slow statements with their query plans
+
+		Arguments:
+			see Instrumentation for further reference
+
+		Usage:
+			db.instrument(slow_threshold = 0.05)
+			users = db.select("users").fetch()
+			print(db.queryStats())
+
+		returns the Instrumentation object'''
+		self.instrumentation = Instrumentation(self, slow_threshold, explain, samples, slow_log_size)
+		return self.instrumentation
+
+	def uninstrument(self):
+		'''Stops recording statements
+
+		Arguments:
+			None
+
+		Usage:
+			db.uninstrument()
+
+		returns None'''
+		self.instrumentation = None
+
+	def queryStats(self):
+		'''Reports the timing statistics of each statement shape
+
+		see Instrumentation.stats for further reference (returns None if the database is not instrumented)'''
+		return self.instrumentation.stats() if self.instrumentation is not None else None
+
+	def slowQueries(self):
+		'''Retrieves the slow-query log
+
+		see Instrumentation.slowQueries for further reference (returns None if the database is not instrumented)'''
+		return self.instrumentation.slowQueries() if self.instrumentation is not None else None
+
+	def enableIndexAdvisor(self):
+		'''Starts observing the filters of select, update and delete, to recommend indexes
+
+		Arguments:
+			None
+
+		Usage:
+			advisor = db.enableIndexAdvisor()
+			... # run the application
+			for index in advisor.recommend():
+				print(index["sql"], index["calls"], index["estimated_rows_saved"])
+
+		returns the IndexAdvisor object'''
+		if self.index_advisor is None:
+			self.index_advisor = IndexAdvisor(self)
+		return self.index_advisor
+
+	def disableIndexAdvisor(self):
+		'''Stops observing the filters of select, update and delete
+
+		Arguments:
+			None
+
+		Usage:
+			db.disableIndexAdvisor()
+
+		returns None'''
+		self.index_advisor = None
+
+	def tableChanged(self, table, results):
+		'''Internal function --- invalidates the cached results of a table after a write
+
+		Arguments:
+			table - table name
+			results - ExecutionCursor of the write, or the number of changed rows
+
+		Usage:
+			db.tableChanged("users", results)
+
+		returns None'''
+		if self.result_cache is not None:
+			changed = results.cursor.rowcount if isinstance(results, ExecutionCursor) else results
+			self.result_cache.invalidate(table, changed)
+
 	def checkIntegrity(self, max_errors = 100):
 		'''Checks the Database Integrity 
 
@@ -217,12 +706,10 @@ class Database(sqlite3.Connection):
 		Usage:
 			tables = db.tables()
 
+		The names are cached until the schema changes (see SchemaCache)
+
 		returns a list of table names'''
-		if temp:
-			query = "SELECT name FROM (SELECT * FROM sqlite_master UNION SELECT * FROM sqlite_temp_master) WHERE type = 'table' ORDER BY name"
-		else:
-			query = "SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name"
-		names = map(lambda item: item["name"], self.execute(query).fetch())
+		names = self.schema.tables(temp)
 		return map(lambda table: Table(self, table, False), names) if objects else names
 
 	def table(self, name, verify = True):
@@ -248,7 +735,7 @@ class Database(sqlite3.Connection):
 			table_exists = db.tableExists("users")
 
 		returns True if the table exists or False'''
-		return name in self.tables(temp = temp)
+		return self.schema.exists(name, temp)
 
 	def setTable(self, table):
 		'''Sets the default table to use for queries
@@ -273,7 +760,9 @@ class Database(sqlite3.Connection):
 
 		see Table.drop for further reference'''
 		query = SQLString.dropTable(name)
-		return self.execute(query)
+		results = self.execute(query)
+		self.schema.invalidate()
+		return results
 
 	def insert(self, table = None, **columns):
 		'''Insert rows into the table
@@ -289,7 +778,144 @@ class Database(sqlite3.Connection):
 		if not table:
 			table = self.defaultTable
 		query, values = SQLString.insert(table, **columns)
-		return self.execute(query, values)
+		results = self.execute(query, values)
+		self.tableChanged(table, results)
+		return results
+
+	def insertMany(self, table = None, rows = (), columns = None, chunk_size = 1000):
+		'''Inserts many rows into the table in a single transaction
+
+		Arguments:
+			table - table name to insert into
+			rows - iterable (or generator) of rows, each either a dictionary {column_name: value, ...} or a tuple of values
+			columns - list of column names (optional, defaults to the keys of the first dictionary or every column in the table)
+			chunk_size - number of rows passed to each executemany call (defaults to 1000)
+
+		Usage:
+			db.insertMany("users", [{"id": 1, "username": "panchr"}, {"id": 2, "username": "wire"}])
+			db.insertMany("users", ((index, "user") for index in range(1000000)), columns = ["id", "username"])
+
+		The rows are consumed one chunk at a time, so the input is never held in memory as a whole. If a row fails, the
+		rows inserted so far are rolled back, but not the earlier writes of an enclosing batch (see Database.atomicBatch).
+		The number of rows, elapsed time and rows per second are stored in Database.insert_stats
+
+		returns an ExecutionCursor object'''
+		if not table:
+			table = self.defaultTable
+		start = time.time()
+		exec_cursor = self.cursor()
+		query, rows = self.insertRows(table, rows, columns)
+		if query is None:
+			return ExecutionCursor(exec_cursor)
+		with self.atomicBatch():
+			inserted = self.executeChunks(exec_cursor, query, rows, chunk_size)
+		elapsed = time.time() - start
+		self.insert_stats = {"rows": inserted, "seconds": elapsed, "rows_per_second": inserted / elapsed if elapsed else 0.0}
+		self.tableChanged(table, inserted)
+		return ExecutionCursor(exec_cursor)
+
+	def insertRows(self, table, rows, columns = None):
+		'''Internal function --- generates the INSERT query for a stream of rows
+
+		Arguments:
+			table - table name to insert into
+			rows - iterable of rows (see Database.insertMany)
+			columns - list of column names (optional)
+
+		Usage:
+			query, rows = db.insertRows("users", [{"id": 1, "username": "panchr"}])
+
+		returns the query and a generator of value tuples (or None and None if there are no rows)'''
+		rows = iter(rows)
+		try:
+			first = next(rows)
+		except StopIteration:
+			return None, None
+		rows = itertools.chain([first], rows)
+		if isinstance(first, dict):
+			if not columns:
+				columns = list(first.keys())
+			rows = (tuple(row[column] for column in columns) for row in rows)
+		return SQLString.insertMany(table, columns, len(columns) if columns else len(first)), rows
+
+	def executeChunks(self, cursor, query, rows, chunk_size):
+		'''Internal function --- executes a query for a stream of rows, one executemany call per chunk
+
+		Arguments:
+			cursor - sqlite3.Cursor instance
+			query - SQL query
+			rows - iterable of value tuples
+			chunk_size - number of rows per executemany call
+
+		Usage:
+			inserted = db.executeChunks(db.cursor(), *db.insertRows("users", rows), chunk_size = 1000)
+
+		returns the number of rows'''
+		executed = 0
+		while True:
+			chunk = list(itertools.islice(rows, chunk_size))
+			if not chunk:
+				break
+			if self.instrumentation is None:
+				cursor.executemany(query, chunk)
+			else:
+				self.instrumentation.executemany(cursor, query, chunk)
+			self.autocommit()
+			executed += len(chunk)
+		return executed
+
+	def writeBehind(self, **options):
+		'''Retrieves the background writer of the database, creating it on first use
+
+		Arguments:
+			**options - see WriteBehind (only used when the writer is created)
+
+		Usage:
+			writer = db.writeBehind(max_queue = 50000, overflow = "drop")
+			writer.insert("events", kind = "click", time = now)
+			writer.flush()
+
+		returns a WriteBehind object'''
+		if self.write_behind is None:
+			from writer import WriteBehind
+			self.write_behind = WriteBehind(self.path, **options)
+		return self.write_behind
+
+	def mirrorToMemory(self, tables = None, mode = "sync", interval = 1.0, **kwargs):
+		'''Loads the database (or some of its tables) into memory, to serve reads from there
+
+		The mirror uses its own connections, so writes made through this Database make it stale (see MemoryMirror.stats)
+
+		Arguments:
+			see MemoryMirror for further reference
+
+		Usage:
+			mirror = db.mirrorToMemory(tables = ["countries"], mode = "periodic", interval = 5)
+			countries = mirror.select("countries", order_by = "name").fetch()
+
+		returns a MemoryMirror object'''
+		from mirror import MemoryMirror
+		return MemoryMirror(self.path, tables, mode, interval, **kwargs)
+
+	def backup(self, target_path, pages_per_step = 1024, sleep = 0.005, progress = None, compress = False, **options):
+		'''Backs the database up to a file on a background thread, copying a few pages at a time so that writers are not blocked for long
+
+		Arguments:
+			see Backup for further reference (a connection as the target is copied directly, see sqlite3.Connection.backup)
+
+		Usage:
+			backup = db.backup("backups/test.db.gz", compress = True, progress = lambda copied, total: print(copied, total))
+			stats = backup.wait()
+
+		raises a ValueError if the target is a connection and sqlite3.Connection.backup is not available (before Python 3.7)
+
+		returns a Backup object'''
+		if isinstance(target_path, sqlite3.Connection):
+			if not hasattr(sqlite3.Connection, "backup"):
+				raise ValueError('Backing up into a connection needs sqlite3.Connection.backup (Python 3.7)')
+			return sqlite3.Connection.backup(self, target_path, pages = pages_per_step, progress = progress, sleep = sleep, **options)
+		from backup import Backup
+		return Backup(self.path, target_path, pages_per_step, sleep, progress, compress, **options)
 
 	def update(self, table = None, equal = None, like = None, where = "1 = 1", **columns):
 		'''Updates rows in the table
@@ -307,8 +933,16 @@ class Database(sqlite3.Connection):
 		returns an ExecutionCursor object'''
 		if not table:
 			table = self.defaultTable
-		query, values = SQLString.update(table, equal, like, where, **columns)
-		return self.execute(query, tuple(values))
+		if self.index_advisor is not None:
+			self.index_advisor.observe(table, {"equal": equal, "like": like, "where": where})
+		split = self.splitFilters(equal, len(columns) + len(like or ()))
+		if split:
+			results = self.executeSplit(lambda equal: SQLString.update(table, equal, like, where, **columns), equal, *split)
+		else:
+			query, values = SQLString.update(table, equal, like, where, **columns)
+			results = self.execute(query, tuple(values))
+		self.tableChanged(table, results)
+		return results
 
 	def select(self, table = None, **options):
 		'''Selects rows from the table
@@ -319,17 +953,47 @@ class Database(sqlite3.Connection):
 			equal - dictionary of columns and values to use in WHERE  + "=" clauses {column_name: value, ...}
 			like - dictionary of columns and values to use in WHERE + LIKE clauses (column_name: pattern, ...}
 			where - custom WHERE and/or LIKE clause(s)
+			parameters - values for the "?" placeholders in the custom WHERE clause
+			order_by - column name, or list of column names, to sort by (prefix a name with "-" to sort descending)
+			limit - maximum number of rows
+			offset - number of rows to skip
 
 		Usage:
 			query = db.select("users", columns = ALL, equal = {"id": 1}, like = {"username": "pan%"})
 			query = db.select("users", columns = ALL, where = "`ID` = 1 OR `USERNAME` LIKE 'pan%'")
+			query = db.select("users", where = "`id` > ?", parameters = (100,), order_by = ["-age", "id"], limit = 10)
 
 		returns an ExecutionCursor object'''
 		if not table:
 			table = self.defaultTable
+		if self.index_advisor is not None:
+			self.index_advisor.observe(table, options)
+		reserved = len(options.get("like") or ()) + len(options.get("parameters") or ()) + len([option for option in ("limit", "offset") if options.get(option) is not None])
+		split = self.splitFilters(options.get("equal"), reserved)
+		if split:
+			return self.selectSplit(table, options, *split)
 		query, values = SQLString.select(table, **options)
+		if self.result_cache is not None:
+			return self.result_cache.select(table, query, values)
 		return self.execute(query, values)
 
+	def aggregate(self, table = None, aggregates = (), **options):
+		'''Aggregates rows of the table inside SQLite
+
+		Arguments:
+			table - table name to select from
+			aggregates - list of (function, column) pairs, where function is count, sum, avg, min or max
+				(each result column is named function_column, or count for ("count", ALL))
+			group_by - column name, or list of column names, to group the rows by (optional)
+			**options - see Database.select
+
+		Usage:
+			totals = db.aggregate("orders", [("count", ALL), ("sum", "total")], equal = {"status": "paid"}).fetch()
+			regions = db.aggregate("orders", [("avg", "total")], group_by = "region", order_by = "-avg_total").fetch()
+
+		returns an ExecutionCursor object with one row per group'''
+		return self.select(table, aggregates = aggregates, **options)
+
 	def delete(self, table = None, **options):
 		'''Deletes rows from the table
 
@@ -345,16 +1009,250 @@ class Database(sqlite3.Connection):
 		returns an ExecutionCursor object'''
 		if not table:
 			table = self.defaultTable
-		query, values = SQLString.delete(table, **options)
-		return self.execute(query, values)
+		if self.index_advisor is not None:
+			self.index_advisor.observe(table, options)
+		split = self.splitFilters(options.get("equal"), len(options.get("like") or ()))
+		if split:
+			results = self.executeSplit(lambda equal: SQLString.delete(table, **dict(options, equal = equal)), options["equal"], *split)
+		else:
+			query, values = SQLString.delete(table, **options)
+			results = self.execute(query, values)
+		self.tableChanged(table, results)
+		return results
+
+	def variableLimit(self):
+		'''Retrieves the maximum number of "?" parameters in one statement
+
+		Arguments:
+			None
+
+		Usage:
+			limit = db.variableLimit()
+
+		returns the SQLITE_LIMIT_VARIABLE_NUMBER of the connection (or 999, the lowest default, if it cannot be read)'''
+		try:
+			return self.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+		except AttributeError:
+			return 999
+
+	def splitFilters(self, equal, reserved = 0):
+		'''Internal function --- checks whether the IN lists of a statement exceed the parameter limit
+
+		Arguments:
+			equal - dictionary of columns and values to use in WHERE + "=" or IN clauses
+			reserved - number of other parameters in the statement
+
+		Usage:
+			split = db.splitFilters({"id": ids})
+
+		The values of the split list are deduplicated (keeping their order), so that no row is selected or counted twice.
+		Each statement gets a power of two of them, so that they all share a compiled statement (see SQLString.listSize)
+
+		returns None if the statement fits, otherwise the name and values of the largest IN list and the number of its values per statement'''
+		if not equal:
+			return None
+		sets = [(SQLString.listSize(len(value)), name) for name, value in equal.items() if isinstance(value, SET_TYPES)]
+		total = reserved + len(equal) - len(sets) + sum(size for size, name in sets)
+		if not sets or total <= self.variableLimit():
+			return None
+		size, name = max(sets)
+		seen = set()
+		try:
+			values = [value for value in equal[name] if not (value in seen or seen.add(value))]
+		except TypeError: # unhashable values, such as blobs
+			values = list(equal[name])
+		available, chunk_size = self.variableLimit() - (total - size), 1
+		while chunk_size * 2 <= available:
+			chunk_size *= 2
+		return name, values, chunk_size if available >= 1 else 0
+
+	def splitStatements(self, generate, equal, name, values, chunk_size):
+		'''Internal function --- executes a statement once per chunk of an IN list, lazily
+
+		Arguments:
+			generate - function that generates the query and values from the equal filters
+			equal - dictionary of columns and values to use in WHERE + "=" or IN clauses
+			name - name of the IN list to split
+			values - values of the IN list
+			chunk_size - number of values per statement
+
+		Usage:
+			results = ChainedCursor(db.splitStatements(lambda equal: SQLString.select("users", equal = equal), {"id": ids}, "id", ids, 999))
+
+		returns a generator of executed sqlite3.Cursor objects'''
+		if chunk_size < 1:
+			raise ValueError('Too many parameters besides {name} to split the statement'.format(name = name))
+		for start in range(0, len(values), chunk_size):
+			chunk = dict(equal)
+			chunk[name] = values[start:start + chunk_size]
+			yield self.execute(*generate(chunk)).cursor
+
+	def executeSplit(self, generate, equal, name, values, chunk_size):
+		'''Internal function --- runs an UPDATE or DELETE whose IN list is too large, as several statements in one transaction
+
+		see Database.splitStatements for further reference
+
+		returns an ExecutionCursor object, whose rowcount is the total over every statement'''
+		with self.atomicBatch():
+			results = ChainedCursor(self.splitStatements(generate, equal, name, values, chunk_size))
+			results.fetchall() # runs the remaining statements
+		return ExecutionCursor(results)
+
+	def selectSplit(self, table, options, name, values, chunk_size):
+		'''Internal function --- runs a SELECT whose IN list is too large
+
+		The IN list is split into several statements whose results are read one after the other. When the results are ordered,
+		paged or aggregated, which needs a single statement, the IN list becomes a subquery over the values instead: a json_each over a
+		JSON array parameter, or a temporary table for values that are not JSON (such as blobs)
+
+		Arguments:
+			table - table name to select from
+			options - see Database.select
+			name - name of the IN list to split
+			values - values of the IN list
+			chunk_size - number of values per statement
+
+		Usage:
+			results = db.selectSplit("users", {"equal": {"id": ids}}, "id", ids, 997)
+
+		returns an ExecutionCursor object'''
+		paged = any(options.get(option) for option in ("order_by", "group_by", "aggregates")) or \
+			any(options.get(option) is not None for option in ("limit", "offset"))
+		if chunk_size >= 1 and not paged:
+			generate = lambda equal: SQLString.select(table, **dict(options, equal = equal))
+			return ExecutionCursor(ChainedCursor(self.splitStatements(generate, options["equal"], name, values, chunk_size)))
+		try:
+			return self.execute(*self.joinValues(table, options, name, "json_each(?)", json.dumps(values)))
+		except (TypeError, ValueError, sqlite3.OperationalError):
+			pass # values that are not JSON (such as blobs), or no JSON support
+		set_id = self.loadValues(values)
+		query, query_values = self.joinValues(table, options, name, "temp.wire_values WHERE set_id = ?", set_id)
+		def statements():
+			yield self.execute(query, query_values).cursor
+			self.execute("DELETE FROM temp.wire_values WHERE set_id = ?", (set_id,))
+		return ExecutionCursor(ChainedCursor(statements()))
+
+	def joinValues(self, table, options, name, source, parameter):
+		'''Internal function --- generates a SELECT query whose IN list is replaced by a subquery
+
+		Arguments:
+			table - table name to select from
+			options - see Database.select
+			name - name of the IN list to replace
+			source - FROM clause of the subquery, with one "?" parameter
+			parameter - value of the subquery parameter
+
+		Usage:
+			query, values = db.joinValues("users", {"equal": {"id": ids}}, "id", "json_each(?)", json.dumps(ids))
+
+		returns the query and its values'''
+		equal = dict(options["equal"])
+		del equal[name]
+		where = "`{name}` IN (SELECT value FROM {source})".format(name = name, source = source)
+		if "where" in options:
+			where = "{where} AND ({custom})".format(where = where, custom = options["where"])
+		return SQLString.select(table, **dict(options, equal = equal, where = where,
+			parameters = (parameter,) + tuple(options.get("parameters") or ())))
+
+	def loadValues(self, values):
+		'''Internal function --- loads a set of values into the temporary wire_values table
+
+		The values are kept until the results that use them are read to the end (or until the connection is closed)
+
+		Arguments:
+			values - iterable of values
+
+		Usage:
+			set_id = db.loadValues(ids)
+
+		returns the id of the set of values'''
+		cursor = self.statementCursor()
+		if not self.schema.exists("wire_values", True):
+			cursor.execute("CREATE TEMP TABLE IF NOT EXISTS wire_values (set_id INTEGER, value, PRIMARY KEY (set_id, value)) WITHOUT ROWID")
+		set_id = next(VALUE_SETS)
+		cursor.executemany("INSERT OR IGNORE INTO temp.wire_values VALUES (?, ?)", ((set_id, value) for value in values if value is not None))
+		self.autocommit()
+		return set_id
+
+class ReadOnlyDatabase(Database):
+	'''Database opened for reading only --- the write methods raise sqlite3.OperationalError, as SQLite does for any other write'''
+	close_at_exit = False
+
+	def __init__(self, path, mmap = True, immutable = False, **kwargs):
+		'''Opens an existing SQLite database for reading only
+
+		With Python 3, the file is opened through a mode=ro URI, so no journal is created. Python 2 cannot open URIs,
+		so the file is opened as usual and PRAGMA query_only refuses writes. The connection is not closed at exit,
+		since there is nothing to commit
+
+		Arguments:
+			path - path to database
+			mmap - whether or not to memory-map the file, so processes reading it share its pages (defaults to True),
+				or the number of bytes to map
+			immutable - whether or not the file can be assumed to never change, which skips locking entirely (defaults to False,
+				only use it for files no process writes to)
+			**kwargs - additional arguments for the Database
+
+		Usage:
+			db = Database.openReadOnly("analytics.db")
+			totals = db.aggregate("orders", [("sum", "total")], group_by = "region").fetch()
+
+		returns a ReadOnlyDatabase object'''
+		if not os.path.isfile(path):
+			raise ValueError('Database {path} does not exist'.format(path = path))
+		if sys.version_info >= (3, 4):
+			uri = "file:{path}?mode=ro{immutable}".format(path = pathname2url(os.path.abspath(path)), immutable = "&immutable=1" if immutable else "")
+			Database.__init__(self, uri, uri = True, **kwargs)
+			self.path = path
+		else:
+			Database.__init__(self, path, **kwargs)
+		self.cursor().execute("PRAGMA query_only = 1")
+		if mmap:
+			size = mmap if mmap is not True else os.path.getsize(path)
+			self.cursor().execute("PRAGMA mmap_size = {size}".format(size = size + (1 << 20))) # room for the file to grow
+		self.commit_mode = "manual"
+
+	def refuse(self, *args, **kwargs):
+		'''Internal function --- refuses a write
+
+		Arguments:
+			*args, **kwargs - arguments of the write method
+
+		Usage:
+			db.refuse()
+
+		returns None (always raises sqlite3.OperationalError)'''
+		raise sqlite3.OperationalError("attempt to write a readonly database")
+
+	def execute(self, cmd, *args, **kwargs):
+		'''Executes an SQL command, refusing to set the PRAGMA values that would let the connection write (see WRITABLE_PRAGMAS)
+
+		With Python 2, PRAGMA query_only is all that refuses writes, so Database.pragma("query_only = 0") would turn them back on.
+		Statements executed directly on a cursor (db.cursor().execute) are not checked
+
+		see Database.execute for further reference'''
+		if WRITABLE_PRAGMAS.match(cmd):
+			self.refuse()
+		return Database.execute(self, cmd, *args, **kwargs)
+
+	insert = insertMany = update = delete = script = executeFile = createTable = dropTable = refuse
+	transaction = writeBehind = setProfile = profile = refuse
 
 class Transaction(Database):
-	'''Models an SQL transaction'''
-	def __init__(self, db):
+	'''Models an SQL transaction
+
+	Used as a context manager, the transaction is opened with BEGIN IMMEDIATE, committed at the end of the block and rolled back if
+	the block raises. Nested blocks are savepoints, which are rolled back on their own, and so is a transaction entered while
+	another one is open on the connection. With Python 2, statements left uncommitted outside of a transaction (by the commit
+	policy, or by a Transaction used without a with block) are committed when the block begins'''
+	def __init__(self, db, retries = 10, backoff = 0.005, max_backoff = 0.5):
 		'''Creates the Transaction object
 
 		Arguments:
 			db - Database instance to use
+			retries - number of times a statement is retried when the database is busy or locked (defaults to 10)
+			backoff - seconds to wait before the first retry, doubled for each retry (defaults to 0.005)
+			max_backoff - maximum seconds to wait between retries (defaults to 0.5)
 
 		Usage:
 			trans = Transaction(db)
@@ -362,8 +1260,16 @@ class Transaction(Database):
 		returns the Transaction object'''
 		self.db = db
 		self.cursor = db.newCursor()
-		self.fetchall, self.fetchone, self.description = self.cursor.fetchall, self.cursor.fetchone, self.cursor.description
-		self.rollback = self.db.rollback
+		self.schema = self.db.schema
+		self.result_cache = self.db.result_cache
+		self.instrumentation = self.db.instrumentation
+		self.index_advisor = self.db.index_advisor
+		self.variableLimit = self.db.variableLimit
+		self.retries, self.backoff, self.max_backoff = retries, backoff, max_backoff
+		self.depth, self.finished, self.nested, self.previous_isolation = 0, True, False, None
+		self.savepoint_names = []
+		self.busy_retries = 0
+		self.insert_stats = None
 		self.reset_counter = 0
 		self.defaultTable = None
 		self.debug = False
@@ -376,23 +1282,321 @@ class Transaction(Database):
 			if hasattr(self, method):
 				setattr(self, method, lambda *args, **kwargs: raiseError())
 
+	def __enter__(self):
+		'''Begins the transaction, or a savepoint if the transaction was already begun
+
+		Arguments:
+			None
+
+		Usage:
+			with db.transaction() as trans:
+				trans.insert("users", id = 1, username = "panchr")
+				with trans: # savepoint
+					trans.delete("users", equal = {"id": 2}, where = "1 = 1")
+
+		returns the Transaction object'''
+		if not self.depth:
+			self.nested = self.db.transaction_open or getattr(self.db, "in_transaction", False)
+			self.db.batch_depth += 1
+			self.finished = False
+			if self.nested:
+				try:
+					self.openSavepoint()
+				except Exception:
+					self.restore()
+					raise
+			else:
+				self.db.commit()
+				self.previous_isolation, self.db.isolation_level = self.db.isolation_level, None
+				try:
+					self.retry(self.cursor.execute, "BEGIN IMMEDIATE")
+				except Exception:
+					self.restore()
+					raise
+				self.db.transaction_open = True
+		elif not self.finished:
+			self.openSavepoint()
+		self.depth += 1
+		return self
+
+	def __exit__(self, error_type, error, traceback):
+		'''Commits the transaction (or releases the savepoint), or rolls it back if the block raised an exception
+
+		see Transaction.__enter__ for further reference'''
+		self.depth -= 1
+		try:
+			if self.finished:
+				pass # committed or rolled back inside the block
+			elif self.depth or self.nested:
+				self.closeSavepoint(self.savepoint_names[-1], error_type is not None)
+			elif error_type is None:
+				self.commit()
+			else:
+				self.rollback()
+		finally:
+			if not self.depth:
+				self.restore()
+		return False
+
+	def savepoint(self):
+		'''Begins a savepoint inside the transaction
+
+		Arguments:
+			None
+
+		Usage:
+			with db.transaction() as trans:
+				trans.insert("users", id = 1, username = "panchr")
+				try:
+					with trans.savepoint():
+						trans.insert("users", id = 1, username = "duplicate")
+				except sqlite3.IntegrityError:
+					pass # only the savepoint was rolled back
+
+		returns the Transaction object, to be used as a context manager'''
+		return self
+
+	def openSavepoint(self):
+		'''Internal function --- begins a savepoint, named after the number of savepoints open on the connection
+
+		Arguments:
+			None
+
+		Usage:
+			trans.openSavepoint()
+
+		returns None'''
+		name = "wire_{number}".format(number = self.db.savepoints)
+		self.cursor.execute("SAVEPOINT {name}".format(name = name))
+		self.db.savepoints += 1
+		self.savepoint_names.append(name)
+
+	def closeSavepoint(self, name, rollback = False):
+		'''Internal function --- releases a savepoint (and the savepoints begun after it), rolling it back first if needed
+
+		Arguments:
+			name - name of the savepoint
+			rollback - whether or not to roll back the savepoint (defaults to False)
+
+		Usage:
+			trans.closeSavepoint("wire_0", rollback = True)
+
+		returns None'''
+		if rollback:
+			self.cursor.execute("ROLLBACK TO {name}".format(name = name))
+			self.clearCache()
+		self.cursor.execute("RELEASE {name}".format(name = name))
+		self.forgetSavepoints(len(self.savepoint_names) - self.savepoint_names.index(name))
+
+	def forgetSavepoints(self, count = None):
+		'''Internal function --- stops tracking the most recent savepoints, once they were released or ended with the transaction
+
+		Arguments:
+			count - number of savepoints (defaults to all of them)
+
+		Usage:
+			trans.forgetSavepoints()
+
+		returns None'''
+		count = len(self.savepoint_names) if count is None else count
+		self.db.savepoints -= count
+		del self.savepoint_names[len(self.savepoint_names) - count:]
+
+	def restore(self):
+		'''Internal function --- hands transaction control back to the Database at the end of the outermost block
+
+		Arguments:
+			None
+
+		Usage:
+			trans.restore()
+
+		returns None'''
+		if not self.nested:
+			self.db.isolation_level = self.previous_isolation
+			self.db.transaction_open = False
+		self.forgetSavepoints()
+		self.db.batch_depth -= 1
+		self.finished, self.nested = True, False
+
+	@staticmethod
+	def isBusy(error):
+		'''Internal function --- checks whether an error was caused by another connection holding a lock
+
+		Arguments:
+			error - exception raised by sqlite3
+
+		Usage:
+			busy = Transaction.isBusy(sqlite3.OperationalError("database is locked"))
+
+		returns True if the error is SQLITE_BUSY or SQLITE_LOCKED, or False'''
+		if not isinstance(error, sqlite3.OperationalError):
+			return False
+		code = getattr(error, "sqlite_errorcode", None)
+		if code is not None:
+			return code & 0xff in (5, 6)
+		message = str(error)
+		return "locked" in message or "busy" in message
+
+	def retry(self, function, *args):
+		'''Internal function --- calls a function, retrying with exponential backoff while the database is busy or locked
+
+		The connection's own busy timeout is waited out before each retry
+
+		Arguments:
+			function - function to call
+			*args - arguments to the function
+
+		Usage:
+			trans.retry(trans.cursor.execute, "BEGIN IMMEDIATE")
+
+		returns the return value of the function'''
+		delay = self.backoff
+		for attempt in range(self.retries + 1):
+			try:
+				return function(*args)
+			except sqlite3.OperationalError as error:
+				if attempt == self.retries or not self.isBusy(error):
+					raise
+			self.busy_retries += 1
+			time.sleep(random.uniform(delay / 2, delay))
+			delay = min(delay * 2, self.max_backoff)
+
 	def execute(self, cmd, *args, **kwargs):
 		'''Executes an SQL command
 
+		Each command uses its own cursor, so the results of earlier commands can still be read
+
 		See Database.execute for further reference'''
 		if self.debug:
 			print(cmd, args, kwargs)
-		self.cursor.execute(cmd, *args, **kwargs)
+		exec_cursor = self.db.cursor()
+		if self.instrumentation is None:
+			self.retry(exec_cursor.execute, cmd, *args)
+		else:
+			exec_cursor = self.retry(self.instrumentation.execute, exec_cursor, cmd, *args)
+		self.cursor = exec_cursor
+		self.db.statements += 1
+		self.db.pending += 1
+		return ExecutionCursor(exec_cursor)
+
+	def insertMany(self, table = None, rows = (), columns = None, chunk_size = 1000):
+		'''Inserts many rows into the table as part of the transaction (in a savepoint inside a with block)
+
+		see Database.insertMany for further reference'''
+		if not table:
+			table = self.defaultTable
+		start = time.time()
+		exec_cursor = self.db.cursor()
+		query, rows = self.db.insertRows(table, rows, columns)
+		if query is None:
+			return ExecutionCursor(exec_cursor)
+		if self.depth and not self.finished:
+			with self:
+				inserted = self.executeChunks(exec_cursor, query, rows, chunk_size)
+		else:
+			inserted = self.executeChunks(exec_cursor, query, rows, chunk_size)
+		elapsed = time.time() - start
+		self.insert_stats = {"rows": inserted, "seconds": elapsed, "rows_per_second": inserted / elapsed if elapsed else 0.0}
+		self.tableChanged(table, inserted)
+		return ExecutionCursor(exec_cursor)
+
+	@contextmanager
+	def batch(self):
+		'''Groups statements --- they are already part of the transaction
+
+		see Database.batch for further reference'''
+		yield self
+
+	def statementCursor(self):
+		'''Internal function --- creates a cursor on the connection of the transaction (Transaction.cursor is the last cursor used)
+
+		see Database.statementCursor for further reference'''
+		return self.db.cursor()
+
+	@contextmanager
+	def atomicBatch(self):
+		'''Internal function --- groups statements in a savepoint inside a with block, so that they are undone together
+
+		see Database.atomicBatch for further reference'''
+		if self.depth and not self.finished:
+			with self:
+				yield self
+		else:
+			yield self
+
+	def autocommit(self):
+		'''Internal function --- the statements of a transaction are only committed by Transaction.commit
+
+		see Database.autocommit for further reference'''
+		return False
+
+	def fetchall(self):
+		'''Fetches the remaining rows of the last command (see sqlite3.Cursor.fetchall)'''
+		return self.cursor.fetchall()
+
+	def fetchone(self):
+		'''Fetches the next row of the last command (see sqlite3.Cursor.fetchone)'''
+		return self.cursor.fetchone()
+
+	@property
+	def description(self):
+		'''Column descriptions of the last command (see sqlite3.Cursor.description)'''
+		return self.cursor.description
 
 	def commit(self):
 		'''Commits the changes to the database
 
+		Inside a with block, this ends the transaction early (including any savepoints). A transaction nested in another one only
+		releases its savepoint, and its changes are committed with the outer transaction
+
 		see sqlite3.Connection.commit for further reference
 
 		Returns an ExecutionCursor object'''
-		self.db.commit()
+		if not self.finished:
+			if self.nested:
+				self.closeSavepoint(self.savepoint_names[0])
+			else:
+				self.retry(self.db.cursor().execute, "COMMIT")
+				self.db.transaction_open = False
+				self.forgetSavepoints()
+			self.finished = True
+		if not (self.nested or self.db.transaction_open):
+			self.db.commit()
 		return ExecutionCursor(self.cursor)
 
+	def rollback(self):
+		'''Rolls back the changes to the database
+
+		Inside a with block, this ends the transaction early (including any savepoints). A transaction nested in another one only
+		rolls back its savepoint
+
+		see sqlite3.Connection.rollback for further reference'''
+		if not self.finished:
+			if self.nested:
+				self.closeSavepoint(self.savepoint_names[0], rollback = True)
+			else:
+				self.db.cursor().execute("ROLLBACK")
+				self.db.transaction_open = False
+				self.forgetSavepoints()
+			self.finished = True
+		if not (self.nested or self.db.transaction_open):
+			self.db.rollback()
+		self.clearCache()
+
+	def clearCache(self):
+		'''Internal function --- clears the result cache after a rollback, since it may hold rows that were rolled back
+
+		Arguments:
+			None
+
+		Usage:
+			trans.clearCache()
+
+		returns None'''
+		if self.result_cache is not None:
+			self.result_cache.clear()
+
 	def count(self):
 		'''Returns the affected rows since last reset
 
@@ -0,0 +1,93 @@
+# Rushy Panchal
+# wire/futures.py
+# Provides the Future class shared by the background threads (concurrent.futures.Future when it is available)
+
+import threading
+
+try:
+	from concurrent.futures import Future
+except ImportError:
+	class Future(object):
+		'''Minimal stand-in for concurrent.futures.Future, for Python versions without it'''
+		def __init__(self):
+			self.condition = threading.Condition()
+			self.state, self.value, self.error, self.callbacks = "pending", None, None, []
+
+		def cancel(self):
+			'''Cancels the call if it has not started yet, returning True if it was cancelled'''
+			with self.condition:
+				if self.state == "running" or self.state == "finished":
+					return False
+				if self.state == "pending":
+					self.state = "cancelled"
+					self.condition.notify_all()
+			self.invokeCallbacks()
+			return True
+
+		def cancelled(self):
+			'''Checks if the call was cancelled'''
+			return self.state == "cancelled"
+
+		def running(self):
+			'''Checks if the call is running'''
+			return self.state == "running"
+
+		def done(self):
+			'''Checks if the call was cancelled or finished'''
+			return self.state in ("cancelled", "finished")
+
+		def set_running_or_notify_cancel(self):
+			'''Marks the call as running, returning False if it was cancelled'''
+			with self.condition:
+				if self.state == "cancelled":
+					return False
+				self.state = "running"
+				return True
+
+		def set_result(self, value):
+			'''Sets the result of the call'''
+			with self.condition:
+				self.state, self.value = "finished", value
+				self.condition.notify_all()
+			self.invokeCallbacks()
+
+		def set_exception(self, error):
+			'''Sets the exception raised by the call'''
+			with self.condition:
+				self.state, self.error = "finished", error
+				self.condition.notify_all()
+			self.invokeCallbacks()
+
+		def add_done_callback(self, callback):
+			'''Calls a function with the future once it is done'''
+			with self.condition:
+				if not self.done():
+					self.callbacks.append(callback)
+					return
+			callback(self)
+
+		def invokeCallbacks(self):
+			'''Internal function --- calls the done callbacks'''
+			callbacks, self.callbacks = self.callbacks, []
+			for callback in callbacks:
+				callback(self)
+
+		def exception(self, timeout = None):
+			'''Waits for the call and returns its exception (or None)'''
+			with self.condition:
+				while not self.done():
+					self.condition.wait(timeout)
+					if timeout is not None:
+						break
+				if self.state == "cancelled":
+					raise RuntimeError("Call was cancelled")
+				if self.state != "finished":
+					raise RuntimeError("Call did not finish in time")
+				return self.error
+
+		def result(self, timeout = None):
+			'''Waits for the call and returns its result, raising its exception if it failed'''
+			error = self.exception(timeout)
+			if error is not None:
+				raise error
+			return self.value
@@ -0,0 +1,357 @@
+# Rushy Panchal
+# wire/instrument.py
+# The Instrumentation class times statements and keeps a slow-query log
+
+import sys
+import json
+import time
+from collections import deque
+
+from sqlstring import SQLString
+
+class Instrumentation(object):
+	'''Records the time and rows of every statement executed by a Database (see Database.instrument)'''
+	def __init__(self, db, slow_threshold = 0.1, explain = True, samples = 1000, slow_log_size = 100):
+		'''Creates the Instrumentation object
+
+		Arguments:
+			db - Database object
+			slow_threshold - seconds above which a statement is logged as slow (defaults to 0.1)
+			explain - whether or not to capture the EXPLAIN QUERY PLAN of slow statements (defaults to True)
+			samples - number of recent timings kept per statement shape for the percentiles (defaults to 1000)
+			slow_log_size - number of slow statements kept (defaults to 100)
+
+		Usage:
+			instrumentation = Instrumentation(db, slow_threshold = 0.05)
+
+		returns the Instrumentation object'''
+		self.db, self.slow_threshold, self.explain, self.samples = db, slow_threshold, explain, samples
+		self.shapes, self.normalized = {}, {}
+		self.slow = deque(maxlen = slow_log_size)
+		self.listeners = []
+
+	def execute(self, cursor, query, *args, **kwargs):
+		'''Internal function --- executes and times a statement
+
+		Arguments:
+			cursor - sqlite3.Cursor instance
+			query - SQL query
+			*args, **kwargs - parameters of the query (see sqlite3.Cursor.execute)
+
+		Usage:
+			cursor = instrumentation.execute(db.cursor(), "SELECT * FROM users")
+
+		The statement is recorded once it ran, so that it counts even if its results are never read in full
+
+		returns the cursor, wrapped so that reading the results is timed as well (see Instrumentation.recordFetch)'''
+		start = time.time()
+		cursor.execute(query, *args, **kwargs)
+		elapsed = time.time() - start
+		if cursor.description is None:
+			self.record(query, args[0] if args else (), elapsed, cursor.rowcount)
+			return cursor
+		self.record(query, args[0] if args else (), elapsed, 0)
+		return InstrumentedCursor(cursor, self, query, args[0] if args else (), elapsed)
+
+	def executemany(self, cursor, query, rows):
+		'''Internal function --- executes and times a statement for many rows
+
+		Arguments:
+			cursor - sqlite3.Cursor instance
+			query - SQL query
+			rows - list of parameter tuples
+
+		Usage:
+			instrumentation.executemany(db.cursor(), "INSERT INTO users VALUES (?, ?)", rows)
+
+		returns the cursor'''
+		start = time.time()
+		cursor.executemany(query, rows)
+		self.record(query, (), time.time() - start, len(rows))
+		return cursor
+
+	def record(self, query, values, seconds, rows):
+		'''Records an executed statement, logging it if it was slow
+
+		Arguments:
+			query - SQL query
+			values - parameters of the query
+			seconds - time spent executing the statement and reading its results
+			rows - number of rows returned or affected
+
+		Usage:
+			instrumentation.record("SELECT * FROM users", (), 0.002, 10)
+
+		returns None'''
+		shape = self.shape(query)
+		stats = self.shapes.get(shape)
+		if stats is None:
+			stats = self.shapes[shape] = {"count": 0, "rows": 0, "total": 0.0, "fetch": 0.0, "max": 0.0, "samples": deque(maxlen = self.samples)}
+		stats["count"] += 1
+		stats["rows"] += max(rows, 0)
+		stats["total"] += seconds
+		stats["max"] = max(stats["max"], seconds)
+		stats["samples"].append(seconds)
+		entry = {"query": query, "shape": shape, "seconds": seconds, "rows": rows}
+		if seconds >= self.slow_threshold:
+			self.logSlow(entry, values)
+		for listener in self.listeners:
+			listener(entry)
+
+	def recordFetch(self, query, values, execute_seconds, seconds, rows):
+		'''Internal function --- adds the reading of a query's results to its statistics, once every row was read
+
+		Arguments:
+			query - SQL query
+			values - parameters of the query
+			execute_seconds - time spent executing the statement (already recorded)
+			seconds - time spent reading the results
+			rows - number of rows read
+
+		Usage:
+			instrumentation.recordFetch("SELECT * FROM users", (), 0.001, 0.004, 10)
+
+		returns None'''
+		stats = self.shapes.get(self.shape(query))
+		if stats is None:
+			return # the statistics were reset in the meantime
+		stats["rows"] += rows
+		stats["total"] += seconds
+		stats["fetch"] += seconds
+		if execute_seconds < self.slow_threshold <= execute_seconds + seconds:
+			self.logSlow({"query": query, "shape": self.shape(query), "seconds": execute_seconds + seconds, "rows": rows}, values)
+
+	def shape(self, query):
+		'''Internal function --- normalizes a query, remembering the shapes of recent queries
+
+		Arguments:
+			query - SQL query
+
+		Usage:
+			shape = instrumentation.shape("SELECT * FROM users WHERE `id` = 5")
+
+		returns the shape of the query (see SQLString.normalize)'''
+		shape = self.normalized.get(query)
+		if shape is None:
+			if len(self.normalized) >= 10000:
+				self.normalized.clear()
+			shape = self.normalized[query] = SQLString.normalize(query)
+		return shape
+
+	def logSlow(self, entry, values):
+		'''Internal function --- adds a statement to the slow-query log, with its plan and full table scans
+
+		Arguments:
+			entry - dictionary of the query, shape, seconds and rows
+			values - parameters of the query
+
+		Usage:
+			instrumentation.logSlow({"query": query, "shape": shape, "seconds": 0.5, "rows": 10}, values)
+
+		returns None'''
+		entry["values"] = list(values) if isinstance(values, (list, tuple)) else values
+		entry["plan"] = self.queryPlan(entry["query"], values) if self.explain else None
+		entry["full_scans"] = [detail for detail in entry["plan"] or () if self.isFullScan(detail)]
+		entry["time"] = time.time()
+		self.slow.append(entry)
+
+	def queryPlan(self, query, values):
+		'''Internal function --- retrieves the EXPLAIN QUERY PLAN of a statement
+
+		Python 2 commits the open transaction before an EXPLAIN, so the plan is skipped while the commit policy is deferring statements
+
+		Arguments:
+			query - SQL query
+			values - parameters of the query
+
+		Usage:
+			plan = instrumentation.queryPlan("SELECT * FROM users WHERE `id` = ?", (1,))
+
+		returns a list of plan details (or None if the plan could not be retrieved)'''
+		if sys.version_info[0] < 3 and (self.db.pending or self.db.batch_depth):
+			return None
+		try:
+			return [row[-1] for row in self.db.cursor().execute("EXPLAIN QUERY PLAN " + query, values).fetchall()]
+		except Exception:
+			return None
+
+	@staticmethod
+	def isFullScan(detail):
+		'''Internal function --- checks whether a plan detail is a full table scan
+
+		Arguments:
+			detail - EXPLAIN QUERY PLAN detail
+
+		Usage:
+			scan = Instrumentation.isFullScan("SCAN users") # True
+
+		returns True if the detail scans a whole table or False'''
+		return detail.startswith("SCAN") and "CONSTANT ROW" not in detail and " INDEX " not in detail and "USING INTEGER PRIMARY KEY" not in detail
+
+	def subscribe(self, listener):
+		'''Calls a function with every recorded statement
+
+		Arguments:
+			listener - function called with a dictionary of the query, shape, seconds and rows
+				(a SELECT is passed once it ran, before its rows are read, so with 0 rows;
+				slow statements also have the values, plan, full_scans and time)
+
+		Usage:
+			db.instrumentation.subscribe(lambda entry: metrics.timing(entry["shape"], entry["seconds"]))
+
+		returns None'''
+		self.listeners.append(listener)
+
+	@staticmethod
+	def percentile(samples, fraction):
+		'''Internal function --- computes a percentile with the nearest-rank method
+
+		Arguments:
+			samples - sorted list of values
+			fraction - percentile, between 0 and 1
+
+		Usage:
+			p95 = Instrumentation.percentile(sorted(timings), 0.95)
+
+		returns the percentile (or 0.0 if there are no samples)'''
+		if not samples:
+			return 0.0
+		return samples[min(len(samples) - 1, max(0, int(fraction * len(samples) + 0.5) - 1))]
+
+	def stats(self, others = ()):
+		'''Reports the statistics of each statement shape
+
+		Arguments:
+			others - other Instrumentation objects whose statements are added to the statistics, such as those of the
+				connections of a pool (optional)
+
+		Usage:
+			stats = db.queryStats()
+
+		returns a dictionary of shapes and their count, rows, total, fetch (the part of the total spent reading results), mean,
+		max, p50, p95 and p99 (in seconds, max and the percentiles over the execution of each statement)'''
+		shapes = {}
+		for instrumentation in [self] + list(others):
+			for shape, stats in list(instrumentation.shapes.items()):
+				merged = shapes.setdefault(shape, {"count": 0, "rows": 0, "total": 0.0, "fetch": 0.0, "max": 0.0, "samples": []})
+				for key in ("count", "rows", "total", "fetch"):
+					merged[key] += stats[key]
+				merged["max"] = max(merged["max"], stats["max"])
+				merged["samples"].extend(stats["samples"])
+		report = {}
+		for shape, stats in shapes.items():
+			samples = sorted(stats["samples"])
+			report[shape] = {"count": stats["count"], "rows": stats["rows"], "total": stats["total"], "fetch": stats["fetch"], "max": stats["max"],
+				"mean": stats["total"] / stats["count"], "p50": self.percentile(samples, 0.5),
+				"p95": self.percentile(samples, 0.95), "p99": self.percentile(samples, 0.99)}
+		return report
+
+	def slowQueries(self, others = ()):
+		'''Retrieves the slow-query log
+
+		Arguments:
+			others - other Instrumentation objects whose slow statements are included (optional)
+
+		Usage:
+			for entry in db.slowQueries():
+				print(entry["seconds"], entry["query"], entry["full_scans"])
+
+		returns a list of dictionaries of the query, shape, values, seconds, rows, plan, full_scans and time, oldest first'''
+		return sorted((entry for instrumentation in [self] + list(others) for entry in list(instrumentation.slow)), key = lambda entry: entry["time"])
+
+	def export(self, filepath):
+		'''Exports the statistics and the slow-query log to a JSON file
+
+		Arguments:
+			filepath - path to the JSON file
+
+		Usage:
+			db.instrumentation.export("queries.json")
+
+		returns None'''
+		with open(filepath, 'w') as export_file:
+			json.dump({"statements": self.stats(), "slow_queries": self.slowQueries()}, export_file, indent = 1, default = repr)
+
+	def reset(self):
+		'''Removes every recorded statement
+
+		Arguments:
+			None
+
+		Usage:
+			db.instrumentation.reset()
+
+		returns None'''
+		self.shapes.clear()
+		self.slow.clear()
+
+class InstrumentedCursor(object):
+	'''Internal class --- cursor-like object that times the reading of a query's results'''
+	def __init__(self, cursor, instrumentation, query, values, elapsed):
+		'''Creates the InstrumentedCursor object
+
+		see Instrumentation.execute for further reference'''
+		self.cursor, self.instrumentation, self.query, self.values = cursor, instrumentation, query, values
+		self.source = getattr(cursor, "source", cursor)
+		self.execute_seconds, self.elapsed, self.rows, self.finished = elapsed, 0.0, 0, False
+		self.description, self.rowcount, self.lastrowid = cursor.description, cursor.rowcount, cursor.lastrowid
+
+	@property
+	def arraysize(self):
+		'''Number of rows fetched by fetchmany (see sqlite3.Cursor.arraysize)'''
+		return self.cursor.arraysize
+
+	@arraysize.setter
+	def arraysize(self, size):
+		self.cursor.arraysize = size
+
+	@property
+	def row_factory(self):
+		'''Row factory of the cursor (see sqlite3.Cursor.row_factory)'''
+		return self.cursor.row_factory
+
+	@row_factory.setter
+	def row_factory(self, factory):
+		self.cursor.row_factory = factory
+
+	def __iter__(self):
+		'''Iterates over the remaining rows'''
+		while True:
+			rows = self.fetchmany()
+			if not rows:
+				break
+			for row in rows:
+				yield row
+
+	def timed(self, fetch, size = None):
+		'''Internal function --- fetches rows, recording the time spent reading them once every row was read
+
+		Arguments:
+			fetch - fetch method of the cursor
+			size - number of rows to fetch (None for every row)
+
+		Usage:
+			rows = cursor.timed(cursor.cursor.fetchall)
+
+		returns a list of rows'''
+		start = time.time()
+		rows = fetch() if size is None else fetch(size)
+		self.elapsed += time.time() - start
+		self.rows += len(rows)
+		if not self.finished and (size is None or len(rows) < size):
+			self.finished = True
+			self.instrumentation.recordFetch(self.query, self.values, self.execute_seconds, self.elapsed, self.rows)
+		return rows
+
+	def fetchmany(self, size = None):
+		'''Fetches the next rows (see sqlite3.Cursor.fetchmany)'''
+		return self.timed(self.cursor.fetchmany, size or self.cursor.arraysize)
+
+	def fetchone(self):
+		'''Fetches the next row (see sqlite3.Cursor.fetchone)'''
+		rows = self.fetchmany(1)
+		return rows[0] if rows else None
+
+	def fetchall(self):
+		'''Fetches the remaining rows (see sqlite3.Cursor.fetchall)'''
+		return self.timed(self.cursor.fetchall)
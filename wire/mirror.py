@@ -0,0 +1,266 @@
+# Rushy Panchal
+# wire/mirror.py
+# The MemoryMirror class serves reads from an in-memory copy of a database file
+
+import sqlite3
+import threading
+import time
+
+from database import Database
+
+SYNC_MODES = ("sync", "periodic")
+
+class MemoryMirror(object):
+	'''In-memory copy of a database file (or of some of its tables) --- reads are served from memory, writes go to both'''
+	def __init__(self, path, tables = None, mode = "sync", interval = 1.0, **kwargs):
+		'''Creates the MemoryMirror object and loads the tables into memory
+
+		Arguments:
+			path - path to database
+			tables - list of table names to mirror (defaults to every table, copied with the backup API when it is available)
+			mode - when writes reach the file: "sync" (immediately, before they are applied in memory, the default)
+				or "periodic" (applied in memory, then written in one transaction every interval seconds, or by MemoryMirror.sync)
+			interval - seconds between periodic writes (defaults to 1.0)
+			**kwargs - additional arguments for the Database of the file
+
+		Usage:
+			mirror = MemoryMirror("test.db", tables = ["countries", "currencies"])
+
+		Reads of other tables go to the file. Only the tables and their indexes are copied, not their triggers
+
+		returns the MemoryMirror object'''
+		if mode not in SYNC_MODES:
+			raise ValueError('Sync mode must be one of {modes}'.format(modes = ', '.join(SYNC_MODES)))
+		if path == ":memory:":
+			raise ValueError('MemoryMirror needs a database file to mirror')
+		self.path, self.mode, self.interval = path, mode, interval
+		self.lock = threading.RLock()
+		kwargs.setdefault("check_same_thread", False)
+		self.disk = Database(path, **kwargs)
+		self.tables = list(tables) if tables is not None else None
+		self.pending, self.first_pending = [], None
+		self.reads, self.disk_reads, self.writes, self.syncs, self.last_sync = 0, 0, 0, 0, None
+		self.failed, self.last_error = 0, None
+		self.memory = None
+		self.load()
+		self.stopped = threading.Event()
+		self.thread = None
+		if mode == "periodic":
+			self.thread = threading.Thread(target = self.run)
+			self.thread.daemon = True
+			self.thread.start()
+
+	def load(self):
+		'''Internal function --- copies the mirrored tables from the file into a new in-memory database
+
+		Arguments:
+			None
+
+		Usage:
+			mirror.load()
+
+		returns None'''
+		with self.lock:
+			memory = Database(":memory:", check_same_thread = False)
+			if self.tables is None and hasattr(sqlite3.Connection, "backup"):
+				sqlite3.Connection.backup(self.disk, memory)
+				names = [name for name in memory.tables() if not name.startswith("sqlite_")]
+			else:
+				names = self.tables if self.tables is not None else [name for name in self.disk.tables() if not name.startswith("sqlite_")]
+				memory.execute("ATTACH DATABASE ? AS source", (self.path,))
+				try:
+					for name in names:
+						definitions = memory.execute("SELECT sql FROM source.sqlite_master WHERE tbl_name = ? AND sql IS NOT NULL " +
+							"AND type IN ('table', 'index') ORDER BY type = 'index'", (name,)).fetch(type = list)
+						if not definitions:
+							raise ValueError('Table {name} does not exist in database'.format(name = name))
+						memory.execute(definitions[0][0])
+						memory.execute("INSERT INTO main.{table} SELECT * FROM source.{table}".format(table = name))
+						for (sql,) in definitions[1:]:
+							memory.execute(sql)
+				finally:
+					memory.commit()
+					memory.execute("DETACH DATABASE source")
+			if self.memory is not None:
+				self.memory.close()
+			self.memory, self.mirrored = memory, set(names)
+			self.version = self.dataVersion()
+			self.loaded = time.time()
+
+	def dataVersion(self):
+		'''Internal function --- retrieves the data version of the file, which changes when another connection commits
+
+		Arguments:
+			None
+
+		Usage:
+			version = mirror.dataVersion()
+
+		returns the data version'''
+		return self.disk.schema.query("SELECT data_version FROM pragma_data_version", "PRAGMA data_version")[0][0]
+
+	def refresh(self):
+		'''Reloads the mirrored tables from the file, after writing any pending writes
+
+		Arguments:
+			None
+
+		Usage:
+			if mirror.stats()["stale"]:
+				mirror.refresh()
+
+		returns None'''
+		with self.lock:
+			self.sync()
+			self.load()
+
+	def select(self, table, **options):
+		'''Selects rows from the table, from memory if it is mirrored
+
+		see Database.select for further reference'''
+		with self.lock:
+			if table in self.mirrored:
+				self.reads += 1
+				return self.memory.select(table, **options)
+			self.disk_reads += 1
+			return self.disk.select(table, **options)
+
+	def aggregate(self, table, aggregates = (), **options):
+		'''Aggregates rows of the table, from memory if it is mirrored
+
+		see Database.aggregate for further reference'''
+		return self.select(table, aggregates = aggregates, **options)
+
+	def write(self, method, table, *args, **kwargs):
+		'''Internal function --- applies a write to the file and, if the table is mirrored, to memory
+
+		Arguments:
+			method - name of the Database method
+			table - table name
+			*args, **kwargs - arguments to the method
+
+		Usage:
+			results = mirror.write("insert", "users", id = 1)
+
+		returns the ExecutionCursor of the write in memory (or on the file, for tables that are not mirrored)'''
+		with self.lock:
+			self.writes += 1
+			if table not in self.mirrored:
+				return getattr(self.disk, method)(table, *args, **kwargs)
+			if self.mode == "sync":
+				getattr(self.disk, method)(table, *args, **kwargs)
+				return getattr(self.memory, method)(table, *args, **kwargs)
+			results = getattr(self.memory, method)(table, *args, **kwargs)
+			if not self.pending:
+				self.first_pending = time.time()
+			self.pending.append((method, table, args, kwargs))
+			return results
+
+	def insert(self, table, **columns):
+		'''Inserts a row into the table
+
+		see Database.insert for further reference'''
+		return self.write("insert", table, **columns)
+
+	def insertMany(self, table, rows = (), columns = None, chunk_size = 1000):
+		'''Inserts many rows into the table
+
+		see Database.insertMany for further reference (the rows are held in memory until they are written to the file)'''
+		return self.write("insertMany", table, list(rows), columns, chunk_size)
+
+	def update(self, table, equal = None, like = None, where = "1 = 1", **columns):
+		'''Updates rows in the table
+
+		see Database.update for further reference'''
+		return self.write("update", table, equal, like, where, **columns)
+
+	def delete(self, table, **options):
+		'''Deletes rows from the table
+
+		see Database.delete for further reference'''
+		return self.write("delete", table, **options)
+
+	def sync(self):
+		'''Writes the pending writes to the file, in one transaction
+
+		Each write is applied in a savepoint: a write the file rejects (because of a constraint or trigger the memory copy does
+		not have) is dropped and recorded in MemoryMirror.stats, without holding back the other writes. The memory copy keeps
+		the dropped write until it is refreshed
+
+		Arguments:
+			None
+
+		Usage:
+			mirror.sync()
+
+		returns the number of writes'''
+		with self.lock:
+			pending = self.pending
+			if pending:
+				with self.disk.transaction() as trans:
+					for method, table, args, kwargs in pending:
+						try:
+							with trans.savepoint():
+								getattr(trans, method)(table, *args, **kwargs)
+						except Exception as error:
+							self.failed += 1
+							self.last_error = "{method} on {table}: {error}".format(method = method, table = table, error = error)
+				self.pending, self.first_pending = [], None
+				self.syncs += 1
+			self.last_sync = time.time()
+			return len(pending) # the data version only changes with the commits of other connections, so this one stays fresh
+
+	def run(self):
+		'''Internal function --- writes the pending writes every interval on the sync thread
+
+		Arguments:
+			None
+
+		Usage:
+			threading.Thread(target = mirror.run).start()
+
+		returns None'''
+		while not self.stopped.wait(self.interval):
+			try:
+				self.sync()
+			except Exception as error: # the file is busy, so the writes stay pending and are retried at the next interval
+				self.last_error = "sync: {error}".format(error = error)
+
+	def stats(self):
+		'''Reports the staleness and sync lag of the mirror
+
+		Arguments:
+			None
+
+		Usage:
+			stats = mirror.stats()
+
+		returns a dictionary of the mirrored tables, whether the file was changed by another connection since it was loaded
+		(stale), the seconds since it was loaded (age), the pending writes, the seconds the oldest pending write has waited
+		(sync_lag), the reads served from memory and from the file, the writes, the number of syncs, and the number of writes
+		the file rejected (failed) with the last error'''
+		with self.lock:
+			now = time.time()
+			return {"tables": sorted(self.mirrored), "stale": self.dataVersion() != self.version, "age": now - self.loaded,
+				"pending": len(self.pending), "sync_lag": now - self.first_pending if self.pending else 0.0,
+				"last_sync": self.last_sync, "reads": self.reads, "disk_reads": self.disk_reads, "writes": self.writes, "syncs": self.syncs,
+				"failed": self.failed, "last_error": self.last_error}
+
+	def close(self):
+		'''Writes the pending writes, then stops the sync thread and closes both databases
+
+		Arguments:
+			None
+
+		Usage:
+			mirror.close()
+
+		returns None'''
+		self.stopped.set()
+		if self.thread is not None:
+			self.thread.join()
+		try:
+			self.sync()
+		finally:
+			self.memory.close()
+			self.disk.close()
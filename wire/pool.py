@@ -0,0 +1,441 @@
+# Rushy Panchal
+# wire/pool.py
+# Provides the ConnectionPool and PooledDatabase classes
+
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+	import Queue as queue
+except ImportError:
+	import queue
+
+from database import Database
+from cursor import ExecutionCursor, BufferedCursor
+from table import Table
+
+class ConnectionPool(object):
+	'''Pool of connections to a database file in WAL mode: one writer and several concurrent readers'''
+	def __init__(self, path, readers = 4, timeout = None, **kwargs):
+		'''Creates the ConnectionPool object
+
+		Arguments:
+			path - path to database
+			readers - number of reader connections (defaults to 4)
+			timeout - seconds to wait for a free connection before raising Queue.Empty (defaults to waiting forever)
+			**kwargs - additional arguments for each Database
+
+		Usage:
+			pool = ConnectionPool("test.db", readers = 8)
+
+		returns the ConnectionPool object'''
+		self.path, self.size, self.timeout = path, readers, timeout
+		self.write_connection = Database(path, check_same_thread = False, **kwargs)
+		self.write_connection.cursor().execute("PRAGMA journal_mode = WAL")
+		self.write_lock = threading.RLock()
+		self.read_connections = queue.Queue()
+		for index in range(readers):
+			reader = Database(path, check_same_thread = False, **kwargs)
+			reader.cursor().execute("PRAGMA query_only = 1")
+			self.read_connections.put(reader)
+		self.stats_lock = threading.Lock()
+		self.waits = {"reader": [0, 0.0, 0.0], "writer": [0, 0.0, 0.0]}
+
+	def record(self, kind, wait):
+		'''Internal function --- records the time spent waiting for a connection
+
+		Arguments:
+			kind - "reader" or "writer"
+			wait - seconds spent waiting
+
+		Usage:
+			pool.record("reader", 0.002)
+
+		returns None'''
+		with self.stats_lock:
+			stats = self.waits[kind]
+			stats[0] += 1
+			stats[1] += wait
+			stats[2] = max(stats[2], wait)
+
+	@contextmanager
+	def reader(self):
+		'''Checks out a reader connection for the duration of the block
+
+		Arguments:
+			None
+
+		Usage:
+			with pool.reader() as db:
+				for user in db.select("users"):
+					print(user)
+
+		returns a context manager'''
+		start = time.time()
+		db = self.read_connections.get(timeout = self.timeout)
+		self.record("reader", time.time() - start)
+		try:
+			yield db
+		finally:
+			self.read_connections.put(db)
+
+	@contextmanager
+	def allReaders(self):
+		'''Checks out every reader connection for the duration of the block, waiting for the ones in use
+
+		Arguments:
+			None
+
+		Usage:
+			with pool.allReaders() as readers:
+				for db in readers:
+					db.instrument()
+
+		returns a context manager (the calling thread must not hold a reader already)'''
+		readers = []
+		try:
+			for index in range(self.size):
+				readers.append(self.read_connections.get(timeout = self.timeout))
+			yield readers
+		finally:
+			for db in readers:
+				self.read_connections.put(db)
+
+	@contextmanager
+	def writer(self):
+		'''Checks out the writer connection for the duration of the block
+
+		Arguments:
+			None
+
+		Usage:
+			with pool.writer() as db:
+				db.insert("users", id = 1, username = "panchr")
+
+		returns a context manager'''
+		start = time.time()
+		self.write_lock.acquire()
+		self.record("writer", time.time() - start)
+		try:
+			yield self.write_connection
+		finally:
+			self.write_lock.release()
+
+	def stats(self):
+		'''Reports the pool size and the time spent waiting for connections
+
+		Arguments:
+			None
+
+		Usage:
+			stats = pool.stats()
+
+		returns a dictionary of the pool size, idle readers, and the checkouts, total, average and maximum wait (in seconds) per connection kind'''
+		with self.stats_lock:
+			stats = {"readers": self.size, "idle_readers": self.read_connections.qsize()}
+			for kind, (checkouts, total, maximum) in self.waits.items():
+				stats[kind] = {"checkouts": checkouts, "total_wait": total, "max_wait": maximum,
+					"average_wait": total / checkouts if checkouts else 0.0}
+			return stats
+
+	def close(self):
+		'''Closes every connection in the pool
+
+		Arguments:
+			None
+
+		Usage:
+			pool.close()
+
+		returns None'''
+		with self.write_lock:
+			self.write_connection.close()
+		for index in range(self.size):
+			self.read_connections.get(timeout = self.timeout).close()
+
+class Locked(object):
+	'''Internal class --- calls the methods of an object while holding a lock'''
+	def __init__(self, target, lock):
+		'''Creates the Locked object
+
+		Arguments:
+			target - object to wrap
+			lock - lock to hold during each method call
+
+		Usage:
+			schema = Locked(db.schema, lock)
+
+		returns the Locked object'''
+		self.target, self.lock = target, lock
+
+	def __getattr__(self, name):
+		'''Retrieves an attribute of the target, wrapping methods so they hold the lock'''
+		value = getattr(self.target, name)
+		if not callable(value):
+			return value
+		def locked(*args, **kwargs):
+			with self.lock:
+				return value(*args, **kwargs)
+		return locked
+
+class Checkout(object):
+	'''Internal class --- holds a pool connection from the beginning to the end of a with block on a context manager'''
+	def __init__(self, target, checkout):
+		'''Creates the Checkout object
+
+		Arguments:
+			target - context manager (or object with context manager methods) to wrap
+			checkout - function returning a context manager that checks out the connection (such as ConnectionPool.writer)
+
+		Usage:
+			trans = Checkout(pool.write_connection.transaction(), pool.writer)
+
+		returns the Checkout object'''
+		self.target, self.checkout, self.checkouts = target, checkout, []
+
+	def __enter__(self):
+		'''Checks out the connection, then enters the target'''
+		checkout = self.checkout()
+		checkout.__enter__()
+		try:
+			value = self.target.__enter__()
+		except Exception:
+			checkout.__exit__(*sys.exc_info())
+			raise
+		self.checkouts.append(checkout)
+		return value
+
+	def __exit__(self, error_type, error, traceback):
+		'''Exits the target, then returns the connection'''
+		try:
+			return self.target.__exit__(error_type, error, traceback)
+		finally:
+			self.checkouts.pop().__exit__(None, None, None)
+
+	def __getattr__(self, name):
+		'''Retrieves an attribute of the target, wrapping methods so they hold the connection'''
+		value = getattr(self.target, name)
+		if not callable(value):
+			return value
+		def checkedOut(*args, **kwargs):
+			with self.checkout():
+				return value(*args, **kwargs)
+		return checkedOut
+
+class PooledDatabase(object):
+	'''Database interface backed by a ConnectionPool --- select and aggregate run on the readers, everything else on the writer'''
+	def __init__(self, path, readers = 4, timeout = None, **kwargs):
+		'''Opens a pooled SQLite database (or creates it if it does not exist)
+
+		Arguments:
+			path - path to database
+			readers - number of reader connections (defaults to 4)
+			timeout - seconds to wait for a free connection (defaults to waiting forever)
+			**kwargs - additional arguments for each Database
+
+		Usage:
+			db = PooledDatabase("test.db", readers = 8)
+			users = db.select("users").fetch() # safe to call from any thread
+
+		Results are fetched before the connection is returned to the pool, so use ConnectionPool.reader
+		to stream large results. Transactions and batches hold the writer for the whole with block, and ConnectionPool.writer
+		runs any other group of statements without other threads writing in between
+
+		returns a PooledDatabase object'''
+		self.pool = ConnectionPool(path, readers, timeout, **kwargs)
+		self.path = path
+		self.schema = Locked(self.pool.write_connection.schema, self.pool.write_lock)
+
+	def __getattr__(self, name):
+		'''Runs any other Database method on the writer connection'''
+		value = getattr(self.pool.write_connection, name)
+		if not callable(value):
+			return value
+		def write(*args, **kwargs):
+			with self.pool.writer():
+				return self.buffer(value(*args, **kwargs))
+		return write
+
+	@staticmethod
+	def buffer(results):
+		'''Internal function --- fetches the rows of an ExecutionCursor so it can outlive its connection checkout
+
+		Arguments:
+			results - return value of a Database method
+
+		Usage:
+			results = PooledDatabase.buffer(db.select("users"))
+
+		returns the results, with any ExecutionCursor buffered'''
+		if isinstance(results, ExecutionCursor):
+			return ExecutionCursor(BufferedCursor(results.cursor), results.chunk_size)
+		return results
+
+	def select(self, table = None, **options):
+		'''Selects rows from the table, using a reader connection
+
+		see Database.select for further reference'''
+		with self.pool.reader() as db:
+			if not table:
+				table = self.pool.write_connection.defaultTable
+			return self.buffer(db.select(table, **options))
+
+	def aggregate(self, table = None, aggregates = (), **options):
+		'''Computes aggregate values of the table, using a reader connection
+
+		see Database.aggregate for further reference'''
+		with self.pool.reader() as db:
+			if not table:
+				table = self.pool.write_connection.defaultTable
+			return self.buffer(db.aggregate(table, aggregates, **options))
+
+	def everyConnection(self, name, *args, **kwargs):
+		'''Internal function --- calls a Database method on every reader and on the writer
+
+		Arguments:
+			name - name of the Database method
+			*args, **kwargs - arguments to the method
+
+		Usage:
+			cache = db.everyConnection("enableCache", 1024)
+
+		returns the return value of the method on the writer'''
+		with self.pool.allReaders() as readers:
+			with self.pool.writer() as writer:
+				for reader in readers:
+					getattr(reader, name)(*args, **kwargs)
+				return getattr(writer, name)(*args, **kwargs)
+
+	def enableCache(self, size = 256, ttl = None, max_rows = 10000):
+		'''Caches the results of select on every connection --- each reader has its own cache, cleared when the writer commits
+
+		see Database.enableCache for further reference (returns the ResultCache of the writer)'''
+		return self.everyConnection("enableCache", size, ttl, max_rows)
+
+	def disableCache(self):
+		'''Stops caching the results of select on every connection
+
+		see Database.disableCache for further reference'''
+		return self.everyConnection("disableCache")
+
+	def cacheStats(self):
+		'''Reports the statistics of the result caches of every connection, added up
+
+		see Database.cacheStats for further reference'''
+		with self.pool.allReaders() as readers:
+			with self.pool.writer() as writer:
+				caches = [db.result_cache for db in readers + [writer] if db.result_cache is not None]
+				reports = [cache.stats() for cache in caches]
+		if not reports:
+			return None
+		stats = dict((key, sum(report[key] for report in reports)) for key in ("size", "capacity", "hits", "misses", "evictions", "invalidations"))
+		lookups = stats["hits"] + stats["misses"]
+		stats["hit_ratio"] = float(stats["hits"]) / lookups if lookups else 0.0
+		return stats
+
+	def instrument(self, slow_threshold = 0.1, explain = True, samples = 1000, slow_log_size = 100):
+		'''Starts recording the statements of every connection
+
+		see Database.instrument for further reference (returns the Instrumentation of the writer)'''
+		return self.everyConnection("instrument", slow_threshold, explain, samples, slow_log_size)
+
+	def uninstrument(self):
+		'''Stops recording the statements of every connection
+
+		see Database.uninstrument for further reference'''
+		return self.everyConnection("uninstrument")
+
+	def queryStats(self):
+		'''Reports the timing statistics of each statement shape, over every connection
+
+		see Instrumentation.stats for further reference (returns None if the database is not instrumented)'''
+		with self.pool.allReaders() as readers:
+			with self.pool.writer() as writer:
+				if writer.instrumentation is None:
+					return None
+				return writer.instrumentation.stats([db.instrumentation for db in readers if db.instrumentation is not None])
+
+	def slowQueries(self):
+		'''Retrieves the slow-query log of every connection
+
+		see Instrumentation.slowQueries for further reference (returns None if the database is not instrumented)'''
+		with self.pool.allReaders() as readers:
+			with self.pool.writer() as writer:
+				if writer.instrumentation is None:
+					return None
+				return writer.instrumentation.slowQueries([db.instrumentation for db in readers if db.instrumentation is not None])
+
+	def enableIndexAdvisor(self):
+		'''Starts observing the filters of every connection, with one IndexAdvisor shared by the readers and the writer
+
+		see Database.enableIndexAdvisor for further reference (the advisor's methods hold the writer, which runs its
+		EXPLAIN QUERY PLAN statements and creates its indexes)'''
+		with self.pool.allReaders() as readers:
+			with self.pool.writer() as writer:
+				advisor = writer.enableIndexAdvisor()
+				for reader in readers:
+					reader.index_advisor = advisor
+		return Locked(advisor, self.pool.write_lock)
+
+	def disableIndexAdvisor(self):
+		'''Stops observing the filters of every connection
+
+		see Database.disableIndexAdvisor for further reference'''
+		return self.everyConnection("disableIndexAdvisor")
+
+	def transaction(self, *args, **kwargs):
+		'''Starts a new database transaction on the writer connection, which it holds from the beginning to the end of its with block
+
+		Used without a with block, each of its method calls holds the writer instead
+
+		see Database.transaction for further reference'''
+		with self.pool.writer() as db:
+			return Checkout(db.transaction(*args, **kwargs), self.pool.writer)
+
+	def batch(self):
+		'''Defers all commits until the end of the block, holding the writer connection for the whole block
+
+		The block receives the writer connection, so that its reads see the uncommitted writes of the batch
+
+		see Database.batch for further reference'''
+		return Checkout(self.pool.write_connection.batch(), self.pool.writer)
+
+	def table(self, name, verify = True):
+		'''Creates a Table object that uses the pool
+
+		see Database.table for further reference'''
+		return PooledTable(self, name, verify)
+
+	def stats(self):
+		'''Reports the pool statistics
+
+		see ConnectionPool.stats for further reference'''
+		return self.pool.stats()
+
+	def close(self):
+		'''Closes every connection in the pool
+
+		see ConnectionPool.close for further reference'''
+		self.pool.close()
+
+class PooledTable(Table):
+	'''Table of a PooledDatabase --- its reads use the readers, and its writes and schema changes hold the writer until they finish
+
+	A rebuild (see Table.rebuild) holds the writer from the first chunk to the swap, so the writes of other threads wait for it,
+	while their reads do not'''
+	pass
+
+def writing(name):
+	'''Internal function --- creates a PooledTable method that holds the writer connection while the Table method runs'''
+	method = getattr(Table, name)
+	def locked(self, *args, **kwargs):
+		with self.db.pool.writer():
+			return method(self, *args, **kwargs)
+	locked.__name__, locked.__doc__ = name, method.__doc__
+	return locked
+
+for name in ["drop", "rename", "addColumns", "dropColumns", "renameColumns", "alter", "rebuild", "createIndex", "dropIndex",
+	"importRows", "insert", "insertMany", "update", "delete"]:
+	setattr(PooledTable, name, writing(name))
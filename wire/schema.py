@@ -0,0 +1,147 @@
+# Rushy Panchal
+# wire/schema.py
+# The SchemaCache class caches the table and column metadata of a Database
+
+import sqlite3
+
+class SchemaCache(object):
+	'''Internal class --- caches the tables and column metadata of a Database'''
+	def __init__(self, db):
+		'''Creates the SchemaCache object
+
+		Arguments:
+			db - Database object
+
+		Usage:
+			schema = SchemaCache(db)
+
+		returns the SchemaCache object'''
+		self.db = db
+		self.version = None
+		self.names = {}
+		self.columns = {}
+		self.index_lists = {}
+
+	def query(self, query, fallback, *args):
+		'''Internal function --- runs a metadata query without going through Database.execute
+
+		The table-valued PRAGMA functions are tried first: unlike PRAGMA statements, they are plain SELECTs,
+		so they never commit the statements deferred by the commit policy
+
+		Arguments:
+			query - SELECT query over the table-valued PRAGMA functions
+			fallback - equivalent PRAGMA statement, for SQLite versions older than 3.16
+			*args - parameters of the SELECT query
+
+		Usage:
+			rows = schema.query("SELECT * FROM pragma_table_info(?)", "PRAGMA table_info(users)", "users")
+
+		returns a list of rows'''
+		cursor = self.db.cursor()
+		try:
+			return cursor.execute(query, args).fetchall()
+		except sqlite3.OperationalError:
+			return cursor.execute(fallback).fetchall()
+
+	def check(self):
+		'''Invalidates the cache if the schema was changed, by this or any other connection
+
+		Arguments:
+			None
+
+		Usage:
+			schema.check()
+
+		returns None'''
+		version = tuple(self.query("SELECT (SELECT schema_version FROM main.pragma_schema_version), (SELECT schema_version FROM temp.pragma_schema_version)",
+			"PRAGMA schema_version")[0])
+		if version != self.version:
+			self.invalidate()
+			self.version = version
+
+	def invalidate(self):
+		'''Removes every table and column from the cache
+
+		Arguments:
+			None
+
+		Usage:
+			db.schema.invalidate()
+
+		returns None'''
+		self.version = None
+		self.names.clear()
+		self.columns.clear()
+		self.index_lists.clear()
+
+	def load(self, temp = False):
+		'''Internal function --- loads the table names into the cache
+
+		Arguments:
+			temp - whether or not to include temporary tables
+
+		Usage:
+			names, name_set = schema.load()
+
+		returns a list and a set of table names'''
+		self.check()
+		if temp not in self.names:
+			if temp:
+				query = "SELECT name FROM (SELECT * FROM sqlite_master UNION SELECT * FROM sqlite_temp_master) WHERE type = 'table' ORDER BY name"
+			else:
+				query = "SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name"
+			names = [row[0] for row in self.db.cursor().execute(query).fetchall()]
+			self.names[temp] = (names, frozenset(names))
+		return self.names[temp]
+
+	def tables(self, temp = False):
+		'''Retrieves the names of the tables in the database
+
+		see Database.tables for further reference'''
+		return list(self.load(temp)[0])
+
+	def exists(self, name, temp = False):
+		'''Checks if a table exists
+
+		see Database.tableExists for further reference'''
+		return name in self.load(temp)[1]
+
+	def info(self, table):
+		'''Retrieves the column metadata of a table
+
+		Arguments:
+			table - table name
+
+		Usage:
+			info = db.schema.info("users")
+
+		returns a list of dictionaries with the cid, name, type, notnull, dflt_value and pk of each column'''
+		self.check()
+		if table not in self.columns:
+			rows = self.query("SELECT * FROM pragma_table_info(?)", "PRAGMA table_info({table})".format(table = table), table)
+			self.columns[table] = [dict(zip(("cid", "name", "type", "notnull", "dflt_value", "pk"), row)) for row in rows]
+		return [dict(column) for column in self.columns[table]]
+
+	def indexes(self, table):
+		'''Retrieves the indexes of a table
+
+		Arguments:
+			table - table name
+
+		Usage:
+			indexes = db.schema.indexes("users")
+
+		returns a list of dictionaries with the name, unique, origin, partial and columns of each index'''
+		self.check()
+		if table not in self.index_lists:
+			indexes = []
+			for row in self.query("SELECT * FROM pragma_index_list(?)", "PRAGMA index_list({table})".format(table = table), table):
+				index = dict(zip(("seq", "name", "unique", "origin", "partial"), row))
+				columns = self.query("SELECT * FROM pragma_index_info(?)", "PRAGMA index_info({index})".format(index = index["name"]), index["name"])
+				index["columns"] = [column[2] for column in sorted(columns)]
+				index["unique"] = bool(index["unique"])
+				index.pop("seq")
+				indexes.append(index)
+			self.index_lists[table] = sorted(indexes, key = lambda index: index["name"])
+		return [dict(index, columns = list(index["columns"])) for index in self.index_lists[table]]
+
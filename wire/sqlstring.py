@@ -2,8 +2,95 @@
 # wire/sqlstring.py
 # The SQL String class generates SQL queries
 
+import re
+import threading
+from collections import OrderedDict
+from operator import itemgetter
+
+ALL = "*"
+NORMALIZE_PATTERNS = [(re.compile(pattern), replacement) for pattern, replacement in (
+	(r"'(?:[^']|'')*'", "?"), # string literals
+	(r"(?<![\w`])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?(?![\w`])", "?"), # numeric literals
+	(r"\(\s*\?(?:\s*,\s*\?)*\s*\)", "(...)"), # lists of values
+	(r"\s+", " "))]
+SET_TYPES = (list, tuple, set, frozenset)
+AGGREGATES = ("count", "sum", "avg", "min", "max")
+
+class StatementCache(object):
+	'''Internal class --- bounded LRU cache of compiled SQL statements, shared by every thread of the process'''
+	def __init__(self, size = 512):
+		'''Creates the StatementCache object
+
+		Arguments:
+			size - maximum number of statements to keep (defaults to 512)
+
+		Usage:
+			cache = StatementCache(1024)
+
+		returns the StatementCache object'''
+		self.size = size
+		self.statements = OrderedDict()
+		self.lock = threading.Lock()
+		self.hits, self.misses, self.evictions = 0, 0, 0
+
+	def get(self, key, compile, *args):
+		'''Retrieves a compiled statement, compiling it on a miss
+
+		Arguments:
+			key - hashable statement shape
+			compile - function that compiles the statement
+			*args - arguments to the compile function
+
+		Usage:
+			query, order = cache.get(("insert", "users", ("id",)), SQLString.compileInsert, "users", ("id",))
+
+		returns the compiled statement'''
+		with self.lock:
+			statement = self.statements.pop(key, None)
+			if statement is not None:
+				self.hits += 1
+				self.statements[key] = statement
+				return statement
+		statement = compile(*args) # outside the lock, since compiling is the slow part
+		with self.lock:
+			self.misses += 1
+			if key not in self.statements:
+				while self.statements and len(self.statements) >= self.size:
+					self.statements.popitem(last = False)
+					self.evictions += 1
+			self.statements[key] = statement
+		return statement
+
+	def clear(self):
+		'''Removes every statement from the cache
+
+		Arguments:
+			None
+
+		Usage:
+			cache.clear()
+
+		returns None'''
+		with self.lock:
+			self.statements.clear()
+
+	def stats(self):
+		'''Reports the cache statistics
+
+		Arguments:
+			None
+
+		Usage:
+			stats = cache.stats()
+
+		returns a dictionary of the size, capacity, hits, misses and evictions'''
+		with self.lock:
+			return {"size": len(self.statements), "capacity": self.size, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
 class SQLString(object):
 	'''Internal class --- provides SQL string creation functions'''
+	cache = StatementCache()
+
 	@classmethod
 	def pragma(cls, cmd):
 		'''Generates a PRAGMA SQL query
@@ -50,6 +137,39 @@ class SQLString(object):
 		query = "ALTER TABLE {table} RENAME TO {name}".format(table = name, name = new_name)
 		return query
 
+	@classmethod
+	def createIndex(cls, table, name, columns, unique = False, where = None):
+		'''Generates a CREATE INDEX query
+
+		see Table.createIndex for further reference'''
+		query = "CREATE {unique}INDEX IF NOT EXISTS {name} ON {table} ({columns})".format(unique = "UNIQUE " if unique else "",
+			name = name, table = table, columns = ', '.join(cls.compileOrder(column) for column in columns))
+		if where:
+			query += " WHERE {where}".format(where = where)
+		return query
+
+	@classmethod
+	def dropIndex(cls, name):
+		'''Generates a DROP INDEX query
+
+		see Table.dropIndex for further reference'''
+		query = "DROP INDEX IF EXISTS {name}".format(name = name)
+		return query
+
+	@classmethod
+	def indexName(cls, table, columns):
+		'''Internal function --- generates the default name of an index
+
+		Arguments:
+			table - table name
+			columns - list of column names
+
+		Usage:
+			name = indexName("users", ["tier", "-id"]) # users_tier_id_index
+
+		returns the index name'''
+		return "{table}_{columns}_index".format(table = table, columns = '_'.join(column.lstrip("-") for column in columns))
+
 	@classmethod
 	def addColumn(cls, table, name, col_type):
 		'''Generates an ALTER TABLE ADD SQL query
@@ -62,30 +182,73 @@ class SQLString(object):
 		query = "ALTER TABLE {table} ADD COLUMN {name} {type}".format(table = table, name = name, type = column_str)
 		return query
 
+	@classmethod
+	def dropColumn(cls, table, name):
+		'''Generates an ALTER TABLE DROP COLUMN SQL query
+
+		see Table.dropColumns for further reference'''
+		query = "ALTER TABLE {table} DROP COLUMN {name}".format(table = table, name = cls.escapeColumn(name))
+		return query
+
+	@classmethod
+	def renameColumn(cls, table, name, new_name):
+		'''Generates an ALTER TABLE RENAME COLUMN SQL query
+
+		see Table.renameColumns for further reference'''
+		query = "ALTER TABLE {table} RENAME COLUMN {name} TO {new_name}".format(table = table, name = cls.escapeColumn(name),
+			new_name = cls.escapeColumn(new_name))
+		return query
+
 	@classmethod
 	def insert(cls, table, **columns):
 		'''Generates an INSERT SQL query
 
 		see Database.insert for further reference'''
-		column_values = list(columns.items())
-		column_names = ', '.join(map(cls.escapeColumn, cls.extract(column_values)))
-		values = cls.extract(column_values, 1)
-		value_string = ', '.join("?" * len(values))
+		names = tuple(sorted(columns))
+		query, order = cls.cache.get(("insert", table, names), cls.compileInsert, table, names)
+		return query, order(columns)
+
+	@classmethod
+	def compileInsert(cls, table, names):
+		'''Internal function --- compiles an INSERT SQL query
+
+		see SQLString.insert for further reference'''
+		column_names = ', '.join(map(cls.escapeColumn, names))
+		value_string = ', '.join("?" * len(names))
 		query = "INSERT INTO {table} ({columns}) VALUES ({values})".format(table = table, columns = column_names, values = value_string)
-		return query, values
+		return query, cls.valueGetter(names)
+
+	@classmethod
+	def insertMany(cls, table, columns, count):
+		'''Generates an INSERT SQL query to be executed once per row
+
+		see Database.insertMany for further reference'''
+		column_names = " ({columns})".format(columns = ', '.join(map(cls.escapeColumn, columns))) if columns else ""
+		value_string = ', '.join("?" * count)
+		query = "INSERT INTO {table}{columns} VALUES ({values})".format(table = table, columns = column_names, values = value_string)
+		return query
 
 	@classmethod
 	def update(cls, table, equal = None, like = None, where = "1 = 1", **columns):
 		'''Generates an UPDATE SQL query
 
 		see Database.update for further reference'''
-		column_values = list(columns.items())
-		column_str = cls.joinOperatorExpressions(cls.extract(column_values), ',')
-		like_str, equal_str, values_like_equal = cls.inputToQueryString(like, equal)
-		values = cls.extract(column_values, 1) + values_like_equal
-		where = cls.joinClauses(like_str, equal_str, where)
+		like, equal = like or {}, equal or {}
+		names, like_names, equal_names = tuple(sorted(columns)), tuple(sorted(like)), cls.equalNames(equal)
+		query, order = cls.cache.get(("update", table, names, like_names, equal_names, where),
+			cls.compileUpdate, table, names, like_names, equal_names, where)
+		return query, order(columns, like, equal)
+
+	@classmethod
+	def compileUpdate(cls, table, names, like_names, equal_names, where):
+		'''Internal function --- compiles an UPDATE SQL query
+
+		see SQLString.update for further reference'''
+		column_str = cls.joinOperatorExpressions(names, ',')
+		where = cls.compileWhere(like_names, equal_names, where)
 		query = "UPDATE {table} SET {columns} WHERE {where}".format(table = table, columns = column_str, where = where)
-		return query, values
+		get_columns, get_filters = cls.valueGetter(names), cls.filterGetter(like_names, equal_names)
+		return query, lambda columns, like, equal: get_columns(columns) + get_filters(like, equal)
 
 	@classmethod
 	def select(cls, table, **options):
@@ -93,24 +256,258 @@ class SQLString(object):
 
 		see Database.select for further reference'''
 		user_columns = options.get('columns')
-		if user_columns:
+		user_columns = tuple(user_columns) if user_columns and user_columns != ALL else ALL
+		like, equal = options.get('like') or {}, options.get('equal') or {}
+		like_names, equal_names, where = tuple(sorted(like)), cls.equalNames(equal), options.get('where', '1 = 1')
+		order_by, group_by = cls.names(options.get('order_by')), cls.names(options.get('group_by'))
+		aggregates = tuple(tuple(aggregate) for aggregate in options.get('aggregates') or ())
+		limit, offset = options.get('limit'), options.get('offset')
+		page = tuple(value for value in (limit, offset) if value is not None)
+		shape = (table, user_columns, like_names, equal_names, where, order_by, limit is not None, offset is not None, group_by, aggregates)
+		query, order = cls.cache.get(("select",) + shape, cls.compileSelect, *shape)
+		return query, order(like, equal) + tuple(options.get('parameters') or ()) + page
+
+	@classmethod
+	def aggregate(cls, table, aggregates, **options):
+		'''Generates a SELECT SQL query that aggregates the rows
+
+		Arguments:
+			table - table name to select from
+			aggregates - list of (function, column) pairs, where function is count, sum, avg, min or max
+				(each result column is named function_column, or count for ("count", ALL))
+			group_by - column name, or list of column names, to group the rows by (optional)
+			**options - see Database.select
+
+		Usage:
+			query, values = SQLString.aggregate("orders", [("count", ALL), ("sum", "total")], group_by = "region")
+
+		returns the query and its values'''
+		return cls.select(table, aggregates = aggregates, **options)
+
+	@classmethod
+	def compileSelect(cls, table, user_columns, like_names, equal_names, where, order_by = (), limit = False, offset = False, group_by = (), aggregates = ()):
+		'''Internal function --- compiles a SELECT SQL query
+
+		see SQLString.select for further reference'''
+		if aggregates:
+			names = user_columns if user_columns != ALL else group_by
+			columns = ', '.join(list(map(cls.escapeColumn, names)) + [cls.compileAggregate(*aggregate) for aggregate in aggregates])
+		elif user_columns != ALL:
 			columns = ','.join('`{column}`'.format(column = column) for column in user_columns)
 		else:
 			columns = ALL
-		like_str, equal_str, values = cls.inputToQueryString(options.get('like'), options.get('equal'))
-		where = cls.joinClauses(like_str, equal_str, options.get('where', '1 = 1'))
+		where = cls.compileWhere(like_names, equal_names, where)
 		query = "SELECT {columns} FROM {table} WHERE {where}".format(columns = columns, table = table, where = where)
-		return query, values
+		if group_by:
+			query += " GROUP BY " + ', '.join(map(cls.escapeColumn, group_by))
+		if order_by:
+			query += " ORDER BY " + ', '.join(cls.compileOrder(column) for column in order_by)
+		if limit or offset:
+			query += " LIMIT ?" if limit else " LIMIT -1"
+		if offset:
+			query += " OFFSET ?"
+		return query, cls.filterGetter(like_names, equal_names)
+
+	@classmethod
+	def compileAggregate(cls, function, column):
+		'''Internal function --- compiles an aggregate function call
+
+		Arguments:
+			function - count, sum, avg, min or max
+			column - column name (or ALL, for count)
+
+		Usage:
+			expression = compileAggregate("sum", "total") # SUM(`total`) AS `sum_total`
+
+		returns the aggregate expression'''
+		function = function.lower()
+		if function not in AGGREGATES:
+			raise ValueError('Aggregate function must be one of {functions}'.format(functions = ', '.join(AGGREGATES)))
+		if column == ALL:
+			if function != "count":
+				raise ValueError('Only count can aggregate every column')
+			return "COUNT(*) AS `count`"
+		return "{function}({column}) AS `{function_lower}_{name}`".format(function = function.upper(), column = cls.escapeColumn(column),
+			function_lower = function, name = column)
+
+	@classmethod
+	def names(cls, value):
+		'''Internal function --- converts a column name or list of column names to a tuple
+
+		Arguments:
+			value - column name, list of column names, or None
+
+		Usage:
+			names = names("id") # ("id",)
+
+		returns a tuple of column names'''
+		if not value:
+			return ()
+		return (value,) if isinstance(value, basestring) else tuple(value)
+
+	@classmethod
+	def compileOrder(cls, column):
+		'''Internal function --- compiles a term of an ORDER BY clause
+
+		Arguments:
+			column - column name, prefixed with "-" for descending order
+
+		Usage:
+			term = compileOrder("-id") # `id` DESC
+
+		returns the ORDER BY term'''
+		if column.startswith("-"):
+			return "`{column}` DESC".format(column = column[1:])
+		return "`{column}` ASC".format(column = column)
 
 	@classmethod
 	def delete(cls, table, **options):
 		'''Generates a DELETE SQL query
 
 		see Database.delete for further reference'''
-		like_str, equal_str, values = cls.inputToQueryString(options.get('like'), options.get('equal'))
-		where = cls.joinClauses(like_str, equal_str, options.get('where', '1 = 0'))
+		like, equal = options.get('like') or {}, options.get('equal') or {}
+		like_names, equal_names, where = tuple(sorted(like)), cls.equalNames(equal), options.get('where', '1 = 0')
+		query, order = cls.cache.get(("delete", table, like_names, equal_names, where),
+			cls.compileDelete, table, like_names, equal_names, where)
+		return query, order(like, equal)
+
+	@classmethod
+	def compileDelete(cls, table, like_names, equal_names, where):
+		'''Internal function --- compiles a DELETE SQL query
+
+		see SQLString.delete for further reference'''
+		where = cls.compileWhere(like_names, equal_names, where)
 		query = "DELETE FROM {table} WHERE {where}".format(table = table, where = where)
-		return query, values
+		return query, cls.filterGetter(like_names, equal_names)
+
+	@classmethod
+	def equalNames(cls, equal):
+		'''Internal function --- determines the shape of the equal filters
+
+		Arguments:
+			equal - dictionary of columns and values (a list, tuple or set of values generates an IN clause)
+
+		Usage:
+			equal_names = equalNames({"id": [1, 2, 3], "tier": 2}) # (("id", 4), "tier")
+
+		returns a tuple of the sorted column names, with (name, count) for each IN list (see SQLString.listSize)'''
+		return tuple((name, cls.listSize(len(equal[name]))) if isinstance(equal[name], SET_TYPES) else name for name in sorted(equal))
+
+	@classmethod
+	def listSize(cls, count):
+		'''Internal function --- rounds the length of an IN list up to a power of two
+
+		Lists of similar lengths then share one compiled statement (and one statement shape), instead of filling the statement
+		cache with a statement per length. The list is padded by repeating its last value, which does not change the results
+
+		Arguments:
+			count - number of values in the list
+
+		Usage:
+			size = SQLString.listSize(5) # 8
+
+		returns the number of parameters of the IN list'''
+		size = 1
+		while size < count:
+			size *= 2
+		return size if count else 0
+
+	@classmethod
+	def compileWhere(cls, like_names, equal_names, where):
+		'''Internal function --- compiles the WHERE clause of a query
+
+		Arguments:
+			like_names - column names to use with the LIKE operator
+			equal_names - column names to use with the = operator, or (name, count) to use with the IN operator
+			where - custom WHERE clause
+
+		Usage:
+			where = compileWhere(("username",), ("id",), "1 = 1") # `username` LIKE ? AND `id` = ? AND 1 = 1
+			where = compileWhere((), (("id", 3),), "1 = 1") # `id` IN (?, ?, ?) AND 1 = 1
+
+		returns the WHERE clause'''
+		like_str = cls.joinOperatorExpressions(like_names, 'AND', "LIKE")
+		equal_str = cls.joinExpressions(equal_names, "AND", cls.compileEqual)
+		return cls.joinClauses(like_str, equal_str, where)
+
+	@classmethod
+	def compileEqual(cls, name):
+		'''Internal function --- compiles an equal filter
+
+		Arguments:
+			name - column name, or (name, count) for an IN list
+
+		Usage:
+			clause = compileEqual(("id", 2)) # `id` IN (?, ?)
+
+		returns the filter expression'''
+		if isinstance(name, basestring):
+			return "{column} = ?".format(column = cls.escapeColumn(name))
+		return "{column} IN ({values})".format(column = cls.escapeColumn(name[0]), values = ', '.join("?" * name[1]))
+
+	@classmethod
+	def valueGetter(cls, names):
+		'''Internal function --- creates a function that orders the values of a dictionary
+
+		Arguments:
+			names - ordered column names
+
+		Usage:
+			order = valueGetter(("id", "username"))
+			values = order({"username": "panchr", "id": 1}) # (1, "panchr")
+
+		returns a function that converts a dictionary to a tuple of values'''
+		if not names:
+			return lambda values: ()
+		if len(names) == 1:
+			name = names[0]
+			return lambda values: (values[name],)
+		return itemgetter(*names)
+
+	@classmethod
+	def filterGetter(cls, like_names, equal_names):
+		'''Internal function --- creates a function that orders the values of the like and equal dictionaries
+
+		see SQLString.valueGetter for further reference'''
+		get_like = cls.valueGetter(like_names)
+		if all(isinstance(name, basestring) for name in equal_names):
+			get_equal = cls.valueGetter(equal_names)
+		else:
+			def get_equal(equal):
+				values = []
+				for name in equal_names:
+					if isinstance(name, basestring):
+						values.append(equal[name])
+					else:
+						items = tuple(equal[name[0]])
+						values.extend(items)
+						if len(items) < name[1]:
+							values.extend(items[-1:] * (name[1] - len(items)))
+				return tuple(values)
+		return lambda like, equal: get_like(like) + get_equal(equal)
+
+	@classmethod
+	def affinity(cls, declared):
+		'''Determines the SQLite type affinity of a declared column type
+
+		Arguments:
+			declared - declared column type
+
+		Usage:
+			affinity = affinity("VARCHAR(50)") # TEXT
+			affinity = affinity("BIGINT") # INTEGER
+
+		returns INTEGER, TEXT, BLOB, REAL, or NUMERIC'''
+		declared = (declared or "").upper()
+		if "INT" in declared:
+			return "INTEGER"
+		if any(name in declared for name in ("CHAR", "CLOB", "TEXT")):
+			return "TEXT"
+		if "BLOB" in declared or not declared:
+			return "BLOB"
+		if any(name in declared for name in ("REAL", "FLOA", "DOUB")):
+			return "REAL"
+		return "NUMERIC"
 
 	@classmethod
 	def extract(cls, values, index = 0):
@@ -201,6 +598,21 @@ class SQLString(object):
 		returns joined clauses'''
 		return ' AND '.join(filter(lambda item: bool(item), clauses))
 
+	@classmethod
+	def normalize(cls, query):
+		'''Normalizes a query to its shape, so that queries that only differ by their values are grouped together
+
+		Arguments:
+			query - SQL query
+
+		Usage:
+			shape = normalize("SELECT * FROM users WHERE `id` IN (?, ?) AND `tier` > 2") # SELECT * FROM users WHERE `id` IN (...) AND `tier` > ?
+
+		returns the normalized query'''
+		for pattern, replacement in NORMALIZE_PATTERNS:
+			query = pattern.sub(replacement, query)
+		return query.strip()
+
 	@classmethod
 	def inputToQueryString(cls, like, equal):
 		'''Internal function --- converts user input to an SQL string
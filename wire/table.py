@@ -2,9 +2,50 @@
 # wire/table.py
 # The Table class provides an interface for direct Table manipulation
 
-from sqlstring import SQLString
+import os
+import csv
+import itertools
+import gzip
+import json
+import re
+import sqlite3
+import time
+import threading
+import multiprocessing
+from collections import OrderedDict
+
+try:
+	import Queue as queue
+except ImportError:
+	import queue
+
+from sqlstring import SQLString, ALL
 from cursor import ExecutionCursor
 
+SQL_TOKENS = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`(?:[^`]|``)*`|\[[^\]]*\]|--[^\n]*|/\*.*?\*/|\w+|\s+|.", re.DOTALL)
+
+def exportPartition(job):
+	'''Internal function --- exports one rowid range of a table, in a worker process with its own read-only, memory-mapped connection
+
+	Arguments:
+		job - tuple of the database path, table name, partition index, first rowid, last rowid (exclusive), file path,
+			chunk size and whether or not to compress
+
+	Usage:
+		stats = exportPartition(("test.db", "users", 0, 1, 1000, "users.0.csv", None, False))
+
+	returns the export statistics of the partition (see ExecutionCursor.export)'''
+	from database import Database
+	path, table, index, low, high, filepath, chunk_size, compress = job
+	db = Database.openReadOnly(path)
+	try:
+		query = SQLString.select(table, where = "rowid >= {low} AND rowid < {high}".format(low = low, high = high))[0]
+		stats = db.execute(query).export(filepath, chunk_size, compress = compress)
+	finally:
+		db.close()
+	stats.update(partition = index, first_rowid = low, last_rowid = high - 1)
+	return stats
+
 class Table(object):
 	'''Models a Database table'''
 	def __init__(self, db, table, verify = True):
@@ -46,8 +87,10 @@ class Table(object):
 		Usage:
 			columns = db.table("users").columns()
 
+		The columns are cached until the schema changes (see SchemaCache)
+
 		returns a list of columns'''
-		return map(lambda item: item["name"], self.info().fetch())
+		return [column["name"] for column in self.db.schema.info(self.name)]
 
 	@staticmethod
 	def create(db, name, temporary = False,**columns):
@@ -65,6 +108,7 @@ class Table(object):
 		returns a Table object'''
 		query = SQLString.createTable(name, temporary, **columns)
 		db.execute(query)
+		db.schema.invalidate()
 		return db.table(name, False)
 
 	def drop(self):
@@ -78,7 +122,9 @@ class Table(object):
 
 		returns an ExecutionCursor object'''
 		query = SQLString.dropTable(self.name)
-		return self.execute(query)
+		results = self.execute(query)
+		self.db.schema.invalidate()
+		return results
 
 	def rename(self, name):
 		'''Renames the current table
@@ -91,7 +137,9 @@ class Table(object):
 			
 		returns an ExecutionCursor object'''
 		query = SQLString.rename(self.name, name)
-		return self.execute(query)
+		results = self.execute(query)
+		self.db.schema.invalidate()
+		return results
 
 	def addColumns(self, **columns):
 		'''Adds columns to the table
@@ -104,54 +152,620 @@ class Table(object):
 			db.table("users").addColumns(user_type = "VARCHAR(255)", user_tier = ["INT", 0])
 
 		returns an ExecutionCursor object'''
-		add_trans = self.db.transaction()
-		for column, value in columns.items():
-			query = SQLString.addColumn(self.name, column, value)
-			add_trans.execute(query)
-		return add_trans.commit()
-
-	def dropColumns(self, *columns): # also need to copy indices and other metadata
+		try:
+			with self.db.transaction() as add_trans:
+				results = ExecutionCursor(add_trans.cursor)
+				for column, value in columns.items():
+					query = SQLString.addColumn(self.name, column, value)
+					results = add_trans.execute(query)
+		finally:
+			self.db.schema.invalidate()
+		return results
+
+	def dropColumns(self, *columns, **options):
 		'''Drops columns from the table
 
+		Uses ALTER TABLE DROP COLUMN when SQLite supports it (3.35+) and the columns are not indexed or constrained,
+		and an online rebuild of the table otherwise (see Table.rebuild). The indexes and triggers that use the columns
+		must be dropped first, or dropped with them by passing drop_indexes = True
+
 		Arguments:
 			*columns - list of columns to drop
+			**options - whether or not to drop the indexes and triggers that use the columns (drop_indexes, defaults to False),
+				and the chunk_size, pause and progress of the rebuild (see Table.rebuild)
 
 		Usage:
 			db.table("users").dropColumns("user_type", "user_tier")
+			db.table("users").dropColumns("user_tier", drop_indexes = True)
+
+		After a rebuild, the names of the dropped indexes and triggers are stored in Table.rebuild_stats["dropped"]
 
 		returns an ExecutionCursor object'''
-		drop_trans = self.db.transaction()
-		temp_name = self.name + str(int(time.time()))
-		keep_columns = list(set(self.columns()).difference(columns))
-		column_str = ", ".join(keep_columns)
-		drop_trans.execute("CREATE TABLE {name} ({columns})".format(name = temp_name, columns = column_str))
-		drop_trans.execute("INSERT INTO {new_table} SELECT {columns} FROM {old_table}".format(new_table = temp_name, old_table = self.name, columns = column_str))
-		self.drop()
-		self.db.table(temp_name).rename(self.name)
-		return drop_trans.commit()
-
-	def renameColumns(self, **columns): # also need to copy indices and other metadata
+		drop_indexes = options.pop("drop_indexes", False)
+		kept = OrderedDict((column, column) for column in self.columns() if column not in columns)
+		dropped = self.droppedDefinitions(kept)
+		if dropped and not drop_indexes:
+			raise ValueError("Columns used by indexes or triggers: {names} (drop them first, or pass drop_indexes = True)".format(
+				names = ", ".join(dropped)))
+		if sqlite3.sqlite_version_info >= (3, 35, 0) and not dropped:
+			try:
+				return self.alter([SQLString.dropColumn(self.name, column) for column in columns])
+			except sqlite3.OperationalError:
+				pass # the columns are part of a key or used by a constraint
+		return self.rebuild(kept, **options)
+
+	def renameColumns(self, **columns):
 		'''Renames columns in the table
 
+		Uses ALTER TABLE RENAME COLUMN when SQLite supports it (3.25+), and an online rebuild of the table otherwise (see Table.rebuild)
+
 		Arguments:
-			**columns - dictionary of names and new names
+			**columns - dictionary of names and new names, and the chunk_size, pause and progress of the rebuild (optional,
+				see Table.rebuild)
 
 		Usage:
 			db.table("users").renameColumns(id = "user_id")
+			db.table("users").renameColumns(id = "user_id", chunk_size = 5000)
+
+		returns an ExecutionCursor object'''
+		options = dict((option, columns.pop(option)) for option in ("chunk_size", "pause", "progress") if option in columns)
+		if sqlite3.sqlite_version_info >= (3, 25, 0):
+			try:
+				return self.alter([SQLString.renameColumn(self.name, column, name) for column, name in columns.items()])
+			except sqlite3.OperationalError:
+				pass
+		return self.rebuild(OrderedDict((column, columns.get(column, column)) for column in self.columns()), **options)
+
+	def alter(self, queries):
+		'''Internal function --- runs ALTER TABLE statements in one transaction
+
+		Arguments:
+			queries - list of ALTER TABLE queries
+
+		Usage:
+			results = table.alter([SQLString.dropColumn("users", "tier")])
+
+		returns an ExecutionCursor object'''
+		try:
+			with self.db.transaction() as trans:
+				results = ExecutionCursor(trans.cursor)
+				for query in queries:
+					results = trans.execute(query)
+		finally:
+			self.db.schema.invalidate()
+		return results
+
+	def rebuild(self, columns, chunk_size = 10000, pause = 0, progress = None):
+		'''Rebuilds the table with another set of columns, without blocking other writers for more than one chunk at a time
+
+		The rows are copied into a new table in chunks of rowids, each in its own short transaction. Meanwhile, triggers
+		apply the writes of every connection to the copied rows. Finally, one transaction replaces the table with the
+		new table and recreates its indexes and triggers.
+
+		The new table is created from the definition of the table, so its column types and constraints are kept (see
+		Table.tableDefinition). Indexes and triggers are kept too, except the ones that use a dropped column (see
+		Table.renameReferences). Views on the table must still work with the new columns. Tables without a rowid are
+		copied in one chunk.
+
+		Arguments:
+			columns - ordered dictionary of the columns to keep and their new names
+			chunk_size - number of rows per chunk (defaults to 10000)
+			pause - seconds to wait between chunks, to let other connections write (defaults to 0)
+			progress - function called after each chunk with the number of rows copied and the estimated total (optional)
+
+		Usage:
+			db.table("users").rebuild(OrderedDict([("id", "user_id"), ("username", "username")]), progress = report)
+
+		The statistics of the rebuild, and the names of the indexes and triggers it dropped, are stored in Table.rebuild_stats
+
+		returns an ExecutionCursor object'''
+		start = time.time()
+		info = dict((column["name"], column) for column in self.db.schema.info(self.name))
+		(table_sql,), = self.db.cursor().execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (self.name,)).fetchall()
+		definitions = self.db.cursor().execute("SELECT name, sql FROM sqlite_master WHERE type IN ('index', 'trigger') AND tbl_name = ? AND sql IS NOT NULL",
+			(self.name,)).fetchall()
+		views = [name for name, sql in self.db.cursor().execute("SELECT name, sql FROM sqlite_master WHERE type = 'view'").fetchall()
+			if self.name.lower() in ((Table.identifier(token) or "").lower() for token in SQL_TOKENS.findall(sql))]
+		temp_name = "{name}_rebuild_{time}".format(name = self.name, time = int(time.time()))
+		old_columns, new_columns = list(columns.keys()), list(columns.values())
+		old_names, new_names = ', '.join(map(SQLString.escapeColumn, old_columns)), ', '.join(map(SQLString.escapeColumn, new_columns))
+		create = self.tableDefinition(table_sql, info, columns, self.name, temp_name)
+		autoincrement = re.search(r"\bAUTOINCREMENT\b", table_sql, re.IGNORECASE) is not None
+		triggers = ["{name}_{event}".format(name = temp_name, event = event) for event in ("insert", "update", "delete")]
+		cursor, trans = self.db.cursor(), self.db.transaction()
+		copied, chunks, longest, dropped = 0, 0, 0.0, []
+		# in legacy mode, the swap leaves the views on the table alone instead of failing on them while the table is missing
+		with self.db.pragmas(foreign_keys = "OFF", legacy_alter_table = "ON"):
+			cursor.execute(create)
+			try:
+				try:
+					cursor.execute("SELECT rowid FROM {table} LIMIT 0".format(table = self.name))
+					has_rowid = True
+				except sqlite3.OperationalError:
+					has_rowid = False
+				total, position, high = 0, None, None
+				if has_rowid:
+					new_values = ', '.join("NEW." + SQLString.escapeColumn(column) for column in old_columns)
+					replace = "INSERT OR REPLACE INTO {new} (rowid, {new_names}) VALUES (NEW.rowid, {new_values});".format(new = temp_name,
+						new_names = new_names, new_values = new_values)
+					delete = "DELETE FROM {new} WHERE rowid = OLD.rowid;".format(new = temp_name)
+					with trans:
+						for trigger, event, body in zip(triggers, ("INSERT", "UPDATE", "DELETE"), (replace, delete + " " + replace, delete)):
+							trans.execute("CREATE TRIGGER {trigger} AFTER {event} ON {table} BEGIN {body} END".format(trigger = trigger,
+								event = event, table = self.name, body = body))
+						low, high, total = trans.execute("SELECT MIN(rowid), MAX(rowid), COUNT(*) FROM {table}".format(table = self.name)).cursor.fetchone()
+						position = None if low is None else low - 1
+				# rows written after the copy started are copied by the triggers, so the chunks stop at the last rowid at the start
+				last_query = "SELECT MAX(rowid) FROM (SELECT rowid FROM {table} WHERE rowid > ? AND rowid <= ? ORDER BY rowid LIMIT ?)".format(table = self.name)
+				query = "INSERT OR IGNORE INTO {new} (rowid, {new_names}) SELECT rowid, {old_names} FROM {table} WHERE rowid > ? AND rowid <= ?".format(
+					new = temp_name, new_names = new_names, old_names = old_names, table = self.name)
+				while position is not None:
+					chunk_start = time.time()
+					with trans:
+						last, = trans.execute(last_query, (position, high, chunk_size)).cursor.fetchone()
+						if last is not None:
+							copied += max(trans.execute(query, (position, last)).cursor.rowcount, 0)
+					if last is None:
+						break
+					longest = max(longest, time.time() - chunk_start)
+					chunks, position = chunks + 1, last
+					if progress:
+						progress(copied, total)
+					if pause:
+						time.sleep(pause)
+				swap_start = time.time()
+				with trans:
+					if not has_rowid:
+						copied = total = trans.execute("INSERT INTO {new} ({new_names}) SELECT {old_names} FROM {table}".format(new = temp_name,
+							new_names = new_names, old_names = old_names, table = self.name)).cursor.rowcount
+					sequence = autoincrement and trans.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (self.name,)).cursor.fetchall()
+					trans.execute(SQLString.dropTable(self.name))
+					results = trans.execute(SQLString.rename(temp_name, self.name))
+					if sequence:
+						trans.execute("DELETE FROM sqlite_sequence WHERE name = ?", (self.name,))
+						trans.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (self.name, sequence[0][0]))
+					for name, sql in definitions:
+						sql = self.renameReferences(sql, info, columns, self.name)
+						if sql is not None:
+							trans.execute(sql)
+						else:
+							dropped.append(name)
+					for view in views:
+						trans.execute("SELECT * FROM {view} LIMIT 0".format(view = SQLString.escapeColumn(view))) # fails if the view uses a dropped column
+				longest = max(longest, time.time() - swap_start)
+			except Exception:
+				for trigger in triggers:
+					cursor.execute("DROP TRIGGER IF EXISTS {trigger}".format(trigger = trigger))
+				cursor.execute("DROP TABLE IF EXISTS {name}".format(name = temp_name))
+				raise
+			finally:
+				self.db.schema.invalidate()
+		self.rebuild_stats = {"rows": copied, "chunks": chunks, "seconds": time.time() - start, "max_lock_seconds": longest, "dropped": dropped}
+		return results
+
+	def droppedDefinitions(self, columns):
+		'''Internal function --- finds the indexes and triggers that a rebuild with another set of columns would drop
+
+		Arguments:
+			columns - dictionary of the columns to keep and their new names
+
+		Usage:
+			names = table.droppedDefinitions(OrderedDict([("id", "id")]))
+
+		returns a list of index and trigger names'''
+		info = dict((column["name"], column) for column in self.db.schema.info(self.name))
+		definitions = self.db.cursor().execute("SELECT name, sql FROM sqlite_master WHERE type IN ('index', 'trigger') AND tbl_name = ? AND sql IS NOT NULL",
+			(self.name,)).fetchall()
+		return [name for name, sql in definitions if self.renameReferences(sql, info, columns, self.name) is None]
+
+	@staticmethod
+	def renameReferences(sql, info, columns, table):
+		'''Internal function --- renames the columns in the definition of an index or trigger
+
+		Column names are matched case-insensitively, and never inside string literals. In an index, every name in its column
+		list and WHERE clause refers to the table. In a trigger, only the names qualified by NEW, OLD or the table, and the
+		columns of UPDATE OF, are known to: bare column names in its body are left alone, since they may belong to other tables
+
+		Arguments:
+			sql - CREATE INDEX or CREATE TRIGGER query
+			info - dictionary of the current columns and their metadata
+			columns - dictionary of the columns to keep and their new names
+			table - table name
+
+		Usage:
+			sql = Table.renameReferences("CREATE INDEX users_id ON users (id)", info, {"id": "user_id"}, "users")
+
+		returns the query with the new column names (or None if it uses a dropped column)'''
+		dropped = set(column.lower() for column in info if column not in columns)
+		renamed = dict((column.lower(), name) for column, name in columns.items() if column != name)
+		tokens = SQL_TOKENS.findall(sql)
+		words = [position for position, token in enumerate(tokens) if not token.isspace() and token[:2] not in ("--", "/*")]
+		trigger = re.match(r"\s*CREATE\s+(?:TEMP(?:ORARY)?\s+)?TRIGGER\b", sql, re.IGNORECASE) is not None
+		qualifiers = ("new", "old", table.lower())
+		in_columns, update_of = False, False
+		for number, position in enumerate(words):
+			token = tokens[position]
+			previous = [tokens[words[number - offset]] for offset in (1, 2) if number >= offset]
+			following = tokens[words[number + 1]] if number + 1 < len(words) else ""
+			name = Table.identifier(token)
+			if trigger:
+				if token.upper() == "OF" and previous and previous[0].upper() == "UPDATE":
+					update_of = True
+					continue
+				if update_of and token.upper() == "ON":
+					update_of = False
+				qualified = len(previous) == 2 and previous[0] == "." and (Table.identifier(previous[1]) or "").lower() in qualifiers
+				reference = name is not None and (update_of or qualified)
+			else:
+				in_columns = in_columns or token == "("
+				reference = in_columns and name is not None and following != "(" and (not previous or previous[0] != ".")
+			if not reference:
+				continue
+			if name.lower() in dropped:
+				return None
+			if name.lower() in renamed:
+				tokens[position] = SQLString.escapeColumn(renamed[name.lower()])
+		return ''.join(tokens)
+
+	@staticmethod
+	def identifier(token):
+		'''Internal function --- reads the name of an identifier token
+
+		Arguments:
+			token - SQL token (see SQL_TOKENS)
+
+		Usage:
+			name = Table.identifier("`user id`") # user id
+
+		returns the name, or None if the token is not an identifier (such as a string literal or an operator)'''
+		if token[:1] in ('"', '`'):
+			return token[1:-1].replace(token[0] * 2, token[0])
+		if token[:1] == "[":
+			return token[1:-1]
+		if re.match(r"[A-Za-z_]", token):
+			return token
+		return None
+
+	@staticmethod
+	def tableDefinition(sql, info, columns, table, name):
+		'''Internal function --- generates the CREATE TABLE query of a rebuilt table from the definition of the table
+
+		Only the definitions of the dropped columns and the names of the renamed columns change, so the types, collations,
+		defaults, CHECK, UNIQUE, PRIMARY KEY and FOREIGN KEY constraints, AUTOINCREMENT and table options are kept. Column
+		names are matched case-insensitively, and only inside the parentheses of a constraint, where they cannot be a type name.
+
+		Arguments:
+			sql - CREATE TABLE query of the table
+			info - dictionary of the current columns and their metadata
+			columns - dictionary of the columns to keep and their new names
+			table - table name
+			name - name of the new table
+
+		Usage:
+			sql = Table.tableDefinition("CREATE TABLE users (id INT, tier INT CHECK (tier > 0))", info, {"id": "id"}, "users", "users_new")
+
+		raises a ValueError if a constraint of a kept column, or of the table, uses a dropped column
+
+		returns the CREATE TABLE query of the new table'''
+		dropped = set(column.lower() for column in info if column not in columns)
+		renamed = dict((column.lower(), new_name) for column, new_name in columns.items() if column != new_name)
+		tokens = SQL_TOKENS.findall(sql)
+		opening = tokens.index("(")
+		depth, parts, part = 0, [], []
+		for position in range(opening + 1, len(tokens)):
+			token = tokens[position]
+			depth += (token == "(") - (token == ")")
+			if depth < 0:
+				parts.append(part)
+				break
+			if depth == 0 and token == ",":
+				parts.append(part)
+				part = []
+			else:
+				part.append(token)
+		options = ''.join(tokens[position + 1:])
+		definitions = []
+		for part in parts:
+			words = [position for position, token in enumerate(part) if not token.isspace() and token[:2] not in ("--", "/*")]
+			first = Table.identifier(part[words[0]]) or ""
+			constraint = first.upper() in ("CONSTRAINT", "PRIMARY", "UNIQUE", "CHECK", "FOREIGN")
+			if not constraint:
+				if first.lower() in dropped:
+					continue
+				if first.lower() in renamed:
+					part[words[0]] = SQLString.escapeColumn(renamed[first.lower()])
+			depth, skip, foreign = 0, False, False
+			for number, position in enumerate(words):
+				token = part[position]
+				previous = part[words[number - 1]] if number > 0 else ""
+				following = part[words[number + 1]] if number + 1 < len(words) else ""
+				if previous.upper() == "REFERENCES":
+					foreign = (Table.identifier(token) or "").lower() != table.lower() # the columns of another table keep their names
+				depth += (token == "(") - (token == ")")
+				if token == ")" and depth == 0:
+					foreign = False
+				column = Table.identifier(token)
+				if (depth == 0 or foreign or column is None or following == "(" or previous == "." or following == "."
+					or previous.upper() == "COLLATE"):
+					continue
+				if column.lower() in dropped:
+					raise ValueError('Column {column} is used by a constraint of table {table}'.format(column = column, table = table))
+				if column.lower() in renamed:
+					part[position] = SQLString.escapeColumn(renamed[column.lower()])
+			definitions.append(''.join(part).strip())
+		return "CREATE TABLE {name} ({definitions}){options}".format(name = name, definitions = ', '.join(definitions), options = options)
+
+	def createIndex(self, *columns, **options):
+		'''Creates an index on the table, unless an index with the same name exists
+
+		Arguments:
+			*columns - columns to index, in order (prefix a name with "-" for descending order)
+			name - index name (defaults to <table>_<columns>_index)
+			unique - whether or not the indexed values must be unique (defaults to False)
+			where - WHERE clause of a partial index (optional)
+
+		Usage:
+			db.table("users").createIndex("tier", "username")
+			db.table("users").createIndex("email", unique = True, where = "`email` IS NOT NULL")
+
+		returns the index name'''
+		if not columns:
+			raise ValueError('An index needs at least one column')
+		name = options.get("name") or SQLString.indexName(self.name, columns)
+		self.execute(SQLString.createIndex(self.name, name, columns, options.get("unique", False), options.get("where")))
+		self.db.schema.invalidate()
+		return name
+
+	def dropIndex(self, name):
+		'''Drops an index of the table, if it exists
+
+		Arguments:
+			name - index name
+
+		Usage:
+			db.table("users").dropIndex("users_tier_username_index")
 
 		returns an ExecutionCursor object'''
-		ren_trans = self.db.transaction()
-		temp_name = self.name + str(int(time.time()))
-		column_names = list(columns.items())
-		old_names, new_names = SQLString.extract(column_names), SQLString.extract(column_names, 1)
-		current_columns = self.columns()
-		keep_columns = list(set(current_columns).difference(old_names))
-		new_columns = keep_columns + new_names
-		ren_trans.execute("CREATE TABLE {name} ({columns})".format(name = temp_name, columns = ', '.join(new_columns)))
-		ren_trans.execute("INSERT INTO {new_table} SELECT {columns} FROM {old_table}".format(new_table = temp_name, old_table = self.name, columns = ', '.join(current_columns)))
-		self.drop()
-		self.db.table(temp_name).rename(self.name)
-		return ren_trans.commit()
+		results = self.execute(SQLString.dropIndex(name))
+		self.db.schema.invalidate()
+		return results
+
+	def indexes(self):
+		'''Retrieves the indexes of the table
+
+		Arguments:
+			None
+
+		Usage:
+			names = [index["name"] for index in db.table("users").indexes()]
+
+		The indexes are cached until the schema changes (see SchemaCache)
+
+		returns a list of dictionaries with the name, unique, origin ("c" for CREATE INDEX, "u" for UNIQUE and "pk" for PRIMARY KEY constraints),
+		partial and columns of each index'''
+		return self.db.schema.indexes(self.name)
+
+	def exportPartitioned(self, directory, partitions = 4, processes = None, chunk_size = None, compress = False):
+		'''Exports the table to several CSV files at once, split into rowid ranges
+
+		Each partition is written by a separate process with its own read-only connection,
+		so only committed rows are exported
+
+		Arguments:
+			directory - directory to write the files to (named <table>.<partition>.csv, or .csv.gz when compressed)
+			partitions - number of partitions (defaults to 4)
+			processes - number of worker processes (defaults to one per partition)
+			chunk_size - number of rows to fetch and write at once (defaults to ExecutionCursor.chunk_size)
+			compress - whether or not to gzip the files (defaults to False)
+
+		Usage:
+			stats = db.table("users").exportPartitioned("exports", partitions = 8)
+
+		returns a list of the export statistics of each partition (see ExecutionCursor.export)'''
+		if self.db.path == ":memory:":
+			raise ValueError('In-memory databases cannot be exported by other processes')
+		low, high = self.execute("SELECT MIN(rowid), MAX(rowid) FROM {table}".format(table = self.name)).fetch(type = list)[0]
+		if low is None:
+			low, high = 0, -1
+		step = max((high - low + 1 + partitions - 1) // partitions, 1)
+		extension = ".csv.gz" if compress else ".csv"
+		jobs = [(self.db.path, self.name, index, low + index * step, low + (index + 1) * step if index < partitions - 1 else high + 1,
+			os.path.join(directory, "{table}.{index}{extension}".format(table = self.name, index = index, extension = extension)),
+			chunk_size, compress) for index in range(partitions)]
+		pool = multiprocessing.Pool(processes or partitions)
+		try:
+			return pool.map(exportPartition, jobs)
+		finally:
+			pool.close()
+			pool.join()
+
+	def importCSV(self, path, chunk_size = 10000, bulk = True, encoding = "utf-8"):
+		'''Imports the rows of a CSV file into the table in a single transaction
+
+		The first row of the file must be a header; headers are matched to the table columns (ignoring case)
+		and any other header is skipped. Values are converted using the declared column types
+
+		Arguments:
+			path - path of the CSV file (compressed with gzip if it ends with .gz)
+			chunk_size - number of rows parsed and inserted at once (defaults to 10000)
+			bulk - whether or not to turn off synchronous writes and keep the journal in memory during the import (defaults to True)
+			encoding - encoding of the text in the file (defaults to utf-8)
+
+		Usage:
+			stats = db.table("users").importCSV("users.csv")
+
+		returns the insert statistics (see Database.insertMany)'''
+		def parse(csv_file, lookup):
+			reader = csv.reader(csv_file)
+			headers = next(reader, [])
+			positions, columns = self.mapHeaders(headers, lookup)
+			if positions == list(range(len(headers))):
+				return columns, reader
+			rows = ([row[position] if position < len(row) else None for position in positions] for row in reader)
+			return columns, rows
+		return self.importRows(path, parse, chunk_size, bulk, encoding)
+
+	def importJSONL(self, path, chunk_size = 10000, bulk = True, encoding = "utf-8"):
+		'''Imports the objects of a JSON lines file (one JSON object per line) into the table in a single transaction
+
+		The keys of the first object are matched to the table columns (ignoring case) and any other key is skipped;
+		a key missing from a later object is inserted as NULL. Values are converted using the declared column types
+
+		Arguments:
+			path - path of the JSON lines file (compressed with gzip if it ends with .gz)
+			chunk_size - number of rows parsed and inserted at once (defaults to 10000)
+			bulk - whether or not to turn off synchronous writes and keep the journal in memory during the import (defaults to True)
+			encoding - encoding of the text in the file (defaults to utf-8)
+
+		Usage:
+			stats = db.table("events").importJSONL("events.jsonl")
+
+		returns the insert statistics (see Database.insertMany)'''
+		def parse(jsonl_file, lookup):
+			objects = (json.loads(line) for line in jsonl_file if line.strip())
+			first = next(objects, None)
+			if first is None:
+				return [], iter([])
+			keys = list(first.keys())
+			positions, columns = self.mapHeaders(keys, lookup)
+			keys = [keys[position] for position in positions]
+			rows = ([item.get(key) for key in keys] for item in itertools.chain([first], objects))
+			return columns, rows
+		return self.importRows(path, parse, chunk_size, bulk, encoding)
+
+	@staticmethod
+	def mapHeaders(headers, columns):
+		'''Internal function --- matches file headers to the table columns, ignoring case
+
+		Arguments:
+			headers - list of headers
+			columns - dictionary of lowercase column names and column names
+
+		Usage:
+			positions, columns = Table.mapHeaders(["ID", "Username", "unknown"], {"id": "id", "username": "username"}) # [0, 1], ["id", "username"]
+
+		returns the positions of the matched headers and the matching column names'''
+		positions = [position for position, header in enumerate(headers) if header.strip().lower() in columns]
+		return positions, [columns[headers[position].strip().lower()] for position in positions]
+
+	def importRows(self, path, parse, chunk_size, bulk, encoding):
+		'''Internal function --- parses a file on a separate thread while its rows are inserted
+
+		Arguments:
+			path - path of the file
+			parse - function that takes the open file and the lowercase column names, and returns the matched column names and an iterable of rows
+			chunk_size - number of rows parsed and inserted at once
+			bulk - whether or not to apply the bulk load PRAGMA values
+			encoding - encoding of the text in the file
+
+		Usage:
+			stats = table.importRows("users.csv", parse, 10000, True, "utf-8")
+
+		returns the insert statistics (see Database.insertMany)'''
+		chunks, parsed = queue.Queue(4), {}
+		types = dict((column["name"], SQLString.affinity(column["type"])) for column in self.db.schema.info(self.name))
+		lookup = dict((column.lower(), column) for column in types)
+		def produce():
+			try:
+				with (gzip.open(path, 'rb') if path.endswith(".gz") else open(path, 'rb')) as data_file:
+					columns, rows = parse(data_file, lookup)
+					parsed["columns"] = columns
+					coercers = [self.coercer(types.get(column), encoding) for column in columns]
+					while True:
+						chunk = [[coerce(value) for coerce, value in zip(coercers, row)] for row in itertools.islice(rows, chunk_size)]
+						if not chunk:
+							break
+						chunks.put(chunk)
+			except Exception as error:
+				chunks.put(error)
+			chunks.put(None)
+		def consume():
+			while True:
+				chunk = chunks.get()
+				if chunk is None:
+					break
+				if isinstance(chunk, Exception):
+					raise chunk
+				for row in chunk:
+					yield row
+		parser = threading.Thread(target = produce)
+		parser.daemon = True
+		parser.start()
+		try:
+			rows = consume()
+			first = next(rows, None)
+			if first is None:
+				self.db.insert_stats = {"rows": 0, "seconds": 0.0, "rows_per_second": 0.0}
+				return self.db.insert_stats
+			values = {"synchronous": "OFF", "journal_mode": "MEMORY"} if bulk else {}
+			if bulk and self.db.pragma("journal_mode").fetch(type = list)[0][0].lower() == "wal":
+				del values["journal_mode"]
+			with self.db.pragmas(**values):
+				self.db.insertMany(self.name, itertools.chain([first], rows), parsed["columns"], chunk_size)
+			return self.db.insert_stats
+		finally:
+			while parser.is_alive():
+				try:
+					chunks.get(timeout = 0.1)
+				except queue.Empty:
+					pass
+			parser.join()
+
+	@staticmethod
+	def coercer(affinity, encoding = "utf-8"):
+		'''Internal function --- creates a function that converts parsed strings to the type of a column
+
+		Arguments:
+			affinity - type affinity of the column (see SQLString.affinity)
+			encoding - encoding of byte strings
+
+		Usage:
+			coerce = Table.coercer("INTEGER")
+			value = coerce("5") # 5
+
+		returns the conversion function (see Table.coerce)'''
+		if affinity in ("INTEGER", "REAL", "NUMERIC"):
+			convert = float if affinity == "REAL" else int
+			def number(value):
+				if value.__class__ is str:
+					try:
+						return convert(value)
+					except ValueError:
+						pass
+				return Table.coerce(value, affinity, encoding)
+			return number
+		def text(value):
+			if value.__class__ is str:
+				return value.decode(encoding)
+			return value
+		return text
+
+	@staticmethod
+	def coerce(value, affinity, encoding = "utf-8"):
+		'''Internal function --- converts a parsed string to the type of its column
+
+		Arguments:
+			value - parsed value (only strings are converted)
+			affinity - type affinity of the column (see SQLString.affinity)
+			encoding - encoding of byte strings
+
+		Usage:
+			value = Table.coerce("5", "INTEGER") # 5
+
+		returns the converted value'''
+		if not isinstance(value, basestring):
+			return value
+		if affinity in ("INTEGER", "REAL", "NUMERIC"):
+			if not value.strip():
+				return None
+			try:
+				return float(value) if affinity == "REAL" else int(value)
+			except ValueError:
+				try:
+					return float(value)
+				except ValueError:
+					pass
+		return value if isinstance(value, unicode) else value.decode(encoding)
 
 	def insert(self, **columns):
 		'''Inserts rows into the table
@@ -159,6 +773,12 @@ class Table(object):
 		see Database.insert for further reference'''
 		return self.db.insert(self.name, **columns)
 
+	def insertMany(self, rows, columns = None, chunk_size = 1000):
+		'''Inserts many rows into the table in a single transaction
+
+		see Database.insertMany for further reference'''
+		return self.db.insertMany(self.name, rows, columns, chunk_size)
+
 	def update(self, equal = None, like = None, where = "1 = 1", **columns):
 		'''Updates rows in the table
 
@@ -171,9 +791,145 @@ class Table(object):
 		see Database.select for further reference'''
 		return self.db.select(self.name, **options)
 
+	def scan(self, batch_size = 1000, order_by = "rowid", resume = None, type = dict, **options):
+		'''Iterates over the table one page at a time using keyset pagination, so each page is an indexed range query
+
+		Arguments:
+			batch_size - number of rows per page (defaults to 1000)
+			order_by - unique, non-NULL key column to page by, prefixed with "-" to scan in descending order (defaults to rowid)
+			resume - token of a previous scan (see TableScan.token) to continue after its last row
+			type - type of each row (dict, "row", list)
+			**options - columns, equal, like, where and parameters (see Database.select)
+
+		The key column is added to the selected columns if it is missing
+
+		Usage:
+			scan = db.table("users").scan(5000, equal = {"active": 1})
+			for user in scan:
+				process(user)
+				save(scan.token)
+			for user in db.table("users").scan(5000, resume = load()):
+				process(user)
+
+		returns a TableScan object'''
+		return TableScan(self, batch_size, order_by, resume, type, options)
+
+	def count(self, **options):
+		'''Counts the rows of the table inside SQLite
+
+		Arguments:
+			**options - equal, like, where and parameters (see Database.select)
+
+		Usage:
+			active = db.table("users").count(equal = {"active": 1})
+
+		returns the number of matching rows'''
+		return self.db.aggregate(self.name, [("count", ALL)], **options).fetchone()[0]
+
+	def aggregate(self, sum = None, avg = None, min = None, max = None, count = None, group_by = None, **options):
+		'''Aggregates the rows of the table inside SQLite, without fetching them
+
+		Arguments:
+			sum, avg, min, max - column name, or list of column names, to aggregate with each function
+				(each result is named function_column, such as sum_total)
+			count - True to count the rows (named count), or column name(s) to count their non-NULL values
+			group_by - column name, or list of column names, to group the rows by (optional)
+			**options - equal, like, where, parameters, order_by and limit (see Database.select)
+
+		Usage:
+			totals = db.table("orders").aggregate(sum = "total", max = ["total", "time"], count = True)
+			for region in db.table("orders").aggregate(avg = "total", group_by = "region"):
+				print(region["region"], region["avg_total"])
+
+		returns a dictionary of the results, or an ExecutionCursor of one dictionary per group with group_by'''
+		aggregates = [("count", ALL)] if count is True else [("count", column) for column in SQLString.names(count)]
+		for function, columns in (("sum", sum), ("avg", avg), ("min", min), ("max", max)):
+			aggregates.extend((function, column) for column in SQLString.names(columns))
+		if not aggregates:
+			raise ValueError('No aggregate functions given')
+		results = self.db.aggregate(self.name, aggregates, group_by = group_by, **options)
+		return results if group_by else results.fetch(type_fetch = "one")[0]
+
+	def selectColumns(self, columns = None, **options):
+		'''Selects rows from the table as one typed array per column, using the declared column types
+
+		Arguments:
+			columns - a list of columns (defaults to every column)
+			**options - see Database.select
+
+		Usage:
+			readings = db.table("readings").selectColumns(["time", "value"], equal = {"sensor": 5})
+
+		returns an ordered dictionary of column names and arrays (see ExecutionCursor.fetchColumns)'''
+		types = dict((column["name"], column["type"]) for column in self.db.schema.info(self.name))
+		return self.select(columns = columns, **options).fetchColumns(types)
+
 	def delete(self, **options):
 		'''Deletes rows from the table
 
 		see Database.delete for further reference'''
 		return self.db.delete(self.name, **options)
-		
\ No newline at end of file
+		
+
+class TableScan(object):
+	'''Iterator over the pages of a table scan, see Table.scan'''
+	def __init__(self, table, batch_size, order_by, resume, type, options):
+		'''Creates the TableScan object
+
+		see Table.scan for further reference'''
+		self.table, self.batch_size, self.type = table, batch_size, type
+		self.key, self.descending = order_by.lstrip("-"), order_by.startswith("-")
+		self.order_by, self.options = order_by, dict(options)
+		columns = self.options.pop("columns", None)
+		if not columns or columns == ALL:
+			columns = [column["name"] for column in table.db.schema.info(table.name)]
+		self.columns = list(columns) if self.key in columns else list(columns) + [self.key]
+		self.key_index = self.columns.index(self.key)
+		self.last, self.pages, self.rows = None, 0, 0
+		if resume is not None:
+			state = json.loads(resume)
+			if state.get("order_by") != order_by:
+				raise ValueError('Scan token was created for order_by = {order_by}'.format(order_by = state.get("order_by")))
+			self.last = state["after"]
+
+	@property
+	def token(self):
+		'''Token that resumes the scan after the last row returned, or None if no row was returned yet'''
+		if self.last is None:
+			return None
+		return json.dumps({"order_by": self.order_by, "after": self.last})
+
+	def page(self):
+		'''Internal function --- selects the page after the last row returned
+
+		Arguments:
+			None
+
+		Usage:
+			results = scan.page()
+
+		returns an ExecutionCursor object'''
+		options = dict(self.options)
+		if self.last is not None:
+			where = "`{key}` {operator} ?".format(key = self.key, operator = "<" if self.descending else ">")
+			if "where" in options:
+				where = "({where}) AND {key}".format(where = options["where"], key = where)
+			options["where"] = where
+			options["parameters"] = tuple(options.get("parameters") or ()) + (self.last,)
+		return self.table.select(columns = self.columns, order_by = self.order_by, limit = self.batch_size, **options)
+
+	def __iter__(self):
+		'''Iterates over the rows, selecting the next page once the current one is exhausted'''
+		while True:
+			results = self.page()
+			key = results.columnNames()[self.key_index] if self.type == dict else self.key_index
+			count = 0
+			for row in results.iterate(self.type, self.batch_size):
+				count += 1
+				self.rows += 1
+				self.last = row[key]
+				yield row
+			self.pages += 1
+			if count < self.batch_size:
+				break
+
@@ -0,0 +1,158 @@
+import threading
+import unittest
+import wire
+
+try:
+	import Queue as queue
+except ImportError:
+	import queue
+
+try:
+	import asyncio
+except ImportError:
+	asyncio = None
+
+class TestAsyncDatabase(unittest.TestCase):
+	def setUp(self):
+		'''Sets up the test case'''
+		self.db = wire.AsyncDatabase(":memory:")
+		self.db.execute("CREATE TABLE users (id INT, username VARCHAR(50))").result()
+
+	def tearDown(self):
+		'''Stops the executor thread'''
+		self.db.close()
+
+	def test_calls(self):
+		'''Tests queueing calls on the executor thread'''
+		self.db.insertMany("users", ((index, "user") for index in range(30))).result()
+		table = self.db.table("users")
+		self.assertEqual(table.select(equal = {"id": 3}).result().fetch(), [{"id": 3, "username": "user"}])
+		self.assertEqual(len(list(table.iterate(list, 7))), 30)
+		self.assertRaises(Exception, self.db.select("missing").result)
+		stats = self.db.stats()
+		self.assertEqual(stats["queue_depth"], 0)
+		self.assertEqual(stats["methods"]["iterate"]["calls"], 6)
+
+	def test_transaction(self):
+		'''Tests running a transaction on the executor thread'''
+		def insert(trans):
+			trans.insert("users", id = 1, username = "user")
+			raise ValueError("rolled back")
+		self.assertRaises(ValueError, self.db.transaction(insert).result)
+		self.assertEqual(self.db.select("users").result().fetch(), [])
+
+	def block(self):
+		'''Blocks the executor thread until the returned event is set, so that the next calls stay queued'''
+		started, release = threading.Event(), threading.Event()
+		def wait():
+			started.set()
+			release.wait(5)
+		self.db.call(wait)
+		started.wait(5)
+		return release
+
+	def test_cancel(self):
+		'''Tests cancelling a call while it is queued'''
+		release = self.block()
+		cancelled = self.db.insert("users", id = 1, username = "cancelled")
+		inserted = self.db.insert("users", id = 2, username = "user")
+		self.assertEqual(self.db.queueDepth(), 2)
+		self.assertTrue(cancelled.cancel())
+		release.set()
+		inserted.result()
+		self.assertTrue(cancelled.cancelled())
+		self.assertFalse(inserted.cancel())
+		self.assertEqual(self.db.select("users", columns = ["id"]).result().fetch(type = list), [(2,)])
+		self.assertEqual(self.db.stats()["methods"]["insert"]["calls"], 1)
+
+	def test_queuedTransactions(self):
+		'''Tests that a queued transaction that raises is rolled back on its own, without stopping the calls queued after it'''
+		def insert(trans, index, fail = False):
+			trans.insert("users", id = index, username = "user")
+			if fail:
+				raise ValueError("rolled back")
+			return index
+		release = self.block()
+		futures = [self.db.transaction(insert, 1), self.db.transaction(insert, 2, True), self.db.transaction(insert, 3)]
+		release.set()
+		self.assertEqual(futures[0].result(), 1)
+		self.assertRaises(ValueError, futures[1].result)
+		self.assertEqual(futures[2].result(), 3)
+		self.assertEqual(self.db.select("users", columns = ["id"]).result().fetch(type = list), [(1,), (3,)])
+
+	def test_close(self):
+		'''Tests that closing the database runs the calls queued from several threads first'''
+		release = self.block()
+		futures = []
+		def work(offset):
+			futures.extend(self.db.insert("users", id = index, username = "user") for index in range(offset, offset + 10))
+		threads = [threading.Thread(target = work, args = (offset,)) for offset in range(0, 40, 10)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		release.set()
+		self.db.close()
+		self.assertEqual(len(futures), 40)
+		self.assertTrue(all(future.done() and future.exception() is None for future in futures))
+		self.assertEqual(self.db.stats()["methods"]["insert"]["calls"], 40)
+
+@unittest.skipIf(asyncio is None, "asyncio is not available")
+class TestAsyncio(unittest.TestCase):
+	def setUp(self):
+		'''Sets up the test case, with the database returning futures of a new event loop'''
+		self.loop = asyncio.new_event_loop()
+		self.db = wire.AsyncDatabase(":memory:", loop = self.loop, max_queue = 2)
+		self.wait(self.db.execute("CREATE TABLE users (id INT, username VARCHAR(50))"))
+		self.wait(self.db.insertMany("users", ((index, "user") for index in range(10))))
+
+	def tearDown(self):
+		'''Stops the executor thread and closes the event loop'''
+		self.db.close()
+		self.loop.close()
+
+	def wait(self, awaitable):
+		'''Waits for an awaitable on the event loop, as await would'''
+		return self.loop.run_until_complete(asyncio.wait_for(awaitable, 5))
+
+	def test_await(self):
+		'''Tests awaiting calls and iterating over rows asynchronously'''
+		self.assertEqual(self.wait(self.db.select("users", columns = ["id"], equal = {"id": 3})).fetch(type = list), [(3,)])
+		self.assertEqual(self.wait(self.db.table("users").count()), 10)
+		cursor, rows = self.db.iterate("users", type = list, chunk_size = 3).__aiter__(), [] # as async for does
+		while True:
+			try:
+				rows.append(self.wait(cursor.__anext__()))
+			except StopAsyncIteration:
+				break
+		self.assertEqual([row[0] for row in rows], list(range(10)))
+
+	def test_cancel(self):
+		'''Tests cancelling awaited calls, while they are queued and while they run'''
+		running = self.db.execute("WITH RECURSIVE forever(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM forever) SELECT COUNT(*) FROM forever")
+		queued = self.db.delete("users", where = "1 = 1")
+		self.wait(asyncio.sleep(0.1))
+		self.assertTrue(queued.cancel())
+		self.assertTrue(running.cancel()) # interrupts the query
+		self.assertEqual(self.wait(self.db.table("users").count()), 10)
+
+	def test_fullQueue(self):
+		'''Tests that a full queue raises on the event loop thread instead of blocking it'''
+		started, release, results = threading.Event(), threading.Event(), []
+		self.db.call(lambda: started.set() or release.wait(5))
+		started.wait(5)
+		def fill():
+			try:
+				while True:
+					results.append(self.db.insert("users", id = 10, username = "user"))
+			except queue.Full:
+				self.loop.stop()
+		self.loop.call_soon(fill)
+		self.loop.run_forever()
+		self.assertEqual(len(results), 2)
+		release.set()
+		self.wait(results[-1])
+		self.assertEqual(self.wait(self.db.table("users").count(equal = {"id": 10})), 2)
+
+if __name__ == '__main__':
+	unittest.main()
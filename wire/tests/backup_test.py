@@ -0,0 +1,85 @@
+import os
+import gzip
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import wire
+
+class TestBackup(unittest.TestCase):
+	def setUp(self):
+		'''Sets up the test case'''
+		self.directory = tempfile.mkdtemp()
+		self.db = wire.Database(os.path.join(self.directory, "test.db"))
+		self.db.pragma("journal_mode = WAL") # needed without the backup API
+		self.db.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR(50))")
+		self.db.insertMany("users", ((index, "user" * 50) for index in range(2000)))
+
+	def tearDown(self):
+		'''Closes and removes the test database'''
+		self.db.close()
+		shutil.rmtree(self.directory)
+
+	def count(self, path):
+		'''Counts the users in a backup'''
+		connection = sqlite3.connect(path)
+		try:
+			return connection.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+		finally:
+			connection.close()
+
+	def files(self):
+		'''Lists the files in the test directory, besides the WAL files of the test database'''
+		return sorted(name for name in os.listdir(self.directory) if not name.startswith("test.db-"))
+
+	def test_backup(self):
+		'''Tests backing up to a file'''
+		target, steps = os.path.join(self.directory, "backup.db"), []
+		backup = self.db.backup(target, pages_per_step = 16, sleep = 0, progress = lambda copied, total: steps.append((copied, total)))
+		stats = backup.wait(10)
+		self.assertTrue(backup.done())
+		self.assertEqual(self.count(target), 2000)
+		self.assertEqual(steps[-1], (stats["total"], stats["total"]))
+		self.assertEqual((stats["pages"], stats["bytes"]), (stats["total"], os.path.getsize(target)))
+		self.assertEqual(self.files(), ["backup.db", "test.db"])
+		if hasattr(sqlite3.Connection, "backup"):
+			memory = sqlite3.connect(":memory:")
+			self.db.backup(memory)
+			self.assertEqual(memory.execute("SELECT COUNT(*) FROM users").fetchone()[0], 2000)
+		else:
+			self.assertRaises(ValueError, self.db.backup, sqlite3.connect(":memory:"))
+
+	def test_compress(self):
+		'''Tests backing up to a compressed file'''
+		target = os.path.join(self.directory, "backup.db.gz")
+		stats = self.db.backup(target, compress = True).wait(10)
+		page_size = self.db.pragma("page_size").fetch(type = list)[0][0]
+		self.assertTrue(stats["bytes"] < stats["total"] * page_size)
+		with open(os.path.join(self.directory, "restored.db"), 'wb') as restored:
+			compressed = gzip.open(target, 'rb')
+			restored.write(compressed.read())
+			compressed.close()
+		self.assertEqual(self.count(os.path.join(self.directory, "restored.db")), 2000)
+
+	def test_errors(self):
+		'''Tests the errors of a backup'''
+		self.assertRaises(ValueError, wire.Database(":memory:").backup, "backup.db")
+		backup = self.db.backup(os.path.join(self.directory, "missing", "backup.db"))
+		self.assertRaises(Exception, backup.wait, 10)
+		self.assertEqual(self.files(), ["test.db"])
+
+	def test_vacuum(self):
+		'''Tests the VACUUM INTO copy used without the backup API, which needs WAL mode'''
+		class VacuumBackup(wire.Backup):
+			incremental = False
+		target = os.path.join(self.directory, "backup.db")
+		stats = VacuumBackup(self.db.path, target).wait(10)
+		self.assertEqual(self.count(target), 2000)
+		self.assertEqual((stats["steps"], stats["pages"]), (1, stats["total"]))
+		os.remove(target)
+		self.db.pragma("journal_mode = DELETE")
+		self.assertRaises(ValueError, VacuumBackup(self.db.path, target).wait, 10)
+		self.assertEqual(self.files(), ["test.db"])
+
+if __name__ == '__main__':
+	unittest.main()
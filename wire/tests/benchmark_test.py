@@ -0,0 +1,42 @@
+import copy
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import wire
+
+class TestBenchmark(unittest.TestCase):
+	def setUp(self):
+		'''Sets up the test case'''
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		'''Removes the benchmark files'''
+		shutil.rmtree(self.directory)
+
+	def test_run(self):
+		'''Tests running every benchmark on a small dataset'''
+		benchmark = wire.Benchmark(sizes = (200,), repeat = 1, directory = self.directory, readers = 2)
+		results = benchmark.run()
+		self.assertEqual(sorted(results["results"]), sorted(wire.BENCHMARKS))
+		self.assertEqual(results["results"]["insertMany"]["200"]["operations"], 200)
+		self.assertEqual(results["results"]["readers"]["200"]["operations"], 200)
+		self.assertRaises(ValueError, wire.Benchmark, benchmarks = ["missing"])
+
+	def test_compare(self):
+		'''Tests saving results and comparing them against a baseline'''
+		benchmark = wire.Benchmark(sizes = (100, 200), repeat = 1, benchmarks = ["fetchDict", "fetchTuple"], directory = self.directory)
+		results = benchmark.run()
+		path = os.path.join(self.directory, "baseline.json")
+		benchmark.save(path)
+		baseline = wire.Benchmark.load(path)
+		self.assertEqual(baseline["results"], json.loads(json.dumps(results["results"])))
+		slower = copy.deepcopy(results)
+		slower["results"]["fetchDict"]["200"]["seconds"] = baseline["results"]["fetchDict"]["200"]["seconds"] * 2 + 1
+		changes = wire.Benchmark.compare(slower, baseline, 0.5)
+		self.assertEqual(len(changes), 4)
+		self.assertEqual([(change["benchmark"], change["size"]) for change in changes if change["regression"]], [("fetchDict", 200)])
+
+if __name__ == '__main__':
+	unittest.main()
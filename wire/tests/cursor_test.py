@@ -0,0 +1,72 @@
+import csv
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+import wire
+
+class TestExecutionCursor(unittest.TestCase):
+	def setUp(self):
+		'''Sets up the test case'''
+		self.db = wire.Database(":memory:")
+		self.db.execute("CREATE TABLE users (id INT, username VARCHAR(50))")
+		self.db.insertMany("users", ((index, "user{index}".format(index = index)) for index in range(25)))
+
+	def tearDown(self):
+		'''Closes the test database'''
+		self.db.close()
+
+	def test_iterate(self):
+		'''Tests lazily iterating over the results'''
+		rows = list(self.db.select("users"))
+		self.assertEqual(len(rows), 25)
+		self.assertEqual(rows[3], {"id": 3, "username": "user3"})
+		self.assertEqual(next(self.db.select("users", equal = {"id": 7}).iterate(list)), (7, "user7"))
+
+	def test_chunks(self):
+		'''Tests fetching the results in chunks'''
+		sizes = [len(rows) for rows in self.db.select("users").chunks(10)]
+		self.assertEqual(sizes, [10, 10, 5])
+
+	def test_rows(self):
+		'''Tests fetching compact rows'''
+		rows = self.db.select("users").fetch(type = "row")
+		self.assertEqual(len(rows), 25)
+		self.assertEqual(rows[4]["username"], "user4")
+		self.assertEqual(rows[4][0], 4)
+		self.assertEqual(tuple(rows[4]), (4, "user4"))
+		self.assertEqual(next(self.db.select("users").iterate("row")).keys(), ["id", "username"])
+
+	def test_fetchColumns(self):
+		'''Tests fetching the results as typed column arrays'''
+		self.db.insert("users", id = None, username = "null_user")
+		columns = self.db.select("users").fetchColumns({"id": "INT", "username": "VARCHAR(50)"}, chunk_size = 10, use_numpy = False)
+		self.assertEqual(list(columns.keys()), ["id", "username"])
+		self.assertEqual(columns["id"].typecode, "d")
+		self.assertEqual(list(columns["id"][:3]), [0.0, 1.0, 2.0])
+		self.assertNotEqual(columns["id"][25], columns["id"][25])
+		self.assertEqual(columns["username"][24], "user24")
+		columns = self.db.select("users", equal = {"username": "user3"}).fetchColumns(use_numpy = False)
+		self.assertEqual(list(columns["id"]), [3])
+
+	def test_export(self):
+		'''Tests exporting the results to plain and compressed CSV files'''
+		directory = tempfile.mkdtemp()
+		try:
+			path = os.path.join(directory, "users.csv")
+			stats = self.db.select("users").export(path, chunk_size = 10)
+			self.assertEqual(stats["rows"], 25)
+			self.assertEqual(stats["bytes"], os.path.getsize(path))
+			with open(path, 'rb') as csv_file:
+				rows = list(csv.reader(csv_file))
+			self.assertEqual(rows[0], ["id", "username"])
+			self.assertEqual(rows[25], ["24", "user24"])
+			stats = self.db.select("users").export(path + ".gz")
+			with gzip.open(path + ".gz", 'rb') as csv_file:
+				self.assertEqual(len(list(csv.reader(csv_file))), 26)
+		finally:
+			shutil.rmtree(directory)
+
+if __name__ == '__main__':
+	unittest.main()
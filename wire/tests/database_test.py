@@ -0,0 +1,300 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+import wire
+
+class TestDatabase(unittest.TestCase):
+	def setUp(self):
+		'''Sets up the test case'''
+		self.db = wire.Database(":memory:")
+		self.db.execute("CREATE TABLE users (id INT, username VARCHAR(50))")
+
+	def tearDown(self):
+		'''Closes the test database'''
+		self.db.close()
+
+	def test_commitPolicy(self):
+		'''Tests the statement count commit policy'''
+		self.db.setCommitPolicy("count", every = 3)
+		commits = self.db.commitStats()["commits"]
+		for index in range(7):
+			self.db.insert("users", id = index, username = "user")
+		stats = self.db.commitStats()
+		self.assertEqual(stats["commits"] - commits, 2)
+		self.assertEqual(stats["pending"], 1)
+		self.assertRaises(ValueError, self.db.setCommitPolicy, "never")
+
+	def test_batch(self):
+		'''Tests deferring commits to the end of a batch'''
+		commits = self.db.commitStats()["commits"]
+		with self.db.batch():
+			for index in range(5):
+				self.db.insert("users", id = index, username = "user")
+			self.assertEqual(self.db.commitStats()["pending"], 5)
+		stats = self.db.commitStats()
+		self.assertEqual(stats["commits"] - commits, 1)
+		self.assertEqual(stats["pending"], 0)
+		try:
+			with self.db.batch():
+				self.db.insert("users", id = 5, username = "user")
+				with self.db.batch():
+					self.db.update("users", equal = {"id": 0}, username = "changed")
+				raise KeyError
+		except KeyError:
+			pass
+		self.assertEqual(self.db.select("users", columns = ["id"], where = "`username` = 'user'").fetch(type = list), [(index,) for index in range(5)])
+		self.assertEqual(self.db.commitStats()["pending"], 0)
+		self.db.insert("users", id = 5, username = "user") # committed on its own, outside of the batch transaction
+		self.db.rollback()
+		self.assertEqual(self.db.execute("SELECT COUNT(*) FROM users").fetch(type = list), [(6,)])
+
+	def test_insertMany(self):
+		'''Tests inserting rows from a generator in one transaction'''
+		commits = self.db.commitStats()["commits"]
+		self.db.insertMany("users", ({"id": index, "username": "user"} for index in range(2500)), chunk_size = 1000)
+		self.db.insertMany("users", [(2500, "tuple_user")])
+		self.assertEqual(self.db.commitStats()["commits"] - commits, 2)
+		self.assertEqual(self.db.execute("SELECT COUNT(*) FROM users").fetch(type = list)[0][0], 2501)
+		self.assertEqual(self.db.insert_stats["rows"], 1)
+
+	def test_insertManyFailure(self):
+		'''Tests that a failed insertMany rolls back its rows, but not the earlier writes of an enclosing batch'''
+		self.db.execute("CREATE TABLE items (id INT PRIMARY KEY)")
+		self.db.insertMany("items", [(1,)])
+		self.assertRaises(sqlite3.IntegrityError, self.db.insertMany, "items", [(2,), (1,)], chunk_size = 1)
+		self.assertEqual(self.db.select("items").fetch(type = list), [(1,)])
+		with self.db.batch():
+			self.db.insert("items", id = 3)
+			self.assertRaises(sqlite3.IntegrityError, self.db.insertMany, "items", [(4,), (1,)], chunk_size = 1)
+		self.assertEqual(self.db.select("items").fetch(type = list), [(1,), (3,)])
+		with self.db.transaction():
+			self.db.insert("items", id = 5)
+			self.assertRaises(sqlite3.IntegrityError, self.db.insertMany, "items", [(6,), (1,)], chunk_size = 1)
+		self.assertEqual(self.db.select("items", equal = {"id": [5, 6]}).fetch(type = list), [(5,)])
+
+	def test_setFilters(self):
+		'''Tests IN list filters that exceed the parameter limit'''
+		self.db.variableLimit = lambda: 10
+		self.db.insertMany("users", ((index, "user") for index in range(50)))
+		ids = set(range(0, 50, 2))
+		results = self.db.select("users", columns = ["id"], equal = {"id": ids, "username": "user"})
+		self.assertEqual(sorted(row[0] for row in results.iterate(list)), sorted(ids))
+		results = self.db.select("users", columns = ["id"], equal = {"id": ids}, order_by = "-id", limit = 3)
+		self.assertEqual(results.fetch(type = list), [(48,), (46,), (44,)])
+		self.assertEqual(self.db.update("users", equal = {"id": ids}, username = "even").cursor.rowcount, 25)
+		self.assertEqual(len(self.db.select("users", equal = {"username": "even"}).fetch()), 25)
+		self.assertEqual(self.db.delete("users", equal = {"id": list(ids)}, where = "1 = 1").cursor.rowcount, 25)
+		self.assertEqual(self.db.select("users", equal = {"id": [0, 1, 2]}).fetch(type = list), [(1, "user")])
+		ids = [1] * 5 + list(range(3, 20, 2)) + [1]
+		self.assertEqual(sorted(row[0] for row in self.db.select("users", columns = ["id"], equal = {"id": ids}).iterate(list)), list(range(1, 20, 2)))
+		self.assertEqual(self.db.update("users", equal = {"id": ids}, username = "odd").cursor.rowcount, 10)
+		with self.db.transaction() as trans:
+			self.assertEqual(trans.update("users", equal = {"id": list(range(1, 40))}, username = "split").cursor.rowcount, 20)
+			self.assertEqual(trans.delete("users", equal = {"id": list(range(1, 30))}, where = "1 = 1").cursor.rowcount, 15)
+		self.assertEqual(self.db.select("users", columns = ["id"], equal = {"username": "split"}).fetch(type = list),
+			[(index,) for index in range(31, 40, 2)])
+
+	def test_setFiltersBlobs(self):
+		'''Tests ordered IN list filters over blobs, whose values are loaded into a temporary table, inside a transaction'''
+		self.db.variableLimit = lambda: 10
+		self.db.execute("CREATE TABLE files (id INT, data BLOB)")
+		blobs = [sqlite3.Binary("file {index}".format(index = index).encode("ascii")) for index in range(30)]
+		self.db.insertMany("files", enumerate(blobs))
+		with self.db.transaction() as trans:
+			results = trans.select("files", columns = ["id"], equal = {"data": blobs[:25]}, order_by = "-id", limit = 3)
+			self.assertEqual(results.fetch(type = list), [(24,), (23,), (22,)])
+		self.assertEqual(self.db.select("temp.wire_values").fetch(), [])
+
+	def test_resultCache(self):
+		'''Tests caching select results and invalidating them on writes'''
+		self.db.execute("CREATE TABLE groups (id INT)")
+		self.db.insertMany("users", ((index, "user") for index in range(10)))
+		self.db.enableCache(size = 2)
+		self.assertEqual(len(self.db.select("users").fetch()), 10)
+		self.assertEqual(len(self.db.select("users").fetch(type = "row")), 10)
+		self.assertEqual(self.db.select("groups").fetch(), [])
+		self.db.insert("users", id = 10, username = "user")
+		stats = self.db.cacheStats()
+		self.assertEqual((stats["hits"], stats["misses"], stats["size"]), (1, 2, 1))
+		self.assertEqual(len(self.db.select("users").fetch()), 11)
+		self.assertEqual(self.db.select("groups").fetch(), [])
+		self.assertEqual(self.db.cacheStats()["hits"], 2)
+		self.db.execute("INSERT INTO groups VALUES (1)")
+		self.assertEqual(self.db.select("groups").fetch(), [{"id": 1}])
+		self.db.result_cache.max_rows = 5
+		self.assertEqual(len(self.db.select("users", where = "id > 1").fetch()), 9)
+		self.assertEqual(len(list(self.db.select("users", where = "id > 1"))), 9)
+		self.db.setCommitPolicy("manual")
+		self.db.insert("groups", id = 2)
+		self.assertEqual(len(self.db.select("groups").fetch()), 2)
+		self.db.rollback()
+		self.assertEqual(self.db.select("groups").fetch(), [{"id": 1}])
+		self.db.disableCache()
+		self.assertEqual(self.db.cacheStats(), None)
+
+	def test_resultCacheSubquery(self):
+		'''Tests invalidating cached results that read other tables through a subquery or a view'''
+		self.db.execute("CREATE TABLE groups (id INT)")
+		self.db.execute("CREATE VIEW grouped AS SELECT users.* FROM users JOIN groups USING (id)")
+		self.db.insertMany("users", ((index, "user") for index in range(5)))
+		self.db.enableCache()
+		self.assertEqual(self.db.select("users", where = "`id` IN (SELECT id FROM groups)").fetch(), [])
+		self.assertEqual(self.db.select("grouped").fetch(), [])
+		self.db.insert("groups", id = 1)
+		self.assertEqual(self.db.select("users", where = "`id` IN (SELECT id FROM groups)").fetch(type = list), [(1, "user")])
+		self.assertEqual(self.db.select("grouped").fetch(type = list), [(1, "user")])
+		self.assertEqual(self.db.cacheStats()["hits"], 0)
+		self.db.disableCache()
+
+	def test_instrument(self):
+		'''Tests recording statement timings and the slow-query log'''
+		entries = []
+		self.db.instrument(slow_threshold = 0).subscribe(entries.append)
+		self.db.insertMany("users", ((index, "user") for index in range(10)))
+		self.assertEqual(len(list(self.db.select("users", equal = {"id": [1, 2, 3]}))), 3)
+		self.assertEqual(len(self.db.select("users", equal = {"id": [4, 5]}).fetch()), 2)
+		stats = self.db.queryStats()["SELECT * FROM users WHERE `id` IN (...) AND ? = ?"]
+		self.assertEqual((stats["count"], stats["rows"]), (2, 5))
+		self.assertTrue(stats["p50"] <= stats["p95"] <= stats["p99"] <= stats["max"])
+		self.assertEqual(self.db.queryStats()["INSERT INTO users VALUES (...)"]["rows"], 10)
+		slow = self.db.slowQueries()[-1]
+		self.assertEqual(slow["values"], [4, 5])
+		self.assertTrue(slow["full_scans"])
+		self.assertEqual(len(entries), 3)
+		self.db.select("users", equal = {"id": 1}).fetch("one")
+		self.db.table("users").count()
+		self.assertEqual(self.db.queryStats()["SELECT * FROM users WHERE `id` = ? AND ? = ?"]["count"], 1)
+		self.assertEqual(len(self.db.slowQueries()), 5)
+		self.db.uninstrument()
+		self.assertEqual(self.db.queryStats(), None)
+
+	def test_transaction(self):
+		'''Tests committing, rolling back and nesting transactions'''
+		with self.db.transaction() as trans:
+			trans.insert("users", id = 1, username = "user")
+			trans.insertMany("users", ((index, "user") for index in range(2, 5)))
+			try:
+				with trans.savepoint():
+					trans.delete("users", where = "1 = 1")
+					self.assertEqual(trans.select("users").fetch(), [])
+					raise ValueError("rolled back")
+			except ValueError:
+				pass
+			self.assertEqual(len(trans.select("users").fetch()), 4)
+		def fail():
+			with self.db.transaction() as trans:
+				trans.update("users", username = "changed")
+				raise ValueError("rolled back")
+		self.assertRaises(ValueError, fail)
+		self.assertEqual(self.db.select("users", columns = ["id"], equal = {"username": "user"}).fetch(type = list), [(1,), (2,), (3,), (4,)])
+		trans = self.db.transaction()
+		trans.execute("DELETE FROM users WHERE id > 1")
+		trans.commit()
+		self.assertEqual(len(self.db.select("users").fetch()), 1)
+
+	def test_transactionNesting(self):
+		'''Tests transactions opened inside other transactions, and insertMany outside of a with block'''
+		self.db.insertMany("users", ((index, "user") for index in range(1, 4)))
+		trans = self.db.transaction()
+		trans.execute("DELETE FROM users")
+		trans.insertMany("users", ((index, "new") for index in range(10, 13)))
+		trans.rollback()
+		self.assertEqual(self.db.select("users", columns = ["id"]).fetch(type = list), [(1,), (2,), (3,)])
+		def fail():
+			with self.db.transaction() as outer:
+				outer.insert("users", id = 4, username = "user")
+				with self.db.transaction() as inner:
+					inner.insert("users", id = 5, username = "user")
+				self.db.table("users").addColumns(tier = ["INT", 0])
+				raise ValueError("rolled back")
+		self.assertRaises(ValueError, fail)
+		self.assertEqual(self.db.select("users", columns = ["id"]).fetch(type = list), [(1,), (2,), (3,)])
+		self.assertEqual(sorted(self.db.table("users").columns()), ["id", "username"])
+		with self.db.transaction() as outer:
+			outer.insert("users", id = 4, username = "user")
+			with self.db.transaction() as inner:
+				inner.insert("users", id = 5, username = "user")
+				inner.rollback()
+		self.assertEqual(self.db.select("users", columns = ["id"]).fetch(type = list), [(1,), (2,), (3,), (4,)])
+		self.assertEqual((self.db.transaction_open, self.db.savepoints, self.db.batch_depth), (False, 0, 0))
+		self.assertEqual(self.db.table("users").alter([]).fetch(), [])
+
+	def test_transactionRetry(self):
+		'''Tests retrying a transaction while another connection holds the write lock'''
+		directory = tempfile.mkdtemp()
+		try:
+			path = os.path.join(directory, "test.db")
+			db, other = wire.Database(path, timeout = 0), sqlite3.connect(path, timeout = 0, isolation_level = None, check_same_thread = False)
+			db.execute("CREATE TABLE users (id INT)")
+			other.execute("BEGIN IMMEDIATE")
+			trans = db.transaction(retries = 2, backoff = 0.001)
+			self.assertRaises(sqlite3.OperationalError, trans.__enter__)
+			self.assertEqual(trans.busy_retries, 2)
+			self.assertEqual(db.isolation_level, "")
+			trans = db.transaction(retries = 20, backoff = 0.01)
+			timer = threading.Timer(0.05, lambda: other.execute("COMMIT"))
+			timer.start()
+			with trans:
+				trans.insert("users", id = 1)
+			timer.join()
+			self.assertTrue(trans.busy_retries > 0)
+			self.assertEqual(other.execute("SELECT id FROM users").fetchall(), [(1,)])
+			db.close()
+			other.close()
+		finally:
+			shutil.rmtree(directory)
+
+	def test_profiles(self):
+		'''Tests applying tuning profiles permanently and for the duration of a block'''
+		directory = tempfile.mkdtemp()
+		try:
+			db = wire.Database(os.path.join(directory, "test.db"), profile = "oltp")
+			settings = db.settings()
+			self.assertEqual((settings["journal_mode"], settings["synchronous"], settings["cache_size"]), ("wal", "NORMAL", -65536))
+			db.execute("CREATE TABLE users (id INT)")
+			with db.profile("bulk_load", cache_size = -1000):
+				self.assertEqual(db.settings()["synchronous"], "OFF")
+				self.assertEqual(db.settings()["cache_size"], -1000)
+				db.insertMany("users", ((index,) for index in range(100)))
+			self.assertEqual(db.settings(), settings)
+			with db.profile("read_only_analytics"):
+				self.assertRaises(sqlite3.OperationalError, db.insert, "users", id = 100)
+			db.setProfile("read_only_analytics")
+			self.assertEqual(db.setProfile("durable")["journal_mode"], "delete")
+			db.insert("users", id = 100)
+			self.assertRaises(ValueError, db.setProfile, "fast")
+			db.close()
+		finally:
+			shutil.rmtree(directory)
+
+	def test_openReadOnly(self):
+		'''Tests reading a memory-mapped database and refusing writes'''
+		directory = tempfile.mkdtemp()
+		try:
+			path = os.path.join(directory, "test.db")
+			db = wire.Database(path)
+			db.execute("CREATE TABLE users (id INT, username VARCHAR(50))")
+			db.insertMany("users", ((index, "user") for index in range(100)))
+			db.close()
+			reader = wire.Database.openReadOnly(path)
+			self.assertEqual(reader.table("users").count(), 100)
+			self.assertTrue(reader.settings()["mmap_size"] >= os.path.getsize(path))
+			self.assertRaises(sqlite3.OperationalError, reader.insert, "users", id = 100)
+			self.assertRaises(sqlite3.OperationalError, reader.transaction)
+			self.assertRaises(sqlite3.OperationalError, reader.execute, "DELETE FROM users")
+			self.assertRaises(sqlite3.OperationalError, reader.pragma, "query_only = 0")
+			self.assertRaises(sqlite3.OperationalError, reader.execute, "pragma main.journal_mode=WAL")
+			self.assertEqual(reader.pragma("query_only").fetch(type = list), [(1,)])
+			self.assertRaises(sqlite3.OperationalError, reader.execute, "DELETE FROM users")
+			self.assertEqual(reader.table("users").count(), 100)
+			reader.close()
+			self.assertRaises(ValueError, wire.Database.openReadOnly, os.path.join(directory, "missing.db"))
+			self.assertFalse(os.path.exists(os.path.join(directory, "missing.db")))
+		finally:
+			shutil.rmtree(directory)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,95 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+import wire
+
+class TestMemoryMirror(unittest.TestCase):
+	def setUp(self):
+		'''Sets up the test case'''
+		self.directory = tempfile.mkdtemp()
+		self.db = wire.Database(os.path.join(self.directory, "test.db"))
+		self.db.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR(50))")
+		self.db.execute("CREATE INDEX users_username ON users (username)")
+		self.db.execute("CREATE TABLE events (id INT)")
+		self.db.execute("CREATE TABLE logs (id INTEGER PRIMARY KEY AUTOINCREMENT, message TEXT)")
+		self.db.insert("logs", message = "created")
+		self.db.insertMany("users", ((index, "user") for index in range(100)))
+
+	def tearDown(self):
+		'''Closes and removes the test database'''
+		self.db.close()
+		shutil.rmtree(self.directory)
+
+	def test_sync(self):
+		'''Tests reading from memory and writing through to the file'''
+		mirror = self.db.mirrorToMemory(tables = ["users"])
+		self.assertEqual(mirror.select("users", equal = {"id": 5}).fetch(), [{"id": 5, "username": "user"}])
+		self.assertEqual(mirror.memory.table("users").indexes()[0]["name"], "users_username")
+		mirror.insert("users", id = 100, username = "new")
+		mirror.insert("events", id = 1)
+		self.assertEqual(self.db.table("users").count(), 101)
+		self.assertEqual(len(mirror.select("events").fetch()), 1)
+		stats = mirror.stats()
+		self.assertEqual((stats["tables"], stats["reads"], stats["disk_reads"], stats["stale"]), (["users"], 1, 1, False))
+		self.db.delete("users", equal = {"id": 100}, where = "1 = 1")
+		self.assertTrue(mirror.stats()["stale"])
+		mirror.refresh()
+		self.assertEqual(mirror.stats()["stale"], False)
+		self.assertEqual(mirror.memory.table("users").count(), 100)
+		self.assertRaises(ValueError, self.db.mirrorToMemory, tables = ["missing"])
+		self.assertRaises(ValueError, self.db.mirrorToMemory, mode = "never")
+		mirror.close()
+
+	def test_periodic(self):
+		'''Tests writing to memory first, and to the file on sync'''
+		self.db.execute("CREATE TRIGGER reject BEFORE INSERT ON events WHEN NEW.id < 0 BEGIN SELECT RAISE(ABORT, 'rejected'); END")
+		mirror = self.db.mirrorToMemory(mode = "periodic", interval = 60)
+		self.assertEqual(mirror.stats()["tables"], ["events", "logs", "users"])
+		mirror.insert("events", id = -1)
+		mirror.update("users", equal = {"id": 1}, username = "changed")
+		mirror.insertMany("events", ((index,) for index in range(10)))
+		self.assertEqual(mirror.select("users", equal = {"id": 1}).fetch("one", type = list), [(1, "changed")])
+		self.assertEqual(self.db.select("users", equal = {"id": 1}).fetch("one", type = list), [(1, "user")])
+		stats = mirror.stats()
+		self.assertEqual(stats["pending"], 3)
+		self.assertTrue(stats["sync_lag"] >= 0)
+		self.assertEqual(mirror.sync(), 3)
+		self.assertEqual(mirror.stats()["failed"], 1)
+		self.assertTrue("rejected" in mirror.stats()["last_error"])
+		self.assertEqual(self.db.select("users", equal = {"id": 1}).fetch("one", type = list), [(1, "changed")])
+		self.assertEqual(self.db.table("events").count(), 10)
+		self.assertEqual((mirror.stats()["pending"], mirror.stats()["stale"]), (0, False))
+		mirror.delete("events", where = "1 = 1")
+		mirror.insert("logs", message = "closed")
+		mirror.close()
+		self.assertEqual(self.db.table("events").count(), 0)
+		self.assertEqual(self.db.select("logs", columns = ["id"], equal = {"message": "closed"}).fetch(type = list), [(2,)])
+		mirror = self.db.mirrorToMemory(mode = "periodic", interval = 60)
+		mirror.insert("events", id = -1)
+		mirror.disk.close()
+		self.assertRaises(Exception, mirror.close)
+		self.assertRaises(Exception, mirror.memory.execute, "SELECT 1")
+
+	def test_staleSync(self):
+		'''Tests that a periodic sync keeps the mirror stale after another connection wrote to the file'''
+		mirror = self.db.mirrorToMemory(tables = ["events"], mode = "periodic", interval = 0.05)
+		try:
+			self.db.insert("events", id = 1)
+			self.assertTrue(mirror.stats()["stale"])
+			syncs = mirror.stats()["syncs"]
+			mirror.insert("events", id = 2)
+			while mirror.stats()["syncs"] == syncs:
+				time.sleep(0.01)
+			self.assertTrue(mirror.stats()["stale"])
+			self.assertEqual(mirror.select("events").fetch(type = list), [(2,)])
+			mirror.refresh()
+			self.assertFalse(mirror.stats()["stale"])
+			self.assertEqual(mirror.select("events", order_by = "id").fetch(type = list), [(1,), (2,)])
+		finally:
+			mirror.close()
+
+if __name__ == '__main__':
+	unittest.main()
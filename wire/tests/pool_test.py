@@ -0,0 +1,147 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+import wire
+from collections import OrderedDict
+
+try:
+	import Queue as queue
+except ImportError:
+	import queue
+
+class TestPooledDatabase(unittest.TestCase):
+	def setUp(self):
+		'''Sets up the test case'''
+		self.directory = tempfile.mkdtemp()
+		self.db = wire.PooledDatabase(os.path.join(self.directory, "test.db"), readers = 3)
+		self.db.createTable("users", id = "INT", username = "VARCHAR(50)")
+
+	def tearDown(self):
+		'''Closes the pool and removes the test database'''
+		self.db.close()
+		shutil.rmtree(self.directory)
+
+	def test_threads(self):
+		'''Tests reading and writing from several threads'''
+		found = []
+		def work(offset):
+			for index in range(offset, offset + 50):
+				self.db.insert("users", id = index, username = "user")
+				found.append(len(self.db.select("users", equal = {"id": index}).fetch()))
+		threads = [threading.Thread(target = work, args = (offset,)) for offset in range(0, 200, 50)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		self.assertEqual(found, [1] * 200)
+		self.assertEqual(len(self.db.table("users").select().fetch(type = "row")), 200)
+		stats = self.db.stats()
+		self.assertEqual(stats["idle_readers"], 3)
+		self.assertEqual(stats["reader"]["checkouts"], 201)
+		self.assertEqual(self.db.pragma("journal_mode").fetch()[0]["journal_mode"], "wal")
+
+	def test_walVisibility(self):
+		'''Tests that readers see the writes committed by the writer, but not the ones still in its transaction'''
+		with self.db.pool.writer() as writer:
+			with writer.transaction() as trans:
+				trans.insert("users", id = 1, username = "user")
+				self.assertEqual(self.db.select("users").fetch(), []) # the reader is not blocked by the open transaction
+			self.assertEqual(self.db.select("users", columns = ["id"]).fetch(type = list), [(1,)])
+		with self.db.pool.reader() as reader:
+			cursor = reader.cursor()
+			cursor.execute("BEGIN")
+			self.assertEqual(cursor.execute("SELECT COUNT(*) FROM users").fetchone()[0], 1)
+			self.db.insert("users", id = 2, username = "user")
+			self.assertEqual(cursor.execute("SELECT COUNT(*) FROM users").fetchone()[0], 1) # the read keeps its snapshot
+			reader.commit()
+			self.assertEqual(cursor.execute("SELECT COUNT(*) FROM users").fetchone()[0], 2)
+			self.assertRaises(sqlite3.OperationalError, reader.insert, "users", id = 3, username = "reader")
+		self.assertEqual(self.db.table("users").count(), 2)
+
+	def test_transactionLock(self):
+		'''Tests that transactions and batches hold the writer, so other threads cannot write inside them'''
+		started, finished = threading.Event(), threading.Event()
+		def write():
+			started.wait()
+			self.db.insert("users", id = 2, username = "other")
+			finished.set()
+		thread = threading.Thread(target = write)
+		thread.start()
+		try:
+			with self.db.transaction() as trans:
+				trans.insert("users", id = 1, username = "user")
+				started.set()
+				self.assertFalse(finished.wait(0.1)) # the other thread waits for the writer
+				raise KeyError
+		except KeyError:
+			pass
+		thread.join()
+		self.assertEqual(self.db.select("users", columns = ["id"]).fetch(type = list), [(2,)])
+		started.clear()
+		finished.clear()
+		thread = threading.Thread(target = write)
+		thread.start()
+		with self.db.batch() as writer:
+			writer.update("users", equal = {"id": 2}, username = "batch")
+			started.set()
+			self.assertFalse(finished.wait(0.1))
+		thread.join()
+		self.assertEqual(self.db.select("users", columns = ["id", "username"], order_by = "username").fetch(type = list), [(2, "batch"), (2, "other")])
+
+	def test_aggregate(self):
+		'''Tests that counts and aggregates run on the readers'''
+		self.db.insertMany("users", ((index, "user") for index in range(10)), ["id", "username"])
+		table, writes = self.db.table("users"), self.db.stats()["writer"]["checkouts"]
+		self.assertEqual(table.count(), 10)
+		self.assertEqual(table.aggregate(max = "id", group_by = "username").fetch(type = list), [("user", 9)])
+		stats = self.db.stats()
+		self.assertEqual((stats["writer"]["checkouts"], stats["reader"]["checkouts"]), (writes, 2))
+
+	def test_readerSettings(self):
+		'''Tests that the cache, instrumentation and index advisor cover the reads of the readers'''
+		self.db.insertMany("users", ((index, "user") for index in range(10)), ["id", "username"])
+		self.db.enableCache()
+		self.db.instrument(slow_threshold = 0)
+		advisor = self.db.enableIndexAdvisor()
+		for index in range(4):
+			self.assertEqual(len(self.db.select("users", equal = {"username": "user"}).fetch()), 10)
+		stats = self.db.cacheStats()
+		self.assertEqual((stats["hits"], stats["misses"], stats["capacity"]), (1, 3, 4 * 256))
+		shapes = [shape for shape in self.db.queryStats() if shape.startswith("SELECT")]
+		self.assertEqual([self.db.queryStats()[shape]["count"] for shape in shapes], [3])
+		self.assertEqual(len([entry for entry in self.db.slowQueries() if entry["query"].startswith("SELECT")]), 3)
+		self.assertEqual([index["columns"] for index in advisor.recommend()], [["username"]])
+		self.db.disableCache()
+		self.db.uninstrument()
+		self.assertEqual((self.db.cacheStats(), self.db.queryStats()), (None, None))
+
+	def test_tableLock(self):
+		'''Tests that a table rebuild holds the writer, so other threads write before or after it'''
+		self.db.insertMany("users", ((index, "user") for index in range(10)), ["id", "username"])
+		table, finished, waited = self.db.table("users"), threading.Event(), []
+		thread = threading.Thread(target = lambda: self.db.execute("INSERT INTO users SELECT * FROM users WHERE rowid = 1") and finished.set())
+		def progress(copied, total):
+			if not thread.is_alive() and not finished.is_set():
+				thread.start()
+			waited.append(not finished.wait(0.05))
+		table.rebuild(OrderedDict([("id", "id"), ("username", "name")]), chunk_size = 4, progress = progress)
+		thread.join()
+		self.assertEqual(waited, [True, True, True])
+		self.assertEqual(table.count(), 11)
+		self.assertEqual(sorted(table.columns()), ["id", "name"])
+
+	def test_timeout(self):
+		'''Tests waiting for a reader when every reader is checked out'''
+		self.db.close()
+		self.db = wire.PooledDatabase(os.path.join(self.directory, "test.db"), readers = 1, timeout = 0.05)
+		with self.db.pool.reader():
+			self.assertRaises(queue.Empty, self.db.select, "users")
+		self.assertEqual(self.db.select("users").fetch(), [])
+		stats = self.db.stats()
+		self.assertEqual((stats["idle_readers"], stats["reader"]["checkouts"]), (1, 2))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -1,4 +1,5 @@
 
+import threading
 import unittest
 import wire
 
@@ -31,5 +32,91 @@ class TestSQLString(unittest.TestCase):
 		'''Tests the ALTER TABLE RENAME SQL generation'''
 		self.assertEqual(self.sql.rename("orig_table", "new_table"), "ALTER TABLE orig_table RENAME TO new_table")
 
+	def test_createIndex(self):
+		'''Tests the CREATE INDEX and DROP INDEX SQL generation'''
+		self.assertEqual(self.sql.createIndex("users", "users_tier_id_index", ["tier", "-id"], True, "`tier` > 0"),
+			"CREATE UNIQUE INDEX IF NOT EXISTS users_tier_id_index ON users (`tier` ASC, `id` DESC) WHERE `tier` > 0")
+		self.assertEqual(self.sql.indexName("users", ["tier", "-id"]), "users_tier_id_index")
+		self.assertEqual(self.sql.dropIndex("users_tier_id_index"), "DROP INDEX IF EXISTS users_tier_id_index")
+
+	def test_insertMany(self):
+		'''Tests the multi-row INSERT SQL generation'''
+		self.assertEqual(self.sql.insertMany("users", ["id", "username"], 2), "INSERT INTO users (`id`, `username`) VALUES (?, ?)")
+		self.assertEqual(self.sql.insertMany("users", None, 3), "INSERT INTO users VALUES (?, ?, ?)")
+
+	def test_insert(self):
+		'''Tests the INSERT SQL generation'''
+		self.assertEqual(self.sql.insert("users", username = "panchr", id = 1), ("INSERT INTO users (`id`, `username`) VALUES (?, ?)", (1, "panchr")))
+
+	def test_update(self):
+		'''Tests the UPDATE SQL generation'''
+		self.assertEqual(self.sql.update("users", {"id": 5}, {"username": "pan%"}, username = "wire"),
+			("UPDATE users SET `username` = ? WHERE `username` LIKE ? AND `id` = ? AND 1 = 1", ("wire", "pan%", 5)))
+
+	def test_select(self):
+		'''Tests the SELECT SQL generation'''
+		self.assertEqual(self.sql.select("users"), ("SELECT * FROM users WHERE 1 = 1", ()))
+		self.assertEqual(self.sql.select("users", columns = ["id"], equal = {"id": 5, "tier": 2}),
+			("SELECT `id` FROM users WHERE `id` = ? AND `tier` = ? AND 1 = 1", (5, 2)))
+		self.assertEqual(self.sql.select("users", where = "`id` > ?", parameters = (5,), order_by = ["-tier", "id"], limit = 10, offset = 20),
+			("SELECT * FROM users WHERE `id` > ? ORDER BY `tier` DESC, `id` ASC LIMIT ? OFFSET ?", (5, 10, 20)))
+		self.assertEqual(self.sql.select("users", equal = {"id": [1, 2, 3], "tier": 2}),
+			("SELECT * FROM users WHERE `id` IN (?, ?, ?, ?) AND `tier` = ? AND 1 = 1", (1, 2, 3, 3, 2)))
+		self.assertEqual(self.sql.select("users", equal = {"id": [4, 5, 6, 7]})[0], self.sql.select("users", equal = {"id": [1, 2, 3]})[0])
+		self.assertEqual(self.sql.select("users", order_by = "id", offset = 20), ("SELECT * FROM users WHERE 1 = 1 ORDER BY `id` ASC LIMIT -1 OFFSET ?", (20,)))
+
+	def test_aggregate(self):
+		'''Tests the aggregate SELECT SQL generation'''
+		self.assertEqual(self.sql.aggregate("orders", [("count", "*"), ("sum", "total")], group_by = "region", equal = {"paid": 1}),
+			("SELECT `region`, COUNT(*) AS `count`, SUM(`total`) AS `sum_total` FROM orders WHERE `paid` = ? AND 1 = 1 GROUP BY `region`", (1,)))
+		self.assertRaises(ValueError, self.sql.aggregate, "orders", [("median", "total")])
+		self.assertRaises(ValueError, self.sql.aggregate, "orders", [("sum", "*")])
+
+	def test_delete(self):
+		'''Tests the DELETE SQL generation'''
+		self.assertEqual(self.sql.delete("users", equal = {"id": 5}, where = "`tier` > 2"), ("DELETE FROM users WHERE `id` = ? AND `tier` > 2", (5,)))
+
+	def test_statementCache(self):
+		'''Tests the compiled statement cache'''
+		cache = wire.StatementCache(2)
+		compile = lambda name: name.upper()
+		self.assertEqual(cache.get("a", compile, "a"), "A")
+		self.assertEqual(cache.get("a", compile, "x"), "A")
+		cache.get("b", compile, "b")
+		cache.get("c", compile, "c")
+		self.assertEqual(cache.stats(), {"size": 2, "capacity": 2, "hits": 1, "misses": 3, "evictions": 1})
+		self.assertNotIn("a", cache.statements)
+
+	def test_statementCacheThreads(self):
+		'''Tests sharing the compiled statement cache between threads'''
+		cache, errors = wire.StatementCache(16), []
+		def compile(thread):
+			try:
+				for index in range(2000):
+					cache.get((thread, index % 40), lambda name: name, index)
+			except Exception as error:
+				errors.append(error)
+		threads = [threading.Thread(target = compile, args = (thread,)) for thread in range(8)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		self.assertEqual(errors, [])
+		self.assertEqual(cache.stats()["size"], 16)
+		self.assertEqual(len(list(cache.statements)), 16)
+
+	def test_normalize(self):
+		'''Tests grouping queries by their shape'''
+		self.assertEqual(self.sql.normalize("SELECT *  FROM users\nWHERE `id2` IN (?, ?) AND name = 'it''s' AND tier > 2.5"),
+			"SELECT * FROM users WHERE `id2` IN (...) AND name = ? AND tier > ?")
+
+	def test_affinity(self):
+		'''Tests the column type affinity rules'''
+		self.assertEqual(self.sql.affinity("BIGINT"), "INTEGER")
+		self.assertEqual(self.sql.affinity("VARCHAR(50)"), "TEXT")
+		self.assertEqual(self.sql.affinity(""), "BLOB")
+		self.assertEqual(self.sql.affinity("DOUBLE PRECISION"), "REAL")
+		self.assertEqual(self.sql.affinity("DECIMAL(10, 5)"), "NUMERIC")
+
 if __name__ == '__main__':
 	unittest.main()
\ No newline at end of file
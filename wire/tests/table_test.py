@@ -0,0 +1,229 @@
+import csv
+import itertools
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import wire
+from collections import OrderedDict
+
+class TestTable(unittest.TestCase):
+	def setUp(self):
+		'''Sets up the test case'''
+		self.db = wire.Database(":memory:")
+		self.table = self.db.createTable("users", id = "INT", username = "VARCHAR(50)")
+
+	def tearDown(self):
+		'''Closes the test database'''
+		self.db.close()
+
+	def test_schemaCache(self):
+		'''Tests that the schema cache is invalidated by schema changes'''
+		self.assertEqual(sorted(self.table.columns()), ["id", "username"])
+		self.assertTrue(self.db.tableExists("users"))
+		self.table.addColumns(tier = ["INT", 0])
+		self.assertEqual(sorted(self.table.columns()), ["id", "tier", "username"])
+		self.db.execute("CREATE TABLE groups (id INT)")
+		self.assertEqual(self.db.tables(), ["groups", "users"])
+		self.db.dropTable("groups")
+		self.assertFalse(self.db.tableExists("groups"))
+		self.assertRaises(ValueError, self.db.table, "groups")
+
+	def test_exportPartitioned(self):
+		'''Tests exporting a table to several files in parallel'''
+		directory = tempfile.mkdtemp()
+		try:
+			db = wire.Database(os.path.join(directory, "test.db"))
+			table = db.createTable("users", id = "INT", username = "VARCHAR(50)")
+			table.insertMany((index, "user") for index in range(1000))
+			stats = table.exportPartitioned(directory, partitions = 3)
+			self.assertEqual([partition["rows"] for partition in stats], [334, 334, 332])
+			ids = []
+			for partition in stats:
+				with open(partition["path"], 'rb') as csv_file:
+					ids.extend(int(row[0]) for row in list(csv.reader(csv_file))[1:])
+			self.assertEqual(ids, list(range(1000)))
+			db.close()
+		finally:
+			shutil.rmtree(directory)
+
+	def test_import(self):
+		'''Tests importing CSV and JSON lines files'''
+		self.db.execute("CREATE TABLE imports (id INT, username VARCHAR(50))")
+		table = self.db.table("imports")
+		directory = tempfile.mkdtemp()
+		try:
+			path = os.path.join(directory, "users.csv")
+			with open(path, 'wb') as csv_file:
+				csv_file.write("ID,Username,unknown\n" + "".join("{0},user{0},x\n".format(index) for index in range(250)) + ",empty,x\n")
+			stats = table.importCSV(path, chunk_size = 100)
+			self.assertEqual(stats["rows"], 251)
+			self.assertEqual(table.select(equal = {"id": 7}).fetch(), [{"id": 7, "username": "user7"}])
+			self.assertEqual(table.select(equal = {"username": "empty"}).fetch(), [{"id": None, "username": "empty"}])
+			path = os.path.join(directory, "users.jsonl")
+			with open(path, 'wb') as jsonl_file:
+				jsonl_file.write('{"id": "300", "username": "json"}\n{"id": 301}\n')
+			self.assertEqual(table.importJSONL(path)["rows"], 2)
+			self.assertEqual(table.select(where = "id >= 300").fetch(type = list), [(300, "json"), (301, None)])
+			self.assertEqual(self.db.pragma("synchronous").fetch(type = list)[0][0], 2)
+		finally:
+			shutil.rmtree(directory)
+
+	def test_scan(self):
+		'''Tests scanning a table with keyset pagination'''
+		self.table.insertMany(((index, "user" if index % 2 else "other") for index in range(25)), ["id", "username"])
+		scan = self.table.scan(10, order_by = "id", columns = ["username"], equal = {"username": "user"})
+		self.assertEqual([row["id"] for row in scan], list(range(1, 25, 2)))
+		self.assertEqual(scan.pages, 2)
+		scan = self.table.scan(4, type = list, columns = ["id", "username"])
+		rows = list(itertools.islice(scan, 5))
+		self.assertEqual(rows[-1], (4, "other", 5))
+		rows += list(self.table.scan(4, resume = scan.token, type = list, columns = ["id", "username"]))
+		self.assertEqual([row[0] for row in rows], list(range(25)))
+		self.assertEqual([row["id"] for row in self.table.scan(7, order_by = "-id", where = "id < 10")], list(range(9, -1, -1)))
+		self.assertRaises(ValueError, self.table.scan, resume = scan.token, order_by = "id")
+
+	def test_aggregate(self):
+		'''Tests counting and aggregating rows inside SQLite'''
+		self.table.insertMany(((index, "user" if index % 2 else "other") for index in range(10)), ["id", "username"])
+		self.assertEqual(self.table.count(), 10)
+		self.assertEqual(self.table.count(equal = {"id": [1, 2, 3]}, like = {"username": "us%"}), 2)
+		self.assertEqual(self.table.aggregate(sum = "id", max = "id", count = True), {"sum_id": 45, "max_id": 9, "count": 10})
+		groups = self.table.aggregate(avg = "id", min = "id", group_by = "username", order_by = "username").fetch()
+		self.assertEqual(groups, [{"username": "other", "avg_id": 4.0, "min_id": 0}, {"username": "user", "avg_id": 5.0, "min_id": 1}])
+		self.assertRaises(ValueError, self.table.aggregate)
+
+	def test_indexes(self):
+		'''Tests creating, listing and dropping indexes'''
+		name = self.table.createIndex("username", "-id", unique = True)
+		self.assertEqual(self.table.indexes(), [{"name": name, "unique": True, "origin": "c", "partial": 0, "columns": ["username", "id"]}])
+		self.table.dropIndex(name)
+		self.assertEqual(self.table.indexes(), [])
+		self.assertRaises(ValueError, self.table.createIndex)
+
+	def test_indexAdvisor(self):
+		'''Tests recommending indexes for observed filters'''
+		self.table.insertMany(((index, "user") for index in range(100)), ["id", "username"])
+		advisor = self.db.enableIndexAdvisor()
+		for index in range(3):
+			self.table.select(columns = ["username"], equal = {"id": index}).fetch()
+			self.table.update(where = "`id` > {index}".format(index = index), username = "other")
+		self.table.delete(equal = {"id": 1}, where = "1 = 1")
+		recommendations = advisor.recommend()
+		self.assertEqual([(index["columns"], index["calls"]) for index in recommendations], [(["id"], 4), (["id", "username"], 3)])
+		self.assertTrue(recommendations[0]["estimated_rows_saved"] > 0)
+		advisor.recommend(create = True)
+		self.assertEqual(len(self.table.indexes()), 2)
+		self.assertEqual(advisor.recommend(), [])
+		self.assertEqual(len(advisor.shapes), 3)
+		self.table.select(equal = {"username": list(range(1000))}).fetch()
+		self.assertEqual(max(len(shape["options"]["equal"].get("username") or ()) for shape in advisor.shapes.values()), 2)
+		self.db.setCommitPolicy("manual")
+		self.table.insert(id = 100, username = "user")
+		advisor.recommend()
+		self.db.rollback()
+		self.assertEqual(self.table.select(equal = {"id": 100}).fetch(), [])
+
+	def test_dropColumns(self):
+		'''Tests dropping and renaming columns, natively and by rebuilding the table'''
+		self.table.addColumns(tier = ["INT", 0], note = "TEXT")
+		self.table.insertMany(((index, "user", index % 3, "note") for index in range(10)), ["id", "username", "tier", "note"])
+		self.table.createIndex("tier")
+		self.table.dropColumns("note")
+		self.table.renameColumns(username = "name")
+		self.assertEqual(sorted(self.table.columns()), ["id", "name", "tier"])
+		self.assertRaises(ValueError, self.table.dropColumns, "tier") # indexed, so the index would be dropped with it
+		self.assertEqual(sorted(self.table.columns()), ["id", "name", "tier"])
+		self.assertEqual(len(self.table.indexes()), 1)
+		self.table.dropColumns("tier", drop_indexes = True) # the table is rebuilt
+		self.assertEqual(sorted(self.table.columns()), ["id", "name"])
+		self.assertEqual(self.table.indexes(), [])
+		self.assertEqual((self.table.rebuild_stats["rows"], len(self.table.rebuild_stats["dropped"])), (10, 1))
+		self.assertEqual(self.table.select(columns = ["id", "name"], equal = {"id": 3}).fetch("one", type = list), [(3, "user")])
+
+	def test_rebuild(self):
+		'''Tests that rebuilding a table keeps its keys, indexes and triggers, and the writes made while it is copied'''
+		self.db.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT NOT NULL DEFAULT 'none', tier INT, note TEXT)")
+		self.db.execute("CREATE TABLE log (id INT)")
+		table = self.db.table("items")
+		table.insertMany(((index, "item", index % 3, "note") for index in range(1, 101)), ["id", "name", "tier", "note"])
+		table.createIndex("tier", "name")
+		table.createIndex("note")
+		self.db.execute("CREATE TRIGGER items_log AFTER DELETE ON items BEGIN INSERT INTO log VALUES (OLD.id); END")
+		cursor = self.db.cursor()
+		def write(copied, total):
+			if copied == 30:
+				cursor.execute("INSERT INTO items (id, name, tier) VALUES (101, 'new', 0)")
+				cursor.execute("UPDATE items SET name = 'changed' WHERE id IN (10, 50)")
+				cursor.execute("DELETE FROM items WHERE id = 90")
+		progress = []
+		table.rebuild(OrderedDict([("id", "id"), ("name", "label"), ("tier", "tier")]), chunk_size = 30,
+			progress = lambda copied, total: progress.append((copied, total)) or write(copied, total))
+		self.assertEqual(progress, [(30, 100), (59, 100), (89, 100), (98, 100)])
+		self.assertEqual(table.columns(), ["id", "label", "tier"])
+		self.assertEqual(table.count(), 100)
+		self.assertEqual(table.select(columns = ["label"], equal = {"id": [10, 50, 101]}, order_by = "id").fetch(type = list),
+			[("changed",), ("changed",), ("new",)])
+		self.assertEqual([index["columns"] for index in table.indexes()], [["tier", "label"]])
+		self.assertEqual(self.db.select("log").fetch(type = list), [(90,)])
+		table.delete(equal = {"id": 1}, where = "1 = 1")
+		self.assertEqual(self.db.select("log").fetch(type = list), [(90,), (1,)])
+		self.assertRaises(sqlite3.IntegrityError, table.insert, id = 2, label = "duplicate")
+		self.assertEqual(self.db.select("sqlite_master", where = "`name` LIKE '%rebuild%'").fetch(), [])
+		self.assertEqual(table.rebuild_stats["chunks"], 4)
+
+	def test_rebuildSparse(self):
+		'''Tests that rebuilding a table copies the rows that exist, however far apart their rowids are'''
+		self.db.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+		table = self.db.table("items")
+		table.insertMany([(1, "first"), (10 ** 15, "last")], ["id", "name"])
+		table.rebuild(OrderedDict([("id", "id"), ("name", "label")]), chunk_size = 1)
+		self.assertEqual(table.select(columns = ["id", "label"], order_by = "id").fetch(type = list), [(1, "first"), (10 ** 15, "last")])
+		self.assertEqual((table.rebuild_stats["rows"], table.rebuild_stats["chunks"]), (2, 2))
+
+	def test_rebuildConstraints(self):
+		'''Tests that rebuilding a table keeps its constraints and the views on it'''
+		self.db.execute("CREATE TABLE parents (id INTEGER PRIMARY KEY)")
+		self.db.execute("""CREATE TABLE ev (id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT COLLATE NOCASE UNIQUE CHECK (kind != ''),
+			parent INT REFERENCES parents(id), note TEXT, CHECK (length(kind) < 10))""")
+		self.db.execute("CREATE VIEW ev_kinds AS SELECT DISTINCT kind FROM ev")
+		self.db.execute("INSERT INTO parents VALUES (1)")
+		table = self.db.table("ev")
+		table.insertMany([("a", 1), ("b", 1), ("c", 1)], ["kind", "parent"])
+		self.db.execute("DELETE FROM ev WHERE kind = 'c'")
+		table.rebuild(OrderedDict([("id", "id"), ("kind", "kind"), ("parent", "parent_id")]))
+		sql = self.db.select("sqlite_master", columns = ["sql"], equal = {"name": "ev"}).fetch("one", type = list)[0][0]
+		for clause in ("AUTOINCREMENT", "COLLATE NOCASE UNIQUE CHECK (kind != '')", "`parent_id` INT REFERENCES parents(id)", "CHECK (length(kind) < 10)"):
+			self.assertIn(clause, sql)
+		self.assertEqual(self.db.select("ev_kinds", order_by = "kind").fetch(type = list), [("a",), ("b",)])
+		self.assertRaises(sqlite3.IntegrityError, table.insert, kind = "")
+		self.assertRaises(sqlite3.IntegrityError, table.insert, kind = "A")
+		table.insert(kind = "d")
+		self.assertEqual(table.select(columns = ["id"], equal = {"kind": "d"}).fetch("one", type = list), [(4,)])
+		self.assertRaises(ValueError, table.rebuild, OrderedDict([("id", "id"), ("parent_id", "parent_id")]))
+		self.assertRaises(sqlite3.OperationalError, table.rebuild, OrderedDict([("id", "id"), ("kind", "label"), ("parent_id", "parent_id")]))
+		self.assertEqual(table.columns(), ["id", "kind", "parent_id"])
+		self.assertEqual(self.db.select("sqlite_master", where = "`name` LIKE '%rebuild%'").fetch(), [])
+
+	def test_rebuildReferences(self):
+		'''Tests that rebuilding a table matches column names case-insensitively and outside of string literals'''
+		self.db.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT, tier INT)")
+		self.db.execute("CREATE TABLE log (id INT, tier TEXT)")
+		self.db.execute("CREATE INDEX items_tier ON items (TIER)")
+		self.db.execute("CREATE INDEX items_name ON items (lower(Name)) WHERE name != 'tier'")
+		self.db.execute("CREATE TRIGGER items_log AFTER INSERT ON items BEGIN INSERT INTO log (id, tier) VALUES (NEW.id, 'tier'); END")
+		self.db.execute("CREATE TRIGGER items_tier AFTER UPDATE OF Tier ON items BEGIN INSERT INTO log VALUES (NEW.id, NEW.tier); END")
+		table = self.db.table("items")
+		table.rebuild(OrderedDict([("id", "id"), ("name", "label")]))
+		self.assertEqual([index["columns"] for index in table.indexes()], [[None]])
+		self.assertEqual(self.db.select("sqlite_master", columns = ["name"], equal = {"type": "trigger"}).fetch(type = list),
+			[("items_log",)])
+		table.insert(id = 1, label = "Item")
+		self.assertEqual(self.db.select("log").fetch(type = list), [(1, "tier")])
+		self.assertIn("lower(`label`)", self.db.select("sqlite_master", columns = ["sql"], equal = {"name": "items_name"}).fetch("one")[0]["sql"])
+		table.renameColumns(label = "title", chunk_size = 10)
+		self.assertEqual(table.columns(), ["id", "title"])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,74 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+import wire
+
+class TestWriteBehind(unittest.TestCase):
+	def setUp(self):
+		'''Sets up the test case'''
+		self.directory = tempfile.mkdtemp()
+		self.db = wire.Database(os.path.join(self.directory, "test.db"))
+		self.db.createTable("events", id = "INT", kind = "VARCHAR(50)")
+
+	def tearDown(self):
+		'''Closes and removes the test database'''
+		self.db.close()
+		shutil.rmtree(self.directory)
+
+	def test_coalescing(self):
+		'''Tests that writes from several threads are committed in batches'''
+		writer = self.db.writeBehind(batch_size = 100)
+		def work(offset):
+			for index in range(offset, offset + 100):
+				writer.insert("events", id = index, kind = "click")
+		threads = [threading.Thread(target = work, args = (offset,)) for offset in range(0, 400, 100)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		future = writer.update("events", equal = {"id": 5}, kind = "view")
+		writer.flush()
+		self.assertTrue(future.result())
+		self.assertEqual(len(self.db.select("events").fetch()), 400)
+		self.assertEqual(self.db.select("events", equal = {"id": 5}).fetch()[0]["kind"], "view")
+		stats = writer.stats()
+		self.assertEqual(stats["written"], 401)
+		self.assertLess(stats["batches"], 401)
+
+	def test_overflow(self):
+		'''Tests the overflow policies and failed writes'''
+		self.assertRaises(ValueError, wire.WriteBehind, self.db.path, overflow = "ignore")
+		writer = self.db.writeBehind()
+		self.assertRaises(Exception, writer.insert("missing", id = 1).result)
+		self.assertEqual(writer.stats()["failed"], 1)
+
+	def test_failedWrite(self):
+		'''Tests that a bad write in a batch does not fail the other writes'''
+		self.db.execute("CREATE UNIQUE INDEX events_id ON events (id)")
+		writer = wire.WriteBehind(self.db.path, interval = 1)
+		futures = [writer.insert("events", id = index % 5, kind = "click") for index in range(6)]
+		futures.append(writer.update("events", equal = {"id": 1}, kind = "view"))
+		writer.close()
+		self.assertEqual([future.exception() is None for future in futures], [True] * 5 + [False, True])
+		self.assertEqual(len(self.db.select("events").fetch()), 5)
+		self.assertEqual(self.db.select("events", equal = {"id": 1}).fetch()[0]["kind"], "view")
+		self.assertEqual((writer.stats()["written"], writer.stats()["failed"]), (6, 1))
+
+	def test_nestedFailure(self):
+		'''Tests that a failed batch inside another batch only undoes its own writes'''
+		self.db.execute("CREATE UNIQUE INDEX events_id ON events (id)")
+		writer = wire.WriteBehind(self.db.path)
+		writer.flush()
+		query = "INSERT INTO events (`id`, `kind`) VALUES (?, ?)"
+		with writer.db.batch():
+			writer.db.insert("events", id = 100, kind = "kept")
+			self.assertRaises(sqlite3.IntegrityError, writer.commitGroups, [[(None, query, (1, "click")), (None, query, (1, "click"))]])
+			writer.db.insert("events", id = 101, kind = "kept")
+		writer.close()
+		self.assertEqual(self.db.select("events", columns = ["id"], order_by = "id").fetch(type = list), [(100,), (101,)])
+
+if __name__ == '__main__':
+	unittest.main()
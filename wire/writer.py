@@ -0,0 +1,232 @@
+# Rushy Panchal
+# wire/writer.py
+# The WriteBehind class coalesces queued writes into batches on a background thread
+
+import itertools
+import threading
+import time
+
+try:
+	import Queue as queue
+except ImportError:
+	import queue
+
+from database import Database
+from sqlstring import SQLString
+from futures import Future
+
+OVERFLOW_POLICIES = ("block", "drop", "raise")
+
+class WriteBehind(object):
+	'''Background writer --- queued inserts and updates are grouped into executemany batches, each committed in one transaction'''
+	def __init__(self, path, max_queue = 10000, batch_size = 1000, interval = 0.01, overflow = "block", **kwargs):
+		'''Creates the WriteBehind object and starts its writer thread, which uses its own connection
+
+		Arguments:
+			path - path to database
+			max_queue - maximum number of queued writes (defaults to 10000)
+			batch_size - maximum number of writes per transaction (defaults to 1000)
+			interval - seconds to wait for more writes before committing a partial batch (defaults to 0.01)
+			overflow - what to do when the queue is full: "block" until there is room (the default),
+				"drop" the write, or "raise" Queue.Full
+			**kwargs - additional arguments for the Database
+
+		Usage:
+			writer = WriteBehind("test.db", overflow = "drop")
+
+		returns the WriteBehind object'''
+		if overflow not in OVERFLOW_POLICIES:
+			raise ValueError('Overflow policy must be one of {policies}'.format(policies = ', '.join(OVERFLOW_POLICIES)))
+		if path == ":memory:":
+			raise ValueError('WriteBehind needs a database file, since it writes through its own connection')
+		self.batch_size, self.interval, self.overflow = batch_size, interval, overflow
+		self.requests = queue.Queue(max_queue)
+		self.stats_lock = threading.Lock()
+		self.written, self.failed, self.dropped, self.batches = 0, 0, 0, 0
+		kwargs.setdefault("check_same_thread", False)
+		self.db = Database(path, **kwargs)
+		self.thread = threading.Thread(target = self.run)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def put(self, query, values):
+		'''Internal function --- queues a write according to the overflow policy
+
+		Arguments:
+			query - SQL query, consecutive writes with the same query are batched together
+			values - tuple of parameter values
+
+		Usage:
+			future = writer.put("INSERT INTO users (`id`) VALUES (?)", (1,))
+
+		returns a Future whose result is True once the write is committed (or False if it was dropped)'''
+		future = Future()
+		request = (future, query, values)
+		if self.overflow == "block":
+			self.requests.put(request)
+		else:
+			try:
+				self.requests.put_nowait(request)
+			except queue.Full:
+				if self.overflow == "raise":
+					raise
+				with self.stats_lock:
+					self.dropped += 1
+				future.set_result(False)
+		return future
+
+	def insert(self, table, **columns):
+		'''Queues an insert
+
+		see Database.insert for further reference
+
+		returns a Future whose result is True once the row is committed (or False if it was dropped)'''
+		return self.put(*SQLString.insert(table, **columns))
+
+	def update(self, table, equal = None, like = None, where = "1 = 1", **columns):
+		'''Queues an update
+
+		see Database.update for further reference
+
+		returns a Future whose result is True once the update is committed (or False if it was dropped)'''
+		return self.put(*SQLString.update(table, equal, like, where, **columns))
+
+	def run(self):
+		'''Internal function --- collects and writes the batches on the writer thread
+
+		Arguments:
+			None
+
+		Usage:
+			threading.Thread(target = writer.run).start()
+
+		returns None'''
+		stopping = False
+		while not stopping:
+			request = self.requests.get()
+			if request is None:
+				self.requests.task_done()
+				break
+			batch, deadline = [request], time.time() + self.interval
+			while len(batch) < self.batch_size:
+				remaining = deadline - time.time()
+				try:
+					request = self.requests.get(timeout = remaining) if remaining > 0 else self.requests.get_nowait()
+				except queue.Empty:
+					break
+				if request is None:
+					self.requests.task_done()
+					stopping = True
+					break
+				batch.append(request)
+			self.write(batch)
+			for request in batch:
+				self.requests.task_done()
+		self.db.close()
+
+	def write(self, batch):
+		'''Internal function --- writes a batch in one transaction, grouping consecutive writes of the same shape
+
+		If the transaction fails, each group is written again in a transaction of its own, and then each write of a group that
+		still fails, so that a bad write only fails its own future
+
+		Arguments:
+			batch - list of queued writes
+
+		Usage:
+			writer.write(batch)
+
+		returns None'''
+		groups = [list(group) for query, group in itertools.groupby(batch, lambda request: request[1])]
+		try:
+			self.commitGroups(groups)
+		except Exception as error:
+			if len(batch) == 1:
+				self.finish(batch, error)
+			elif len(groups) > 1:
+				for group in groups:
+					self.write(group)
+			else:
+				for request in batch:
+					self.write([request])
+			return
+		self.finish(batch)
+
+	def commitGroups(self, groups):
+		'''Internal function --- executes groups of writes of the same shape in one transaction, rolling it back if one fails
+
+		Arguments:
+			groups - list of lists of queued writes
+
+		Usage:
+			writer.commitGroups([batch])
+
+		returns None'''
+		cursor = self.db.cursor()
+		with self.db.atomicBatch(): # rolled back on its own, or to a savepoint inside another batch
+			for group in groups:
+				cursor.executemany(group[0][1], [request[2] for request in group])
+				self.db.autocommit()
+
+	def finish(self, batch, error = None):
+		'''Internal function --- records a committed (or failed) batch and resolves the futures of its writes
+
+		Arguments:
+			batch - list of queued writes
+			error - exception that failed the writes (defaults to None, for committed writes)
+
+		Usage:
+			writer.finish(batch)
+
+		returns None'''
+		with self.stats_lock:
+			if error is None:
+				self.written += len(batch)
+				self.batches += 1
+			else:
+				self.failed += len(batch)
+		for request in batch:
+			if error is None:
+				request[0].set_result(True)
+			else:
+				request[0].set_exception(error)
+
+	def flush(self):
+		'''Waits until every queued write is committed
+
+		Arguments:
+			None
+
+		Usage:
+			writer.flush()
+
+		returns None'''
+		self.requests.join()
+
+	def stats(self):
+		'''Reports the writer statistics
+
+		Arguments:
+			None
+
+		Usage:
+			stats = writer.stats()
+
+		returns a dictionary of the queued, written, failed and dropped writes, the batches, and the average batch size'''
+		with self.stats_lock:
+			return {"queued": self.requests.qsize(), "written": self.written, "failed": self.failed, "dropped": self.dropped,
+				"batches": self.batches, "average_batch": float(self.written) / self.batches if self.batches else 0.0}
+
+	def close(self):
+		'''Writes every queued write, then stops the writer thread and closes its connection
+
+		Arguments:
+			None
+
+		Usage:
+			writer.close()
+
+		returns None'''
+		if self.thread.is_alive():
+			self.requests.put(None)
+			self.thread.join()